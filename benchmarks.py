@@ -0,0 +1,259 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+import os
+import sys
+import csv
+import time
+import shutil
+import platform
+import tempfile
+import importlib.util
+import numpy as np
+sys.path.insert(0, '..\\primes\\')
+import primes
+import shapes
+import primality
+import pointstore
+import rendering
+
+#############################################################
+# Settings - configuration
+#############################################################
+
+# Every benchmark is run repeats times, the best time is reported
+repeats = 3
+
+# Steps of the walk over n=2k+1 (k=1,2,3...) - the same points in every run
+walk_steps = 100000
+
+# Numbers tested by primality providers
+#   o primality_range - numbers from 1 to this bound
+#   o primality_window - numbers of the window far from 1
+primality_range = 1000000
+primality_window = (10**12, 10**12 + 1000000)
+miller_rabin_numbers = 20000
+
+# Points of the walk used by update_points
+update_points_steps = 20000
+
+# Points in checkpoints and figures
+checkpoint_points = [10000, 100000, 1000000]
+figure_points = [10000, 100000]
+
+# Output file - one row per benchmark, rows of subsequent runs are appended
+#   o run, date, python, numpy - identify the run
+#   o benchmark, variant, size - what was measured
+#   o seconds - best time of all repeats
+#   o rate - size per second
+file_output_benchmarks = "results/benchmarks.csv"
+
+#############################################################
+# Measurements
+#############################################################
+
+results = []
+run_id = time.strftime("%Y%m%d%H%M%S")
+
+def measure (benchmark, variant, size, prepare, action):
+    best = None
+    for i in range (repeats):
+        argument = prepare ()
+        start = time.perf_counter()
+        action (argument)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    rate = size / best if best > 0 else 0
+    results.append([run_id, time.strftime("%Y-%m-%d %H:%M:%S"), platform.python_version(), np.__version__, benchmark, variant, size, "%.6f" % best, "%.1f" % rate])
+    print ("  *", benchmark, variant, size, ":", "%.4f" % best, "s", "(" + "%.0f" % rate + "/s)")
+
+def get_walk (steps):
+    s = shapes.Shape()
+    nums = 2 * np.arange(1, steps + 1, dtype=np.int64) + 1
+    (xs, ys, zs, turns, state) = s.next_iterations (primality.SegmentedSieve(), nums, (0, 0, 0, 1, 0, 1, 1, False, 0, 0, 0))
+    return (nums, xs, ys, zs, turns)
+
+def get_point_store (size, is_indexed):
+    (nums, xs, ys, zs, turns) = get_walk (size)
+    store = pointstore.PointStore(is_indexed)
+    store.extend (xs, ys, zs, turns.astype(np.uint8), np.zeros(size, dtype=np.int64))
+    return store
+
+# primes-figure.py is loaded as a module - its top level creates the results
+# directory, so it is loaded in a temporary working directory
+def load_figure_script ():
+    spec = importlib.util.spec_from_file_location("primes_figure", os.path.join(script_directory, "primes-figure.py"))
+    figure_script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(figure_script)
+    figure_script.render_worker = None
+    return figure_script
+
+def benchmark_walk ():
+    s = shapes.Shape()
+    p = primality.SegmentedSieve()
+    (nums, xs, ys, zs, turns) = get_walk (walk_steps)
+    p.get_window (0, int(nums[-1]) + 1)
+
+    def walk_step_by_step (argument):
+        (delta_x, delta_y, delta_z, sign, is_previous_prime, stats_primes, stats_nonprimes, stats_iterations) = (1, 0, 1, 1, False, 0, 0, 0)
+        for num in nums:
+            (delta_x, delta_y, delta_z, sign, is_previous_prime, turn, stats_primes, stats_nonprimes, stats_iterations) = s.next_iteration (p, int(num), is_previous_prime, delta_x, delta_y, delta_z, sign, stats_primes, stats_nonprimes, stats_iterations)
+
+    measure ("walk", "next_iteration", walk_steps, lambda: None, walk_step_by_step)
+    measure ("walk", "next_iterations", walk_steps, lambda: None, lambda argument: s.next_iterations (p, nums, (0, 0, 0, 1, 0, 1, 1, False, 0, 0, 0)))
+
+def benchmark_primality ():
+    nums = np.arange(1, primality_range + 1, dtype=np.int64)
+    (lo, hi) = primality_window
+    window = np.arange(lo, hi, dtype=np.int64)
+    sparse = lo + 7919 * np.arange(miller_rabin_numbers, dtype=np.int64) * 1000003
+    bitset_directory = tempfile.mkdtemp()
+    bitset_file = os.path.join(bitset_directory, "primes_bitset.bin")
+    primality.SegmentedSieve().write_bitset (bitset_file, primality_range + 1)
+
+    def is_prime_all (p, nums):
+        for num in nums:
+            p.is_prime (int(num))
+
+    measure ("primality", "sieve is_prime", primality_range, lambda: primality.SegmentedSieve(), lambda p: is_prime_all (p, nums))
+    measure ("primality", "sieve mask", primality_range, lambda: primality.SegmentedSieve(), lambda p: p.get_primality_mask (nums))
+    measure ("primality", "sieve mask far window", len(window), lambda: primality.SegmentedSieve(), lambda p: p.get_primality_mask (window))
+    measure ("primality", "sieve mask far sparse", len(sparse), lambda: primality.SegmentedSieve(), lambda p: p.get_primality_mask (sparse))
+    measure ("primality", "miller-rabin is_prime", len(sparse), lambda: primality.MillerRabin(), lambda p: is_prime_all (p, sparse))
+    measure ("primality", "bitset is_prime", primality_range, lambda: primality.PrimeBitset(bitset_file), lambda p: is_prime_all (p, nums))
+    measure ("primality", "bitset mask", primality_range, lambda: primality.PrimeBitset(bitset_file), lambda p: p.get_primality_mask (nums))
+    measure ("primality", "primes is_prime", primality_range // 100, lambda: primes.Primes(False), lambda p: is_prime_all (p, nums[:primality_range // 100]))
+    shutil.rmtree(bitset_directory, ignore_errors=True)
+
+def benchmark_update_points (figure_script):
+    (nums, xs, ys, zs, turns) = get_walk (update_points_steps)
+
+    def prepare (is_optimized, is_lifetime):
+        figure_script.enable_optimized_points_save = is_optimized
+        figure_script.enable_points_lifetime = is_lifetime
+        figure_script.points[0] = figure_script.new_point_store (1)
+        figure_script.shape_stats[0] = figure_script.shapestats.ShapeStats(figure_script.enable_visit_histogram)
+
+    def update_all (argument):
+        for i in range (update_points_steps):
+            figure_script.update_points (0, int(xs[i]), int(ys[i]), int(zs[i]), bool(turns[i]), figure_script.enable_optimized_points_save, figure_script.enable_points_lifetime)
+
+    for is_optimized in [False, True]:
+        for is_lifetime in [False, True]:
+            variant = "optimized=" + str(is_optimized) + ";lifetime=" + str(is_lifetime)
+            measure ("update_points", variant, update_points_steps, lambda: prepare (is_optimized, is_lifetime), update_all)
+    figure_script.enable_optimized_points_save = True
+    figure_script.enable_points_lifetime = False
+
+def benchmark_checkpoints (figure_script):
+    checkpoint_directory = tempfile.mkdtemp()
+
+    def prepare (size, is_incremental):
+        figure_script.enable_incremental_checkpoints = is_incremental
+        figure_script.checkpoint_logs.clear()
+        file_output = os.path.join(checkpoint_directory, "objs_shape_" + str(size) + "_" + str(is_incremental))
+        for extension in [figure_script.file_output_log_extension, figure_script.file_output_pickle_extension]:
+            if os.path.exists(file_output + extension):
+                os.remove(file_output + extension)
+        for tcid in range (len(figure_script.points)):
+            figure_script.points[tcid] = figure_script.new_point_store (tcid + 1)
+            figure_script.restore_shape_stats (tcid, ())
+        figure_script.points[0] = get_point_store (size, figure_script.enable_optimized_points_save)
+        return file_output
+
+    def prepare_saved (size, is_incremental):
+        file_output = prepare (size, is_incremental)
+        figure_script.save_current_results (file_output)
+        figure_script.checkpoint_logs.clear()
+        return file_output
+
+    for size in checkpoint_points:
+        for is_incremental in [False, True]:
+            variant = "incremental=" + str(is_incremental)
+            measure ("save_current_results", variant, size, lambda: prepare (size, is_incremental), figure_script.save_current_results)
+            measure ("restore_previous_results", variant, size, lambda: prepare_saved (size, is_incremental), figure_script.restore_previous_results)
+    figure_script.checkpoint_logs.clear()
+    shutil.rmtree(checkpoint_directory, ignore_errors=True)
+
+def benchmark_figures (figure_script):
+    figure_directory = tempfile.mkdtemp()
+
+    def prepare (size):
+        figure_script.points[0] = get_point_store (size, True)
+        figure_script.restore_shape_stats (0, ())
+        figure_script.figures = []
+
+    def write_figure (if_3d):
+        figure_script.write_results_to_figure (1, 0, "n=2k+1 (k=1,2,3...); n from 3 to ", os.path.join(figure_directory, "f_shape_1"), if_3d)
+        rendering.Rendering().write_figures (figure_script.figures)
+
+    for size in figure_points:
+        measure ("write_results_to_figure", "2d", size, lambda: prepare (size), lambda argument: write_figure (False))
+        measure ("write_results_to_figure", "3d", size, lambda: prepare (size), lambda argument: write_figure (True))
+    shutil.rmtree(figure_directory, ignore_errors=True)
+
+def write_results (file_output):
+    directory = os.path.dirname(file_output)
+    if directory != "" and not os.path.exists(directory):
+        os.makedirs(directory)
+    is_new = not os.path.exists(file_output)
+    with open(file_output, "a", newline="") as f:
+        writer = csv.writer(f)
+        if is_new:
+            writer.writerow(["run", "date", "python", "numpy", "benchmark", "variant", "size", "seconds", "rate"])
+        writer.writerows(results)
+
+#############################################################
+# Main
+#############################################################
+
+# usage: benchmarks.py [file]
+if len(sys.argv) > 1:
+    file_output_benchmarks = sys.argv[1]
+file_output_benchmarks = os.path.abspath(file_output_benchmarks)
+script_directory = os.path.dirname(os.path.abspath(__file__))
+
+work_directory = tempfile.mkdtemp()
+os.chdir(work_directory)
+print ("Loading primes-figure.py...")
+figure_script = load_figure_script ()
+print ("DONE")
+print ("Walk...")
+benchmark_walk ()
+print ("Primality tests...")
+benchmark_primality ()
+print ("Points...")
+benchmark_update_points (figure_script)
+print ("Checkpoints...")
+benchmark_checkpoints (figure_script)
+print ("Figures...")
+benchmark_figures (figure_script)
+os.chdir(script_directory)
+shutil.rmtree(work_directory, ignore_errors=True)
+
+write_results (file_output_benchmarks)
+print ("Results written to", file_output_benchmarks)
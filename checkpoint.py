@@ -0,0 +1,270 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+import os
+import struct
+import numpy as np
+import segments
+import pointstore
+
+# Checkpoint log is a sequence of records, each of them starts with a header:
+# type of record, case id and a number of items
+#   o 'P' - points added to the case since the previous checkpoint
+#   o 'C' - all points of the case are dropped (points were removed or
+#           changed, so they are written again in full)
+#   o 'G' - segments of a case kept in a SegmentStore, from the segment with
+#           the index stored first on - the last logged segment may have
+#           grown since, so it is written again and replaced on restore
+#   o 'R' - periodic tail of points of the case (PointStore.set_period):
+#           displacement and number of points of the tail, then the cycle;
+#           a later 'P' or 'C' record drops it
+#   o 'S' - walk state of all cases, it completes the checkpoint
+# Records after the last 'S' belong to an unfinished checkpoint and are ignored.
+record_header = struct.Struct('<cBq')
+point_dtypes = (('x', np.int32), ('y', np.int32), ('z', np.int32), ('colors', np.uint8), ('lifetime', np.int32))
+point_bytes = 17
+segment_dtypes = (('x', np.int32), ('y', np.int32), ('z', np.int32), ('dx', np.int32), ('dy', np.int32), ('dz', np.int32), ('length', np.int32), ('first_colors', np.uint8), ('colors', np.uint8))
+segment_bytes = 30
+period_dtypes = (('x', np.int32), ('y', np.int32), ('z', np.int32), ('colors', np.uint8))
+period_bytes = 13
+
+class CheckpointLog:
+
+    def __init__ (self, file_name):
+        self.file_name = file_name
+        # what this log already holds: stores, their sizes and versions
+        self.stores = {}
+        self.logged_sizes = {}
+        self.logged_versions = {}
+        self.logged_periods = {}
+        # committed records of points found while restoring:
+        # case id -> [(record type, offset, count, first segment)]
+        self.segments = {}
+        self.committed_size = 0
+        self.live_bytes = 0
+
+    def write_record (self, f, record_type, case, count, payload):
+        f.write(record_header.pack(record_type, case, count))
+        for data in payload:
+            f.write(np.ascontiguousarray(data).tobytes())
+
+    def write_points (self, f, case, store, start):
+        count = store.get_stored_size () - start
+        if count <= 0:
+            return
+        payload = []
+        for (name, dtype) in point_dtypes:
+            payload.append(store.get_column (name, start).astype(dtype))
+        self.write_record (f, b'P', case, count, payload)
+        self.live_bytes += count * point_bytes
+
+    # segments are logged one by one, not points
+    def write_segments (self, f, case, store, start):
+        count = store.get_segment_count () - start
+        if count <= 0:
+            return
+        payload = [np.array([start], dtype=np.int64)]
+        for (name, dtype) in segment_dtypes:
+            payload.append(store.get_segment_column (name, start).astype(dtype))
+        self.write_record (f, b'G', case, count, payload)
+        self.live_bytes += (store.get_segment_count () - self.logged_sizes.get(case, 0)) * segment_bytes
+
+    # periodic tail is written again whenever it changes - it is small
+    def write_period (self, f, case, store):
+        period = store.get_period ()
+        if period is None or period is self.logged_periods.get(case):
+            return
+        payload = [np.array(list(period['displacement']) + [period['count']], dtype=np.int64)]
+        for (name, dtype) in period_dtypes:
+            payload.append(period[name].astype(dtype))
+        self.write_record (f, b'R', case, len(period['x']), payload)
+
+    def get_logged_size (self, store):
+        if isinstance(store, segments.SegmentStore):
+            return store.get_segment_count ()
+        return store.get_stored_size ()
+
+    def get_logged_bytes (self, store, size):
+        if isinstance(store, segments.SegmentStore):
+            return size * segment_bytes
+        return size * point_bytes
+
+    # Saves a checkpoint - only points added since the previous checkpoint are
+    # written, unless points of a case were changed in any other way
+    #   o states - walk state of every case, tuples of integers of the same length
+    #   o stores - point store of every case
+    def save (self, k_current, states, stores):
+        # log grown far above its live data is written again from scratch
+        if self.committed_size > 2 * (self.live_bytes + 1024 * 1024):
+            self.compact (k_current, states, stores)
+            return
+
+        with open(self.file_name, 'r+b' if os.path.exists(self.file_name) else 'wb') as f:
+            f.truncate(self.committed_size)
+            f.seek(self.committed_size)
+            for case in range (len(stores)):
+                store = stores[case]
+                is_segments = isinstance(store, segments.SegmentStore)
+                if self.stores.get(case) is store and self.logged_versions[case] == store.version and self.logged_sizes[case] <= self.get_logged_size (store):
+                    if is_segments:
+                        self.write_segments (f, case, store, max(self.logged_sizes[case] - 1, 0))
+                    else:
+                        self.write_points (f, case, store, self.logged_sizes[case])
+                else:
+                    if case in self.stores:
+                        self.live_bytes -= self.get_logged_bytes (self.stores[case], self.logged_sizes[case])
+                        self.write_record (f, b'C', case, 0, [])
+                        del self.logged_sizes[case]
+                    if is_segments:
+                        self.write_segments (f, case, store, 0)
+                    else:
+                        self.write_points (f, case, store, 0)
+                    self.logged_periods.pop(case, None)
+                if not is_segments:
+                    # new points drop the logged tail
+                    if self.logged_sizes.get(case) != store.get_stored_size ():
+                        self.logged_periods.pop(case, None)
+                    self.write_period (f, case, store)
+                    self.logged_periods[case] = store.get_period ()
+                self.stores[case] = store
+                self.logged_sizes[case] = self.get_logged_size (store)
+                self.logged_versions[case] = store.version
+
+            fields = len(states[0])
+            self.write_record (f, b'S', 0, len(states), [np.array([k_current, fields] + [value for state in states for value in state], dtype=np.int64)])
+            f.flush()
+            os.fsync(f.fileno())
+            self.committed_size = f.tell()
+
+    def compact (self, k_current, states, stores):
+        file_name = self.file_name
+        self.__init__ (file_name + ".tmp")
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+        self.save (k_current, states, stores)
+        os.replace(self.file_name, file_name)
+        self.file_name = file_name
+
+    # Reads the log and returns (k_current, states) of the last complete
+    # checkpoint or None, points are read separately by read_points
+    def restore (self):
+        if not os.path.exists(self.file_name):
+            return None
+        result = None
+        records = {}
+        with open(self.file_name, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            while True:
+                header = f.read(record_header.size)
+                if len(header) < record_header.size:
+                    break
+                (record_type, case, count) = record_header.unpack(header)
+                if record_type == b'P':
+                    if f.tell() + count * point_bytes > file_size:
+                        break
+                    records.setdefault(case, []).append((record_type, f.tell(), count, None))
+                    f.seek(count * point_bytes, os.SEEK_CUR)
+                elif record_type == b'G':
+                    if f.tell() + 8 + count * segment_bytes > file_size:
+                        break
+                    first = int(np.fromfile(f, dtype=np.int64, count=1)[0])
+                    records.setdefault(case, []).append((record_type, f.tell(), count, first))
+                    f.seek(count * segment_bytes, os.SEEK_CUR)
+                elif record_type == b'R':
+                    if f.tell() + 32 + count * period_bytes > file_size:
+                        break
+                    records.setdefault(case, []).append((record_type, f.tell(), count, None))
+                    f.seek(32 + count * period_bytes, os.SEEK_CUR)
+                elif record_type == b'C':
+                    records[case] = []
+                elif record_type == b'S':
+                    values = np.fromfile(f, dtype=np.int64, count=2)
+                    if len(values) < 2:
+                        break
+                    (k_current, fields) = (int(values[0]), int(values[1]))
+                    values = np.fromfile(f, dtype=np.int64, count=count * fields)
+                    if len(values) < count * fields:
+                        break
+                    states = []
+                    for i in range (count):
+                        states.append(tuple(int(value) for value in values[i*fields:(i+1)*fields]))
+                    result = (k_current, states)
+                    self.segments = {}
+                    for record_case in records:
+                        self.segments[record_case] = list(records[record_case])
+                    self.committed_size = f.tell()
+                else:
+                    break
+        return result
+
+    # Adds all points of the case from the last complete checkpoint to the
+    # store - logged segments are expanded to points if the store is not
+    # a SegmentStore
+    def read_points (self, case, store):
+        records = self.segments.get(case, [])
+        target = store
+        if not isinstance(store, segments.SegmentStore) and any(record_type == b'G' for (record_type, offset, count, first) in records):
+            target = segments.SegmentStore()
+        period = None
+        with open(self.file_name, 'rb') as f:
+            for (record_type, offset, count, first) in records:
+                f.seek(offset)
+                columns = {}
+                if record_type == b'R':
+                    values = np.fromfile(f, dtype=np.int64, count=4)
+                    for (name, dtype) in period_dtypes:
+                        columns[name] = np.fromfile(f, dtype=dtype, count=count)
+                    period = (columns, values[:3].tolist(), int(values[3]))
+                    continue
+                period = None
+                if record_type == b'G':
+                    for (name, dtype) in segment_dtypes:
+                        columns[name] = np.fromfile(f, dtype=dtype, count=count)
+                    target.set_segments (first, columns)
+                else:
+                    for (name, dtype) in point_dtypes:
+                        columns[name] = np.fromfile(f, dtype=dtype, count=count)
+                    target.extend (columns['x'], columns['y'], columns['z'], columns['colors'], columns['lifetime'])
+        if target is not store:
+            (x, y, z, colors) = target.expand ()
+            store.extend (x, y, z, colors, np.zeros(len(x), dtype=np.int32))
+        self.logged_periods.pop(case, None)
+        if period is not None:
+            (columns, displacement, count) = period
+            if isinstance(store, segments.SegmentStore):
+                # segments have no periodic tail - its points are added
+                columns['displacement'] = displacement
+                columns['count'] = count
+                (x, y, z, colors) = pointstore.get_period_points (columns, 0, count)
+                store.extend (x, y, z, colors, np.zeros(count, dtype=np.int32))
+            else:
+                store.set_period (columns['x'], columns['y'], columns['z'], columns['colors'], displacement, count)
+                self.logged_periods[case] = store.get_period ()
+        self.stores[case] = store
+        self.logged_sizes[case] = self.get_logged_size (store)
+        self.logged_versions[case] = store.version
+        self.live_bytes += self.get_logged_bytes (store, self.logged_sizes[case])
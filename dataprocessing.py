@@ -25,6 +25,7 @@
 # 
 
 import sys
+import numpy as np
 
 class DataProcessing:
 
@@ -41,3 +42,17 @@ class DataProcessing:
             return 1
         else:
             return 2
+
+    # get_sum_of_decimal_digits of every number of the array
+    def get_sums_of_decimal_digits (self, nums):
+        base = 10
+        nums = np.abs(np.asarray(nums, dtype=np.int64))
+        sums_of_digits = np.zeros(len(nums), dtype=np.int64)
+        while nums.any():
+            sums_of_digits += nums % base
+            nums //= base
+        return sums_of_digits
+
+    # get_next_num_from_set of every number of the array
+    def get_next_nums_from_set (self, nums):
+        return np.where(np.asarray(nums) == 2, 1, 2)
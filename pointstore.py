@@ -0,0 +1,485 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+import os
+import numpy as np
+
+point_columns = ('x', 'y', 'z', 'colors', 'lifetime')
+index_columns = ('keys', 'keys_z', 'keys_slot')
+
+# Estimated memory used by a single resident point: its columns and,
+# if points are indexed, entry of the index
+point_bytes = 17
+index_entry_bytes = 150
+
+# Periodic tail is made in chunks of so many points when it is read
+period_chunk = 1 << 20
+
+# x and y packed into a single key of spilled points
+def get_key (x, y):
+    return (x << 32) | (y & 0xffffffff)
+
+# Points first to last (excluding) of the periodic tail: point t is point
+# t % n of the cycle of n points moved t // n times by the displacement
+def get_period_points (period, first, last):
+    t = np.arange(first, last, dtype=np.int64)
+    n = len(period['x'])
+    (cycle, shift) = (t % n, t // n)
+    (dx, dy, dz) = period['displacement']
+    x = period['x'][cycle] + shift * dx
+    y = period['y'][cycle] + shift * dy
+    z = period['z'][cycle] + shift * dz
+    return (x.astype(np.int32), y.astype(np.int32), z.astype(np.int32), period['colors'][cycle])
+
+# (min_x, max_x, min_y, max_y, min_z, max_z) of the periodic tail - its
+# extremes are in the first, the last full and the partial last cycle
+def get_period_bounds (period):
+    n = len(period['x'])
+    (repeats, rest) = divmod(period['count'], n)
+    parts = []
+    if repeats > 0:
+        parts += [get_period_points (period, 0, n), get_period_points (period, (repeats - 1) * n, repeats * n)]
+    if rest > 0:
+        parts.append(get_period_points (period, repeats * n, period['count']))
+    bounds = []
+    for i in range (3):
+        column = np.concatenate([part[i] for part in parts])
+        bounds += [int(column.min()), int(column.max())]
+    return tuple(bounds)
+
+# Stored points followed by the periodic tail, the tail is made chunk by
+# chunk every time blocks are iterated
+class PeriodBlocks:
+
+    def __init__ (self, blocks, period):
+        self.blocks = blocks
+        self.period = period
+
+    def __iter__ (self):
+        for block in self.blocks:
+            yield block
+        for first in range (0, self.period['count'], period_chunk):
+            yield get_period_points (self.period, first, min(first + period_chunk, self.period['count']))
+
+class PointStore:
+
+    def __init__ (self, is_indexed = True, capacity = 1024, spill_directory = None, memory_budget = 0):
+        self.size = 0
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.z = np.zeros(capacity, dtype=np.int32)
+        self.colors = np.zeros(capacity, dtype=np.uint8)
+        self.lifetime = np.zeros(capacity, dtype=np.int32)
+        # (x, y, z) -> slot of the point, used to find duplicates
+        self.is_indexed = is_indexed
+        self.index = {}
+        # older points above the memory budget are moved to memory-mapped
+        # blocks - they take slots before all resident points
+        self.spill_directory = spill_directory
+        self.memory_budget = memory_budget
+        self.blocks = []
+        self.spilled_size = 0
+        # changes of already stored points (not appending) bump the version
+        self.version = 0
+        # lifetime column holds the deadline of every point - the point expires
+        # when the clock (number of expire_lifetime calls) reaches it, points
+        # with lifetime 0 never expire
+        #   o expiring - deadline -> slots of points which may expire then,
+        #     entries of renewed or moved points are checked when due
+        self.clock = 0
+        self.expiring = {}
+        # points can end with a periodic tail of points which are not stored,
+        # see set_period; any change of points stores the tail first
+        self.period = None
+
+    def __len__ (self):
+        return self.spilled_size + self.size + self.get_period_size ()
+
+    # number of points without the periodic tail
+    def get_stored_size (self):
+        return self.spilled_size + self.size
+
+    # only the used part of the columns is pickled, index is rebuilt on load,
+    # spilled blocks are referred to by their files
+    def __getstate__ (self):
+        state = {'is_indexed': self.is_indexed, 'spill_directory': self.spill_directory, 'memory_budget': self.memory_budget}
+        for name in point_columns:
+            state[name] = self.get_column (name, self.spilled_size)
+        state['blocks'] = []
+        for block in self.blocks:
+            state['blocks'].append((block['file_name'], block['start'], block['size'], block['bounds']))
+        state['period'] = self.period
+        return state
+
+    def __setstate__ (self, state):
+        self.__init__ (state['is_indexed'], max(len(state['x']), 1), state.get('spill_directory'), state.get('memory_budget', 0))
+        for (file_name, start, size, bounds) in state.get('blocks', []):
+            self.blocks.append(self.open_block (file_name, start, size, bounds))
+            self.spilled_size += size
+        self.extend (state['x'], state['y'], state['z'], state['colors'], state['lifetime'])
+        self.period = state.get('period')
+
+    # column of stored points from the given slot on - lifetime column holds
+    # the remaining lifetime of points
+    def get_column (self, name, start = 0):
+        resident = getattr(self, name)[max(start - self.spilled_size, 0):self.size]
+        if name == 'lifetime' and self.clock > 0:
+            resident = np.where(resident > 0, resident - self.clock, resident)
+        if start >= self.spilled_size:
+            return resident
+        # spilled points are read from disk
+        parts = []
+        for block in self.blocks:
+            if block['start'] + block['size'] > start:
+                parts.append(block[name][max(start - block['start'], 0):])
+        return np.concatenate(parts + [resident])
+
+    def get_x (self):
+        return self.add_period_column (self.get_column ('x'), 0)
+
+    def get_y (self):
+        return self.add_period_column (self.get_column ('y'), 1)
+
+    def get_z (self):
+        return self.add_period_column (self.get_column ('z'), 2)
+
+    def get_colors (self):
+        return self.add_period_column (self.get_column ('colors'), 3)
+
+    # points of the periodic tail never expire
+    def get_lifetime (self):
+        return np.concatenate([self.get_column ('lifetime'), np.zeros(self.get_period_size (), dtype=np.int32)])
+
+    def add_period_column (self, column, i):
+        if self.period is None:
+            return column
+        return np.concatenate([column, get_period_points (self.period, 0, self.period['count'])[i]])
+
+    # (x, y, z, colors) of every spilled block and of resident points - all
+    # points without reading them into memory at once
+    #   o is_including_period - blocks of the periodic tail follow
+    def get_blocks (self, is_including_period = True):
+        blocks = []
+        for block in self.blocks:
+            blocks.append((block['x'], block['y'], block['z'], block['colors']))
+        blocks.append((self.x[:self.size], self.y[:self.size], self.z[:self.size], self.colors[:self.size]))
+        if is_including_period and self.period is not None:
+            return PeriodBlocks(blocks, self.period)
+        return blocks
+
+    # Copy of points which is not changed by later changes of the store:
+    # resident points are copied, spilled blocks are shared as their points
+    # never change
+    def get_snapshot (self):
+        snapshot = PointStore(False, max(self.size, 1))
+        snapshot.blocks = list(self.blocks)
+        snapshot.spilled_size = self.spilled_size
+        snapshot.extend (self.x[:self.size], self.y[:self.size], self.z[:self.size], self.colors[:self.size], self.get_column ('lifetime', self.spilled_size))
+        snapshot.period = self.period
+        return snapshot
+
+    # (min_x, max_x, min_y, max_y, min_z, max_z) of all points
+    def get_bounds (self):
+        bounds = []
+        for block in self.blocks:
+            bounds.append(block['bounds'])
+        if self.size > 0:
+            bounds.append(self.get_resident_bounds ())
+        if self.period is not None:
+            bounds.append(get_period_bounds (self.period))
+        if not bounds:
+            return None
+        return (min(b[0] for b in bounds), max(b[1] for b in bounds), min(b[2] for b in bounds),
+                max(b[3] for b in bounds), min(b[4] for b in bounds), max(b[5] for b in bounds))
+
+    def get_resident_bounds (self):
+        x = self.x[:self.size]
+        y = self.y[:self.size]
+        z = self.z[:self.size]
+        return (int(x.min()), int(x.max()), int(y.min()), int(y.max()), int(z.min()), int(z.max()))
+
+    def reserve (self, capacity):
+        if capacity <= len(self.x):
+            return
+        # amortized doubling
+        capacity = max(capacity, 2 * len(self.x))
+        for name in point_columns:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    # Points of the store are followed by a tail of count points made of the
+    # cycle (x, y, z, colors) - point t of the tail is point t % n of the
+    # cycle of n points moved t // n times by the displacement (dx, dy, dz).
+    # A period continuing the current one only makes the tail longer.
+    def set_period (self, x, y, z, colors, displacement, count):
+        period = {'x': np.asarray(x, dtype=np.int32), 'y': np.asarray(y, dtype=np.int32), 'z': np.asarray(z, dtype=np.int32), 'colors': np.asarray(colors, dtype=np.uint8),
+                  'displacement': tuple(int(d) for d in displacement), 'count': int(count)}
+        if self.period is not None:
+            if self.is_period_continued (period):
+                period = dict(self.period)
+                period['count'] += int(count)
+                self.period = period
+                return
+            self.expand_period ()
+        if period['count'] > 0:
+            self.period = period
+
+    def get_period (self):
+        return self.period
+
+    def get_period_size (self):
+        if self.period is None:
+            return 0
+        return self.period['count']
+
+    def is_period_continued (self, period):
+        n = len(self.period['x'])
+        if len(period['x']) != n or period['displacement'] != self.period['displacement']:
+            return False
+        following = get_period_points (self.period, self.period['count'], self.period['count'] + n)
+        for (name, column) in zip(('x', 'y', 'z', 'colors'), following):
+            if not np.array_equal(period[name], column):
+                return False
+        return True
+
+    # Points of the periodic tail are stored like all other points
+    def expand_period (self):
+        period = self.period
+        if period is None:
+            return
+        self.period = None
+        for first in range (0, period['count'], period_chunk):
+            (x, y, z, colors) = get_period_points (period, first, min(first + period_chunk, period['count']))
+            self.extend (x, y, z, colors, np.zeros(len(x), dtype=np.int32))
+
+    def append (self, x, y, z, color, lifetime):
+        if self.period is not None:
+            self.expand_period ()
+        if self.size == len(self.x):
+            self.reserve (self.size + 1)
+        slot = self.size
+        self.x[slot] = x
+        self.y[slot] = y
+        self.z[slot] = z
+        self.colors[slot] = color
+        self.size += 1
+        self.set_deadline (self.spilled_size + slot, lifetime)
+        if self.is_indexed:
+            self.index.setdefault((x, y, z), self.spilled_size + slot)
+        self.check_memory_budget ()
+        return self.spilled_size + slot
+
+    def extend (self, xs, ys, zs, colors, lifetimes):
+        if self.period is not None:
+            self.expand_period ()
+        n = len(xs)
+        self.reserve (self.size + n)
+        start = self.size
+        self.x[start:start + n] = xs
+        self.y[start:start + n] = ys
+        self.z[start:start + n] = zs
+        self.colors[start:start + n] = colors
+        self.size += n
+        self.lifetime[start:start + n] = lifetimes
+        if self.clock > 0 or np.any(self.lifetime[start:start + n] > 0):
+            for (slot, lifetime) in enumerate(self.lifetime[start:start + n].tolist(), self.spilled_size + start):
+                self.set_deadline (slot, lifetime)
+        if self.is_indexed:
+            self.add_to_index (start)
+        self.check_memory_budget ()
+
+    def set_indexed (self, is_indexed):
+        self.is_indexed = is_indexed
+        self.index = {}
+        if is_indexed:
+            self.add_to_index (0)
+
+    def set_spilling (self, spill_directory, memory_budget):
+        self.spill_directory = spill_directory
+        self.memory_budget = memory_budget
+        self.check_memory_budget ()
+
+    # slot of the point or -1 if it is not stored
+    def find (self, x, y, z):
+        if self.period is not None:
+            self.expand_period ()
+        for block in self.blocks:
+            slot = self.find_in_block (block, x, y, z)
+            if slot >= 0:
+                return slot
+        return self.index.get((x, y, z), -1)
+
+    def find_in_block (self, block, x, y, z):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = block['bounds']
+        if x < min_x or x > max_x or y < min_y or y > max_y or z < min_z or z > max_z:
+            return -1
+        # keys are sorted by packed (x, y) and then by z
+        keys = block['keys']
+        key = get_key (x, y)
+        lo = int(np.searchsorted(keys, key, 'left'))
+        hi = int(np.searchsorted(keys, key, 'right'))
+        if lo == hi:
+            return -1
+        i = lo + int(np.searchsorted(block['keys_z'][lo:hi], z, 'left'))
+        if i < hi and block['keys_z'][i] == z:
+            return block['start'] + int(block['keys_slot'][i])
+        return -1
+
+    def set_lifetime (self, slot, lifetime):
+        if self.period is not None:
+            self.expand_period ()
+        self.version += 1
+        if slot >= self.spilled_size:
+            self.set_deadline (slot, lifetime)
+            return
+        for block in self.blocks:
+            if slot < block['start'] + block['size']:
+                block['lifetime'][slot - block['start']] = lifetime
+                return
+
+    def remove (self, slots):
+        if len(slots) == 0:
+            return
+        if self.period is not None:
+            self.expand_period ()
+        slots = np.asarray(slots, dtype=np.int64)
+        self.version += 1
+        if slots.min() < self.spilled_size:
+            raise ValueError("Spilled points cannot be removed")
+        is_kept = np.ones(self.size, dtype=bool)
+        is_kept[slots - self.spilled_size] = False
+        kept = int(np.count_nonzero(is_kept))
+        for name in point_columns:
+            column = getattr(self, name)
+            column[:kept] = column[:self.size][is_kept]
+        self.size = kept
+        # slots have shifted - index and deadlines have to be rebuilt
+        if self.is_indexed:
+            self.index = {}
+            self.add_to_index (0)
+        self.expiring = {}
+        for (slot, deadline) in enumerate(self.lifetime[:self.size].tolist(), self.spilled_size):
+            self.add_expiring (slot, deadline)
+
+    # Removes points by moving the last resident point to every freed slot,
+    # other points keep their slots
+    def swap_remove (self, slots):
+        self.version += 1
+        for slot in sorted(slots, reverse=True):
+            hole = slot - self.spilled_size
+            last = self.size - 1
+            point = (int(self.x[hole]), int(self.y[hole]), int(self.z[hole]))
+            if self.is_indexed and self.index.get(point) == slot:
+                del self.index[point]
+            if hole != last:
+                for name in point_columns:
+                    column = getattr(self, name)
+                    column[hole] = column[last]
+                moved = (int(self.x[hole]), int(self.y[hole]), int(self.z[hole]))
+                if self.is_indexed and self.index.get(moved) == self.spilled_size + last:
+                    self.index[moved] = slot
+                self.add_expiring (slot, int(self.lifetime[hole]))
+            self.size -= 1
+
+    # Resident point gets the given lifetime - it expires after so many
+    # calls of expire_lifetime
+    def set_deadline (self, slot, lifetime):
+        deadline = self.clock + lifetime if lifetime > 0 else 0
+        self.lifetime[slot - self.spilled_size] = deadline
+        self.add_expiring (slot, deadline)
+
+    def add_expiring (self, slot, deadline):
+        if deadline > self.clock:
+            self.expiring.setdefault(deadline, []).append(slot)
+
+    # Lifetime of every point goes down by one, points with expired lifetime
+    # are removed - only points due now are touched, so it takes amortized
+    # O(1) per renewed or added point
+    def expire_lifetime (self):
+        if self.period is not None:
+            self.expand_period ()
+        self.clock += 1
+        # remaining lifetime of all points has changed
+        self.version += 1
+        slots = self.expiring.pop(self.clock, None)
+        if slots is None:
+            return
+        expired = set()
+        for slot in slots:
+            hole = slot - self.spilled_size
+            # entries of points renewed or moved since are skipped
+            if 0 <= hole < self.size and self.lifetime[hole] == self.clock:
+                expired.add(slot)
+        self.swap_remove (expired)
+
+    def add_to_index (self, start):
+        # the first occurrence of a point wins, as in a linear scan
+        points = zip(self.x[start:self.size].tolist(), self.y[start:self.size].tolist(), self.z[start:self.size].tolist())
+        slot = self.spilled_size + start
+        for point in points:
+            self.index.setdefault(point, slot)
+            slot += 1
+
+    def get_resident_bytes (self):
+        if self.is_indexed:
+            return self.size * (point_bytes + index_entry_bytes)
+        return self.size * point_bytes
+
+    def check_memory_budget (self):
+        if self.memory_budget > 0 and self.spill_directory is not None and self.get_resident_bytes () > self.memory_budget:
+            self.spill ()
+
+    # Move all resident points to a new memory-mapped block
+    def spill (self):
+        if self.size == 0:
+            return
+        if not os.path.exists(self.spill_directory):
+            os.makedirs(self.spill_directory)
+        file_name = os.path.join(self.spill_directory, "block_" + str(len(self.blocks)))
+        x = self.x[:self.size]
+        y = self.y[:self.size]
+        z = self.z[:self.size]
+        keys = get_key (x.astype(np.int64), y.astype(np.int64))
+        order = np.lexsort((z, keys))
+        columns = {'keys': keys[order], 'keys_z': z[order], 'keys_slot': order.astype(np.int32)}
+        for name in point_columns:
+            columns[name] = getattr(self, name)[:self.size]
+        for name in point_columns + index_columns:
+            np.save(file_name + "_" + name + ".npy", columns[name])
+
+        self.blocks.append(self.open_block (file_name, self.spilled_size, self.size, self.get_resident_bounds ()))
+        self.spilled_size += self.size
+        self.size = 0
+        self.index = {}
+
+    def open_block (self, file_name, start, size, bounds):
+        block = {'file_name': file_name, 'start': start, 'size': size, 'bounds': bounds}
+        for name in point_columns + index_columns:
+            block[name] = np.load(file_name + "_" + name + ".npy", mmap_mode='r+')
+        return block
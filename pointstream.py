@@ -0,0 +1,311 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+import os
+import json
+import struct
+import numpy as np
+import pointstore
+import segments
+
+# Point stream holds all points of a case together with the figures drawn
+# from them, so the figures can be drawn later (see primes-render.py). Like
+# the checkpoint log (see checkpoint.py) it is a sequence of records after
+# the header (magic and version), every record starts with its type and a
+# number of items:
+#   o 'P' - points added to the case since the previous checkpoint: columns
+#           x, y, z (int32) and colors (uint8)
+#   o 'C' - all points are dropped (points were removed or changed, so they
+#           are written again in full)
+#   o 'R' - periodic tail of points (PointStore.set_period): displacement
+#           and number of points of the tail, then the cycle; a later 'P'
+#           or 'C' record drops it
+#   o 'F' - JSON description of figures drawn at the checkpoint, it
+#           completes the checkpoint: figures [method, fig_id, title, file
+#           name, args] as in Rendering.write_figures (file names are
+#           relative to the directory of the stream), numbers of points of
+#           blocks given by get_blocks of the store and bounds of points
+# Records after the last 'F' belong to an unfinished checkpoint and are ignored.
+stream_header = struct.Struct('<4sI')
+stream_magic = b'PSTM'
+stream_version = 2
+record_header = struct.Struct('<cq')
+point_dtypes = (('x', np.int32), ('y', np.int32), ('z', np.int32), ('colors', np.uint8))
+point_bytes = 13
+
+# Blocks of points of a stream read one by one every time they are iterated -
+# blocks are as they were given by the store, so figures drawn block by
+# block are the same as figures of the original store
+class StreamBlocks:
+
+    # o pieces - (offset, count) of 'P' records of points
+    # o sizes - number of points of every block
+    def __init__ (self, file_name, pieces, sizes):
+        self.file_name = file_name
+        self.pieces = pieces
+        self.sizes = sizes
+
+    def get_columns (self, offset, count):
+        columns = []
+        for (name, dtype) in point_dtypes:
+            columns.append(np.memmap(self.file_name, dtype=dtype, mode='r', offset=offset, shape=(count,)) if count > 0 else np.zeros(0, dtype=dtype))
+            offset += count * np.dtype(dtype).itemsize
+        return columns
+
+    def __iter__ (self):
+        pieces = iter(self.pieces)
+        (columns, used) = ([np.zeros(0, dtype=dtype) for (name, dtype) in point_dtypes], 0)
+        for size in self.sizes:
+            parts = []
+            while size > 0:
+                if used == len(columns[0]):
+                    (offset, count) = next(pieces)
+                    (columns, used) = (self.get_columns (offset, count), 0)
+                taken = min(size, len(columns[0]) - used)
+                parts.append([column[used:used + taken] for column in columns])
+                (used, size) = (used + taken, size - taken)
+            if len(parts) == 0:
+                yield tuple(np.zeros(0, dtype=dtype) for (name, dtype) in point_dtypes)
+            elif len(parts) == 1:
+                yield tuple(parts[0])
+            else:
+                yield tuple(np.concatenate([part[i] for part in parts]) for i in range (len(point_dtypes)))
+
+# Points of the last complete checkpoint of a stream
+class StreamPoints:
+
+    def __init__ (self, blocks, period, bounds):
+        self.blocks = blocks
+        self.period = period
+        self.bounds = bounds
+
+    def __len__ (self):
+        size = sum(self.blocks.sizes)
+        if self.period is not None:
+            size += self.period['count']
+        return size
+
+    def get_blocks (self):
+        if self.period is not None:
+            return pointstore.PeriodBlocks(self.blocks, self.period)
+        return self.blocks
+
+    def get_bounds (self):
+        return self.bounds
+
+class PointStream:
+
+    # o is_keeping_checkpoints - figures of every checkpoint are kept (they
+    #   are saved under different names), otherwise only figures of the last
+    #   checkpoint are, so the stream is written again from scratch when
+    #   written for the first time by the process or when dropped points
+    #   take most of it
+    def __init__ (self, file_name, is_keeping_checkpoints = False):
+        self.file_name = file_name
+        self.is_keeping_checkpoints = is_keeping_checkpoints
+        # what this stream already holds: the store, its size and version
+        self.store = None
+        self.logged_size = 0
+        self.logged_version = None
+        self.logged_period = None
+        # None until the stream is written by this process
+        self.committed_size = None
+        self.live_bytes = 0
+
+    def write_record (self, f, record_type, count, payload):
+        f.write(record_header.pack(record_type, count))
+        for data in payload:
+            f.write(np.ascontiguousarray(data).tobytes())
+
+    def write_points (self, f, x, y, z, colors):
+        if len(x) == 0:
+            return
+        payload = []
+        for (column, (name, dtype)) in zip((x, y, z, colors), point_dtypes):
+            payload.append(np.asarray(column).astype(dtype))
+        self.write_record (f, b'P', len(x), payload)
+        self.live_bytes += len(x) * point_bytes
+
+    def get_logged_size (self, store):
+        if isinstance(store, segments.SegmentStore):
+            return len(store)
+        return store.get_stored_size ()
+
+    # Points of the store from the given one on - points of segments are
+    # never changed, but the last logged segment may have grown since
+    def write_points_from (self, f, store, start):
+        if isinstance(store, segments.SegmentStore):
+            ends = np.cumsum(store.get_segment_column ('length').astype(np.int64))
+            first = int(np.searchsorted(ends, start, 'right'))
+            skipped = start - (int(ends[first - 1]) if first > 0 else 0)
+            (x, y, z, colors) = store.expand (first)
+            self.write_points (f, x[skipped:], y[skipped:], z[skipped:], colors[skipped:])
+        else:
+            self.write_points (f, *[store.get_column (name, start) for (name, dtype) in point_dtypes])
+
+    # Numbers of points of blocks given by get_blocks of the store
+    def get_block_sizes (self, store):
+        if isinstance(store, segments.SegmentStore):
+            length = store.get_segment_column ('length').astype(np.int64)
+            return [int(length[first:last].sum()) for (first, last) in store.get_chunks ()]
+        return [len(block[0]) for block in store.get_blocks (False)]
+
+    # Appends a checkpoint - only points added since the previous checkpoint
+    # are written, unless points were changed in any other way; the first
+    # checkpoint of the process writes the stream again from scratch
+    #   o figures - (method, fig_id, title, file_output, args) drawn from
+    #     points of the store
+    def write (self, figures, store):
+        directory = os.path.dirname(self.file_name)
+        description = []
+        for (method, fig_id, title, file_output, args) in figures:
+            description.append([method, fig_id, title, os.path.relpath(file_output, directory or "."), list(args)])
+        bounds = store.get_bounds ()
+        if bounds is not None:
+            bounds = [int(value) for value in bounds]
+        description = {'figures': description, 'blocks': self.get_block_sizes (store), 'bounds': bounds}
+        description = json.dumps(description).encode('utf-8')
+
+        if self.committed_size is None and self.is_keeping_checkpoints and os.path.exists(self.file_name):
+            try:
+                self.committed_size = self.read_checkpoints ()[1]
+            except ValueError:
+                pass
+        # stream grown far above its live data is written again from scratch
+        if self.committed_size is None or (not self.is_keeping_checkpoints and self.committed_size > 2 * (self.live_bytes + 1024 * 1024)):
+            self.compact (description, store)
+            return
+        with open(self.file_name, 'r+b') as f:
+            f.truncate(self.committed_size)
+            f.seek(self.committed_size)
+            self.write_checkpoint (f, description, store)
+
+    def write_checkpoint (self, f, description, store):
+        if self.store is store and self.logged_version == store.version and self.logged_size <= self.get_logged_size (store):
+            self.write_points_from (f, store, self.logged_size)
+        else:
+            if f.tell() > stream_header.size:
+                self.write_record (f, b'C', 0, [])
+                self.live_bytes = 0
+            if isinstance(store, segments.SegmentStore):
+                blocks = store.get_blocks ()
+            else:
+                blocks = store.get_blocks (False)
+            for (x, y, z, colors) in blocks:
+                self.write_points (f, x, y, z, colors)
+            self.logged_period = None
+
+        period = None
+        if isinstance(store, pointstore.PointStore):
+            period = store.get_period ()
+            # new points drop the logged tail
+            if self.logged_size != store.get_stored_size ():
+                self.logged_period = None
+        if period is not None and period is not self.logged_period:
+            payload = [np.array(list(period['displacement']) + [period['count']], dtype=np.int64)]
+            for (name, dtype) in point_dtypes:
+                payload.append(period[name].astype(dtype))
+            self.write_record (f, b'R', len(period['x']), payload)
+        self.logged_period = period
+        self.store = store
+        self.logged_size = self.get_logged_size (store)
+        self.logged_version = store.version
+
+        self.write_record (f, b'F', len(description), [np.frombuffer(description, dtype=np.uint8)])
+        f.flush()
+        self.committed_size = f.tell()
+
+    # The stream is written under a temporary name, so a renderer never sees
+    # a partial stream
+    def compact (self, description, store):
+        self.store = None
+        self.live_bytes = 0
+        with open(self.file_name + ".tmp", 'wb') as f:
+            f.write(stream_header.pack(stream_magic, stream_version))
+            self.write_checkpoint (f, description, store)
+        os.replace(self.file_name + ".tmp", self.file_name)
+
+    # Complete checkpoints of the stream - (description, pieces of points,
+    # periodic tail) - and the size of the stream up to the last of them
+    def read_checkpoints (self):
+        checkpoints = []
+        (pieces, period) = ([], None)
+        with open(self.file_name, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            header = f.read(stream_header.size)
+            if len(header) < stream_header.size or stream_header.unpack(header) != (stream_magic, stream_version):
+                raise ValueError("Not a point stream: " + self.file_name)
+            committed_size = f.tell()
+            while True:
+                header = f.read(record_header.size)
+                if len(header) < record_header.size:
+                    break
+                (record_type, count) = record_header.unpack(header)
+                if record_type == b'P':
+                    if f.tell() + count * point_bytes > file_size:
+                        break
+                    pieces.append((f.tell(), count))
+                    period = None
+                    f.seek(count * point_bytes, os.SEEK_CUR)
+                elif record_type == b'C':
+                    (pieces, period) = ([], None)
+                elif record_type == b'R':
+                    values = np.fromfile(f, dtype=np.int64, count=4)
+                    if len(values) < 4 or f.tell() + count * point_bytes > file_size:
+                        break
+                    period = {'displacement': tuple(int(value) for value in values[:3]), 'count': int(values[3])}
+                    for (name, dtype) in point_dtypes:
+                        period[name] = np.fromfile(f, dtype=dtype, count=count)
+                elif record_type == b'F':
+                    description = f.read(count)
+                    if len(description) < count:
+                        break
+                    checkpoints.append((json.loads(description.decode('utf-8')), list(pieces), period))
+                    committed_size = f.tell()
+                else:
+                    break
+        return (checkpoints, committed_size)
+
+    # Figures as in Rendering.write_figures - of every file name only the
+    # figure of the last complete checkpoint; points of the stream are read
+    # block by block while they are drawn (StreamPoints), file names are in
+    # the directory of the stream
+    def read (self):
+        directory = os.path.dirname(self.file_name)
+        checkpoints = self.read_checkpoints ()[0]
+        last = {}
+        for i in range (len(checkpoints)):
+            for figure in checkpoints[i][0]['figures']:
+                last[figure[3]] = i
+        figures = []
+        for i in sorted(set(last.values())):
+            (description, pieces, period) = checkpoints[i]
+            bounds = description['bounds']
+            store = StreamPoints(StreamBlocks(self.file_name, pieces, description['blocks']), period, None if bounds is None else tuple(bounds))
+            for (method, fig_id, title, file_output, args) in description['figures']:
+                if last[file_output] == i:
+                    figures.append((method, fig_id, title, os.path.join(directory, file_output), store, tuple(args)))
+        return figures
@@ -0,0 +1,254 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+import math
+from collections import OrderedDict
+import numpy as np
+
+# Primes below this limit cross off their multiples one by one,
+# larger ones are processed all together
+small_primes_limit = 1024
+
+# Bases making the Miller-Rabin test deterministic for all numbers below 2**64
+miller_rabin_bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+# Costs of a Miller-Rabin test of a single number and of a single base prime
+# of a window, in numbers of the window crossed off - numbers are tested one
+# by one when it is cheaper than sieving their window
+miller_rabin_cost = 2000
+base_prime_cost = 3
+
+# Bitset file with primality of odd numbers - header followed by one bit
+# per odd number 1, 3, 5... up to the bound stored in the header
+bitset_magic = b'PRIMEBIT'
+bitset_header_size = 16
+
+class MillerRabin:
+
+    # Deterministic for numbers below 2**64
+    def is_prime (self, num):
+        if num < 2:
+            return False
+        for q in miller_rabin_bases:
+            if num % q == 0:
+                return num == q
+        d = num - 1
+        r = 0
+        while d % 2 == 0:
+            d //= 2
+            r += 1
+        for a in miller_rabin_bases:
+            x = pow(a, d, num)
+            if x == 1 or x == num - 1:
+                continue
+            for i in range (r - 1):
+                x = x * x % num
+                if x == num - 1:
+                    break
+            else:
+                return False
+        return True
+
+    def get_primality_mask (self, nums):
+        return np.array([self.is_prime (int(num)) for num in nums], dtype=bool)
+
+class SegmentedSieve:
+
+    def __init__ (self, segment_size = 1 << 20, max_segments = 16):
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.base_primes = np.zeros(0, dtype=np.int64)
+        self.base_limit = 1
+        self.segments = OrderedDict()
+        # sparse numbers far from each other are tested by Miller-Rabin
+        #   o misses - segment id -> numbers tested while it was not sieved
+        self.miller_rabin = MillerRabin()
+        self.misses = {}
+
+    def get_base_primes (self, limit):
+        if limit > self.base_limit:
+            # grow at least twice to avoid sieving again for every window
+            self.base_limit = max(limit, 2 * self.base_limit)
+            sieve = np.ones(self.base_limit + 1, dtype=bool)
+            sieve[:2] = False
+            for i in range (2, math.isqrt(self.base_limit) + 1):
+                if sieve[i]:
+                    sieve[i*i::i] = False
+            self.base_primes = np.flatnonzero(sieve).astype(np.int64)
+        return self.base_primes[self.base_primes <= limit]
+
+    # Estimated cost of get_window (lo, hi) in numbers crossed off
+    def get_window_cost (self, lo, hi):
+        limit = math.isqrt(max(hi - 1, 1))
+        return (hi - lo) + base_prime_cost * limit / max(math.log(limit), 1.0)
+
+    # Primality mask of all numbers from the window [lo, hi)
+    def get_window (self, lo, hi):
+        window = np.ones(max(hi - lo, 0), dtype=bool)
+        if lo < 2:
+            window[:min(2 - lo, len(window))] = False
+        if hi <= 4:
+            return window
+
+        base_primes = self.get_base_primes (math.isqrt(hi - 1))
+        for q in base_primes[base_primes < small_primes_limit]:
+            q = int(q)
+            start = max(q*q, (lo + q - 1) // q * q)
+            window[start - lo::q] = False
+
+        qs = base_primes[base_primes >= small_primes_limit]
+        offsets = np.maximum(qs * qs, (lo + qs - 1) // qs * qs) - lo
+        while len(qs):
+            is_inside = offsets < len(window)
+            qs = qs[is_inside]
+            offsets = offsets[is_inside]
+            window[offsets] = False
+            offsets += qs
+        return window
+
+    def get_segment (self, segment_id):
+        if segment_id in self.segments:
+            self.segments.move_to_end(segment_id)
+        else:
+            lo = segment_id * self.segment_size
+            self.segments[segment_id] = self.get_window (lo, lo + self.segment_size)
+            if len(self.segments) > self.max_segments:
+                self.segments.popitem(last=False)
+        return self.segments[segment_id]
+
+    def is_prime (self, num):
+        if num < 2:
+            return False
+        segment_id = num // self.segment_size
+        if segment_id not in self.segments:
+            # numbers are tested one by one until the tests cost as much as
+            # sieving their segment
+            misses = self.misses.get(segment_id, 0) + 1
+            lo = segment_id * self.segment_size
+            if misses * miller_rabin_cost < self.get_window_cost (lo, lo + self.segment_size):
+                if len(self.misses) >= 4 * self.max_segments:
+                    self.misses = {}
+                self.misses[segment_id] = misses
+                return self.miller_rabin.is_prime (num)
+            self.misses.pop(segment_id, None)
+        segment = self.get_segment (segment_id)
+        return bool(segment[num % self.segment_size])
+
+    def write_bitset (self, file_name, bound):
+        # windows start at even numbers and cover a multiple of 8 odd numbers
+        step = max(16, self.segment_size - self.segment_size % 16)
+        with open(file_name, 'wb') as f:
+            f.write(bitset_magic)
+            f.write(np.array([bound], dtype='<u8').tobytes())
+            for lo in range (0, bound + 1, step):
+                window = self.get_window (lo, lo + step)
+                odd = window[1::2]
+                odd = odd[:(bound + 1) // 2 - lo // 2]
+                f.write(np.packbits(odd, bitorder='little').tobytes())
+
+    # Primality of all numbers at once - numbers close to each other are
+    # sieved together, distant groups of numbers get their own windows;
+    # groups too sparse for their window are tested by Miller-Rabin
+    def get_primality_mask (self, nums):
+        nums = np.asarray(nums, dtype=np.int64)
+        result = np.zeros(len(nums), dtype=bool)
+        candidates = np.flatnonzero(nums >= 2)
+        if len(candidates) == 0:
+            return result
+
+        order = candidates[np.argsort(nums[candidates], kind='stable')]
+        sorted_nums = nums[order]
+        gaps = np.flatnonzero(np.diff(sorted_nums) > self.segment_size) + 1
+        for group in np.split(np.arange(len(order)), gaps):
+            lo = int(sorted_nums[group[0]])
+            hi = int(sorted_nums[group[-1]]) + 1
+            if len(group) * miller_rabin_cost < self.get_window_cost (lo, hi):
+                result[order[group]] = self.miller_rabin.get_primality_mask (sorted_nums[group])
+                continue
+            window = self.get_window (lo, hi)
+            result[order[group]] = window[sorted_nums[group] - lo]
+        return result
+
+class PrimeBitset:
+
+    def __init__ (self, file_name, fallback = None):
+        header = np.fromfile(file_name, dtype=np.uint8, count=bitset_header_size)
+        if header[:len(bitset_magic)].tobytes() != bitset_magic:
+            raise ValueError("Not a prime bitset file: " + file_name)
+        self.bound = int(header[len(bitset_magic):].view('<u8')[0])
+        self.bits = np.memmap(file_name, dtype=np.uint8, mode='r', offset=bitset_header_size)
+        # numbers above the bound are checked by the fallback provider
+        if fallback is None:
+            fallback = SegmentedSieve()
+        self.fallback = fallback
+
+    def is_prime (self, num):
+        if num > self.bound:
+            return self.fallback.is_prime (num)
+        if num == 2:
+            return True
+        if num < 2 or num % 2 == 0:
+            return False
+        i = num >> 1
+        return bool((self.bits[i >> 3] >> (i & 7)) & 1)
+
+    def get_primality_mask (self, nums):
+        nums = np.asarray(nums, dtype=np.int64)
+        result = np.zeros(len(nums), dtype=bool)
+        is_odd = (nums % 2 == 1) & (nums > 1) & (nums <= self.bound)
+        i = nums[is_odd] >> 1
+        result[is_odd] = (self.bits[i >> 3] >> (i & 7)) & 1 == 1
+        result[nums == 2] = self.bound >= 2
+        is_above = nums > self.bound
+        if is_above.any():
+            result[is_above] = self.fallback.get_primality_mask (nums[is_above])
+        return result
+
+class PrimalityBatch:
+
+    def __init__ (self, p):
+        self.p = p
+
+    # Primality masks for numbers of many cases at once - every distinct
+    # number is tested only once, no matter how many cases use it
+    #   o nums_per_case - dictionary: case id -> numbers
+    def get_primality_masks (self, nums_per_case):
+        cases = list(nums_per_case)
+        nums = [np.asarray(nums_per_case[case], dtype=np.int64) for case in cases]
+        if not nums:
+            return {}
+        (distinct_nums, inverse) = np.unique(np.concatenate(nums), return_inverse=True)
+        if hasattr(self.p, 'get_primality_mask'):
+            distinct_mask = self.p.get_primality_mask (distinct_nums)
+        else:
+            distinct_mask = np.array([self.p.is_prime(int(num)) for num in distinct_nums], dtype=bool)
+
+        masks = {}
+        start = 0
+        for i in range (len(cases)):
+            masks[cases[i]] = distinct_mask[inverse[start:start + len(nums[i])]]
+            start += len(nums[i])
+        return masks
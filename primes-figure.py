@@ -24,24 +24,30 @@
 # OF SUCH DAMAGE.
 #
 
-from mpl_toolkits.mplot3d import Axes3D
-import matplotlib.pyplot as plt
 import numpy as np
 import pickle
-import math
-from random import randint
 import shapes
-import dataprocessing
+import shapestats
+import sequences
+import primality
+import pointstore
+import segments
+import checkpoint
+import resultcache
+import pointstream
+import walkscan
+import timings
 import os
+import subprocess
 import sys
-sys.path.insert(0, '..\\primes\\')
-import primes
 
 #############################################################
 # Settings - configuration
 #############################################################
 
 # Minimal and maximum number - range of iterations
+#   o min_num may be far from 1 to walk a window only,
+#     e.g. min_num = 10**12 and max_num = 10**12 + 1000000
 min_num = 1
 max_num = 1000000
 
@@ -62,11 +68,27 @@ cases_to_check = {'c1', 'c2', 'c3', 'c4', 'c5', 'c6', 'c7', 'c8', 'c9', 'c10', '
 min_case = 1
 max_case = 13
 
+# Seed of random numbers of case 12
+#   o None - numbers are different in every run, results of case 12 are
+#     never cached
+#   o integer - the same numbers in every run
+random_seed = None
+
+# Primality tests
+#   o 'primes' - primes.Primes seeded with helper files
+#   o 'sieve'  - built-in segmented sieve, helper files are not needed;
+#     numbers too sparse to sieve (e.g. far windows) are tested by
+#     Miller-Rabin
+#   o 'bitset' - memory-mapped bitset file written by primes-bitset.py
+primality_provider = 'sieve'
+
 # Helper files
 #   o file_input_primes - contains prime numbers
 #   o file_input_nonprimes - contains composite numbers
 file_input_primes = '..\\primes\\t_prime_numbers.txt'
 file_input_nonprimes = '..\\primes\\t_nonprime_numbers.txt'
+#   o file_input_bitset - contains primality of odd numbers
+file_input_bitset = '..\\primes\\t_primes_bitset.bin'
 
 # Save figures with partial results
 figures_save_partial_results = False
@@ -74,19 +96,143 @@ figures_save_partial_results = False
 enable_points_lifetime = False
 enable_optimized_points_save = True
 continue_previous_calculations = True
+# Checkpoints
+#   o True  - appended to a log, only points added since the previous
+#             checkpoint are written
+#   o False - all results are pickled again at every checkpoint
+enable_incremental_checkpoints = True
+# Results of every case are cached in a directory shared by all runs, so a
+# run with larger max_num (or other cases) continues from the longest
+# cached walk of every case instead of starting from scratch
+enable_result_cache = True
+cache_directory = "cache"
 use_3d_plotting = True
 
+# 2D figures
+#   o 'scatter' - every point is drawn
+#   o 'raster'  - points are counted in a grid with raster_size cells on the
+#                 longer side, render time does not depend on number of points
+#   o 'auto'    - raster for cases with more than raster_points_threshold points
+figure_2d_mode = 'auto'
+raster_size = 1000
+raster_points_threshold = 200000
+# Colors of raster cells
+#   o 'colors'  - colors of points (color_turn or color_no_turn)
+#   o 'density' - number of points in a cell
+raster_colors = 'density'
+
+# Tile pyramid of 2D figures - PNG tiles of tile_size x tile_size cells in
+# directories f_shape_<case>_tiles/<level>, level 0 shows the whole shape
+# in a single tile and every next level doubles the zoom up to a point per
+# cell; coarse levels are aggregated from finer ones
+#   o tile_size should be even
+enable_tile_pyramid = False
+tile_size = 256
+
+# Figures are drawn by a separate process while the walk goes on
+#   o render_in_background - if False, the walk waits until figures are drawn
+#   o render_queue_size - number of checkpoints waiting to be drawn; when
+#     figures of partial results are not saved, the oldest waiting
+#     checkpoint is dropped, otherwise the walk waits for the render process
+render_in_background = True
+render_queue_size = 1
+
+# Compute-only mode - figures are not drawn and matplotlib is never imported;
+# at every checkpoint points of every case added since the previous one are
+# appended together with the description of its figures to a point stream
+# (f_shape_<case>.pts, see pointstream.py) instead - primes-render.py draws
+# the same figures from the streams later, also on another machine; with
+# figures_save_partial_results figures of every checkpoint are kept
+compute_only = False
+
+# 3D figures of cases with more points than max_points_3d show points
+# snapped to voxels, at most max_points_3d of them
+max_points_3d = 50000
+
+# Statistics - every row of objs_stats.csv holds:
+#   case, iterations, primes, % primes, non-primes, % non-primes, points,
+#   2D cells, diff x, diff y, diff z, 2D fill %, 3D fill %, turns, longest
+#   straight run and numbers of 2D cells visited 1, 2-3, 4-7, ... times -
+#   the last of visit_histogram_buckets columns counts all cells visited
+#   more times
+#   o enable_visit_histogram - visits of 2D cells are counted, it takes
+#     memory comparable to the index of points; visits are counted again
+#     from points restored from a checkpoint, so they are not counted (2D
+#     cells and visits are 0) with points lifetime, which drops points, and
+#     with points_memory_budget, which would not bound memory of cells
+enable_visit_histogram = True
+visit_histogram_buckets = 6
+
+# Timings - every row of objs_timings.csv is written at a checkpoint and holds:
+#   k, seconds of the run, iterations per second since the previous
+#   checkpoint, cumulative seconds of stages (numbers, primality, walk,
+#   points, figures, stats, checkpoint), cumulative seconds and points of
+#   every case and memory of the process (RSS and its peak in MB)
+#   o in the step by step walk primality tests are counted in walk and
+#     numbers are not timed
+#   o with render_in_background figures are timed until they are handed
+#     over to the render process
+#   o enable_timings - if False, nothing is timed
+enable_timings = True
+
 # Colors for points
 color_no_turn = 0
 color_turn = 0
 
 lifetime_start = 10000
 
+# Memory budget of points of a single case (in bytes) - points above the
+# budget are moved to memory-mapped files in the output directory
+#   o 0 - all points are kept in memory
+#   o points with lifetime are never moved, lifetime bounds their number anyway
+points_memory_budget = 0
+
+# Points of every case kept as straight segments of the walk - memory and
+# checkpoints depend on number of turns, not on number of steps
+#   o every step is kept, points are not looked up like with
+#     enable_optimized_points_save - the walk never comes back to a point
+#     in 3D, so it keeps the same points
+#   o not used with enable_points_lifetime
+use_segments = False
+
+# Cases with periodic numbers (case 10 walked alone) walk only until their
+# walk repeats - the rest of the walk up to max_num is added at once as a
+# periodic tail of points, which are made only when figures are drawn
+#   o only with use_block_walk, not with enable_points_lifetime or segments
+enable_periodic_extrapolation = True
+
+# Walk through blocks of numbers at once instead of number by number
+#   o use_block_walk - enable walking in blocks
+#   o block_size - maximal number of iterations in a single block
+#   o shared_primality_batch - test every distinct number of the block once
+#     for all cases together
+use_block_walk = True
+block_size = 10000
+shared_primality_batch = True
+
+# Parallel execution of cases
+#   o number_of_workers - number of worker processes, each of them walks its
+#     own group of cases with its own checkpoint, statistics and timings,
+#     they are merged when all workers are done; 1 - all cases in one process
+number_of_workers = 1
+#   o walk_scan_processes - number of processes walking chunks of every block
+#     of a single case in parallel; 0 - blocks are walked in this process
+walk_scan_processes = 0
+
+# Worker of a parallel run walks only the cases given in the command line
+#   primes-figure.py --cases c1,c5
+worker_cases = None
+if len(sys.argv) > 2 and sys.argv[1] == '--cases':
+    worker_cases = sys.argv[2].split(',')
+    cases_to_check = set(worker_cases)
+
 #############################################################
 # Settings - output directory and files
 #############################################################
 
 directory = "results/" + str(max_num)
+if min_num != 1:
+    directory = "results/" + str(min_num) + "_" + str(max_num)
 if not os.path.exists(directory):
     os.makedirs(directory)
 file_output_shape_1 = directory + "/f_shape_1"
@@ -102,8 +248,18 @@ file_output_shape_10 = directory + "/f_shape_10"
 file_output_shape_11 = directory + "/f_shape_11"
 file_output_shape_12 = directory + "/f_shape_12"
 file_output_extension = ".png"
-file_output_pickle = directory + "/objs_shape.pickle"
+file_output_checkpoint = directory + "/objs_shape"
+file_output_pickle_extension = ".pickle"
+file_output_log_extension = ".log"
 file_output_stats = directory + "/objs_stats.csv"
+file_output_timings = directory + "/objs_timings.csv"
+file_output_merged_checkpoint = file_output_checkpoint
+file_output_merged_stats = file_output_stats
+file_output_merged_timings = file_output_timings
+if worker_cases is not None:
+    file_output_checkpoint = directory + "/objs_shape_" + "_".join(worker_cases)
+    file_output_stats = directory + "/objs_stats_" + "_".join(worker_cases) + ".csv"
+    file_output_timings = directory + "/objs_timings_" + "_".join(worker_cases) + ".csv"
 
 #############################################################
 # Results of calculations
@@ -116,11 +272,8 @@ delta_x = []
 delta_y = []
 delta_z = []
 num_current = []
-datax = []
-datay = []
-dataz = []
-lifetime = []
-colors = []
+points = []
+shape_stats = []
 is_previous_prime = []
 sign = []
 stats_primes = []
@@ -129,6 +282,30 @@ stats_iterations = []
 k = 0
 k_current = 0
 num = 1
+# first k of the whole walk - min_num moves when calculations are resumed
+first_num = min_num
+walk_scan = None
+render_worker = None
+stage_timings = None
+figures = []
+result_cache = None
+checkpoint_logs = {}
+point_streams = {}
+
+def is_segments_used ():
+    return use_segments and not enable_points_lifetime
+
+def is_counting_visits ():
+    return enable_visit_histogram and not enable_points_lifetime and points_memory_budget == 0
+
+# Empty store for points of case i
+def new_point_store (i):
+    if is_segments_used ():
+        return segments.SegmentStore()
+    store = pointstore.PointStore(enable_optimized_points_save)
+    if not enable_points_lifetime:
+        store.set_spilling (directory + "/points_c" + str(i), points_memory_budget)
+    return store
 
 for i in range (min_case, max_case):
     new_x.append(0)
@@ -138,11 +315,8 @@ for i in range (min_case, max_case):
     delta_y.append(0)
     delta_z.append(1)
     num_current.append(0)
-    datax.append([])
-    datay.append([])
-    dataz.append([])
-    lifetime.append([])
-    colors.append([])
+    points.append(new_point_store (i))
+    shape_stats.append(shapestats.ShapeStats(is_counting_visits ()))
     is_previous_prime.append(False)
     sign.append(1)
     stats_primes.append(0)
@@ -154,15 +328,24 @@ for i in range (min_case, max_case):
 #############################################################
 
 def get_max_diff (tcid):
-    diff_x = max(datax[tcid]) - min(datax[tcid])
-    diff_y = max(datay[tcid]) - min(datay[tcid])
-    diff_z = max(dataz[tcid]) - min(dataz[tcid])
+    # points with lifetime cover only the last part of the walk
+    if enable_points_lifetime:
+        (min_x, max_x, min_y, max_y, min_z, max_z) = points[tcid].get_bounds()
+    else:
+        (min_x, max_x, min_y, max_y, min_z, max_z) = shape_stats[tcid].get_bounds()
+    diff_x = max_x - min_x
+    diff_y = max_y - min_y
+    diff_z = max_z - min_z
     return (diff_x + 1, diff_y + 1, diff_z + 1)
 
 def get_points (tcid):
-    return (len(datax[tcid]))
+    return (len(points[tcid]))
 
 def write_results_to_figures(save_partial_results, perc_completed, k):
+    global figures
+    if stage_timings is not None:
+        start = stage_timings.get_time ()
+    figures = []
     file_shape_1 = set_file_output_filename (file_output_shape_1, save_partial_results, "_" + str(perc_completed) + str(k))
     file_shape_2 = set_file_output_filename (file_output_shape_2, save_partial_results, "_" + str(perc_completed) + str(k))
     file_shape_3 = set_file_output_filename (file_output_shape_3, save_partial_results, "_" + str(perc_completed) + str(k))
@@ -213,6 +396,34 @@ def write_results_to_figures(save_partial_results, perc_completed, k):
         write_results_to_figure (12, 11, "n = random integer between 2 and 9", file_shape_12, False)
         write_results_to_figure (12, 11, "n = random integer between 2 and 9", file_shape_12 + "3d", True)
 
+    if compute_only:
+        write_point_streams (figures)
+    elif render_worker is not None:
+        render_worker.submit (figures)
+    else:
+        rendering.Rendering().write_figures (figures)
+    if stage_timings is not None:
+        stage_timings.add ('figures', start)
+
+# Every store goes to its own stream, named after the case of its figures
+def write_point_streams (figures):
+    streams = []
+    for (method, fig_id, title, file_output, store, args) in figures:
+        if not streams or streams[-1][1] is not store:
+            streams.append((directory + "/f_shape_" + str(fig_id) + ".pts", store, []))
+        streams[-1][2].append((method, fig_id, title, file_output, args))
+    for (file_stream, store, store_figures) in streams:
+        if file_stream not in point_streams:
+            point_streams[file_stream] = pointstream.PointStream(file_stream, figures_save_partial_results)
+        point_streams[file_stream].write (store_figures, store)
+
+# Modules drawing figures import matplotlib - they are imported only when
+# figures are drawn by this script
+def import_rendering ():
+    global rendering, renderworker
+    import rendering
+    import renderworker
+
 def set_file_output_filename (file_start, add_something, file_end):
     if add_something:
         return (file_start + file_end)
@@ -220,112 +431,385 @@ def set_file_output_filename (file_start, add_something, file_end):
         return (file_start)
 
 def write_results_to_figure (fig_id, data_id, title_start, file_output, if_3d):
-    global datax, datay, dataz, colors
+    global figures
 
+    store = points[data_id]
+    min_color = min(color_turn, color_no_turn)
+    max_color = max(color_turn, color_no_turn)
     title = title_start + str(num_current[data_id]) + " iter=" + str(k) 
 
-    if if_3d:
-        fig = plt.figure(fig_id)
-        ax = fig.add_subplot(111, projection='3d')
-        ax.scatter(datax[data_id], datay[data_id], dataz[data_id], c=colors[data_id], marker='o')
+    if if_3d and len(store) > max_points_3d:
+        figure = ('write_voxel_figure', (len(store), max_points_3d))
+    elif if_3d:
+        figure = ('write_scatter_3d_figure', (min_color, max_color))
+    elif figure_2d_mode == 'raster' or (figure_2d_mode == 'auto' and len(store) > raster_points_threshold):
+        figure = ('write_raster_figure', (raster_size, raster_colors, min_color, max_color))
+    else:
+        figure = ('write_scatter_figure', (min_color, max_color))
+    figures.append((figure[0], fig_id, title, file_output + file_output_extension, store, figure[1]))
+    if enable_tile_pyramid and not if_3d:
+        figures.append(('write_tile_pyramid', fig_id, title, file_output + "_tiles", store, (tile_size, raster_colors, min_color, max_color)))
+
+def save_current_results (file_output_checkpoint):
+    global k_current, new_x, new_y, new_z, delta_x, delta_y, delta_z, num_current, points, is_previous_prime, sign, stats_primes, stats_nonprimes, stats_iterations
+    if stage_timings is not None:
+        start = stage_timings.get_time ()
+    if enable_incremental_checkpoints:
+        states = []
+        for tcid in range (len(points)):
+            states.append(get_walk_state (tcid) + (num_current[tcid],) + shape_stats[tcid].get_state ())
+        get_checkpoint_log (file_output_checkpoint).save (k_current, states, points)
+    else:
+        with open(file_output_checkpoint + file_output_pickle_extension, 'wb') as f:
+            pickle.dump([k_current, new_x, new_y, new_z, delta_x, delta_y, delta_z, num_current, points, is_previous_prime, sign, stats_primes, stats_nonprimes, stats_iterations, shape_stats], f)
+    if stage_timings is not None:
+        stage_timings.add ('checkpoint', start)
+
+def restore_previous_results (file_output_checkpoint):
+    global k_current, new_x, new_y, new_z, delta_x, delta_y, delta_z, num_current, points, shape_stats, is_previous_prime, sign, stats_primes, stats_nonprimes, stats_iterations
+    if os.path.exists(file_output_checkpoint + file_output_log_extension):
+        log = get_checkpoint_log (file_output_checkpoint)
+        results = log.restore ()
+        if results is None:
+            return
+        (k_current, states) = results
+        for tcid in range (len(states)):
+            if not is_restored (tcid):
+                continue
+            state = states[tcid]
+            set_walk_state (tcid, state[:7] + (bool(state[7]),) + state[8:11])
+            num_current[tcid] = state[11]
+            points[tcid] = new_point_store (tcid + 1)
+            log.read_points (tcid, points[tcid])
+            restore_shape_stats (tcid, state[12:])
+    elif os.path.exists(file_output_checkpoint + file_output_pickle_extension):
+        with open(file_output_checkpoint + file_output_pickle_extension, 'rb') as f:
+            results = pickle.load(f)
+        # results saved before point stores were introduced keep points in lists
+        if len(results) == 18:
+            results = results[:8] + [get_legacy_points (results[8:13])] + results[13:]
+        k_current, new_x, new_y, new_z, delta_x, delta_y, delta_z, num_current, points, is_previous_prime, sign, stats_primes, stats_nonprimes, stats_iterations = results[:14]
+        if len(results) > 14:
+            shape_stats = results[14]
+        else:
+            for tcid in range (len(points)):
+                restore_shape_stats (tcid, ())
+        for i in range (min_case, max_case):
+            if not is_restored (i-1):
+                reset_case (i-1)
+                continue
+            store = points[i-1]
+            if isinstance(store, segments.SegmentStore):
+                continue
+            if store.is_indexed != enable_optimized_points_save:
+                store.set_indexed (enable_optimized_points_save)
+            if not enable_points_lifetime:
+                store.set_spilling (directory + "/points_c" + str(i), points_memory_budget)
+
+# Worker restores only its own cases - points of other cases are not read
+# and never moved to files of their cases, which belong to other workers
+def is_restored (tcid):
+    return worker_cases is None or "c" + str(tcid + 1) in worker_cases
+
+def reset_case (tcid):
+    set_walk_state (tcid, (0, 0, 0, 1, 0, 1, 1, False, 0, 0, 0))
+    num_current[tcid] = 0
+    points[tcid] = new_point_store (tcid + 1)
+    shape_stats[tcid] = shapestats.ShapeStats(is_counting_visits ())
+
+# Statistics of steps are saved after the walk state, the rest of them is
+# counted again from restored points
+def restore_shape_stats (tcid, stats_state):
+    shape_stats[tcid] = shapestats.ShapeStats(is_counting_visits ())
+    if len(stats_state) > 0:
+        shape_stats[tcid].set_state (stats_state)
+    else:
+        # results saved before statistics were kept - turns are not known
+        shape_stats[tcid].set_state ((stats_iterations[tcid], 0, 0, 0))
+    shape_stats[tcid].set_points (points[tcid])
+
+def get_checkpoint_log (file_output_checkpoint):
+    if file_output_checkpoint not in checkpoint_logs:
+        checkpoint_logs[file_output_checkpoint] = checkpoint.CheckpointLog(file_output_checkpoint + file_output_log_extension)
+    return checkpoint_logs[file_output_checkpoint]
+
+def is_checkpoint_saved (file_output_checkpoint):
+    return os.path.exists(file_output_checkpoint + file_output_log_extension) or os.path.exists(file_output_checkpoint + file_output_pickle_extension)
+
+def get_legacy_points (legacy_results):
+    (datax, datay, dataz, colors, lifetime) = legacy_results
+    stores = []
+    for tcid in range (len(datax)):
+        store = pointstore.PointStore(enable_optimized_points_save)
+        store_lifetime = lifetime[tcid]
+        if len(store_lifetime) != len(datax[tcid]):
+            store_lifetime = [lifetime_start] * len(datax[tcid])
+        store.extend (datax[tcid], datay[tcid], dataz[tcid], colors[tcid], store_lifetime)
+        stores.append(store)
+    return stores
+
+# Number of the case at k - numbers of all cases are given by generators of
+# number_sequences, see sequences.py
+def get_next_num (case, k, num, case_sign):
+    return int(number_sequences.get_numbers (case, k, k + 1, case_sign, [num])[0])
+
+# Case which number is used by case 10 - the previous enabled case or the
+# last enabled one from the previous iteration; None if it is case 10 itself
+def get_number_source (case):
+    enabled = []
+    for i in range (min_case, max_case):
+        if "c" + str(i) in cases_to_check:
+            enabled.append("c" + str(i))
+    i = enabled.index(case)
+    if enabled[i - 1] == case:
+        return None
+    return enabled[i - 1]
+
+# Everything the walk of the case depends on, None if it cannot be repeated
+def get_case_definition (case):
+    # random numbers of case 12 are different in every run without a seed
+    if case == 'c12' and random_seed is None:
+        return None
+    definition = case + ";first=" + str(first_num) + ";optimized=" + str(enable_optimized_points_save)
+    if case == 'c12':
+        definition += ";seed=" + str(random_seed)
+    if enable_points_lifetime:
+        definition += ";lifetime=" + str(lifetime_start)
+    definition += ";colors=" + str(color_no_turn) + "," + str(color_turn)
+    if case == 'c10' and get_number_source (case) is not None:
+        source_definition = get_case_definition (get_number_source (case))
+        if source_definition is None:
+            return None
+        definition += ";source=(" + source_definition + ")"
+    return definition
+
+# next k to be walked by the case - cases restored from the cache may be ahead of others
+def get_next_k (tcid):
+    return first_num + stats_iterations[tcid]
+
+# sign of the case at k - sign of a case restored from the cache is its sign
+# at its next k, it alternates back to k over the k the case skips
+def get_sign (tcid, k):
+    skipped = max(get_next_k (tcid) - k, 0)
+    return sign[tcid] if skipped % 2 == 0 else -sign[tcid]
+
+# first k not walked by all cases - the walk starts there, so case 10 using
+# its own numbers continues from the number of the k walked last
+def get_first_k ():
+    first_k = max_num
+    for i in range (min_case, max_case):
+        if "c" + str(i) in cases_to_check:
+            first_k = min(first_k, get_next_k (i-1))
+    return max(first_k, min_num)
 
+def restore_cached_results ():
+    global num
+    for i in range (min_case, max_case):
+        case = "c" + str(i)
+        if case in cases_to_check and get_case_definition (case) is not None:
+            tcid = i - 1
+            definition = get_case_definition (case)
+            k_cached = result_cache.find (definition, max_num)
+            if k_cached is not None and k_cached > get_next_k (tcid):
+                store = new_point_store (i)
+                state = result_cache.restore (definition, k_cached, store)
+                set_walk_state (tcid, state[:7] + (bool(state[7]),) + state[8:11])
+                num_current[tcid] = state[11]
+                points[tcid] = store
+                restore_shape_stats (tcid, state[12:])
+                print ("  Case", i, "continues from cached k =", k_cached)
+
+def save_cached_results ():
+    for i in range (min_case, max_case):
+        case = "c" + str(i)
+        if case in cases_to_check and get_case_definition (case) is not None:
+            tcid = i - 1
+            result_cache.save (get_case_definition (case), get_next_k (tcid), get_walk_state (tcid) + (num_current[tcid],) + shape_stats[tcid].get_state (), points[tcid])
+
+def get_walk_state (tcid):
+    return (new_x[tcid], new_y[tcid], new_z[tcid], delta_x[tcid], delta_y[tcid], delta_z[tcid], sign[tcid], is_previous_prime[tcid], stats_primes[tcid], stats_nonprimes[tcid], stats_iterations[tcid])
+
+def set_walk_state (tcid, state):
+    (new_x[tcid], new_y[tcid], new_z[tcid], delta_x[tcid], delta_y[tcid], delta_z[tcid], sign[tcid], is_previous_prime[tcid], stats_primes[tcid], stats_nonprimes[tcid], stats_iterations[tcid]) = state
+
+def run_block (k_start, k_end):
+    global num
+    # numbers are generated in the same order as in the step by step walk,
+    # because case 10 depends on the number used by the previous case
+    cases = []
+    case_signs = []
+    for i in range (min_case, max_case):
+        if "c" + str(i) in cases_to_check:
+            cases.append("c" + str(i))
+            case_signs.append(get_sign (i-1, k_start))
+    if stage_timings is not None:
+        start = stage_timings.get_time ()
+    blocks = number_sequences.get_block (cases, k_start, k_end, case_signs, num)
+    nums = {}
+    for case in cases:
+        nums[int(case[1:]) - 1] = blocks[case]
+    num = int(blocks[cases[-1]][-1])
+
+    if stage_timings is not None:
+        stage_timings.add ('numbers', start)
+
+    masks = {}
+    if shared_primality_batch and walk_scan is None:
+        if stage_timings is not None:
+            start = stage_timings.get_time ()
+        masks = primality_batch.get_primality_masks (nums)
+        if stage_timings is not None:
+            stage_timings.add ('primality', start)
+
+    for tcid in sorted(nums):
+        # cases restored from the cache skip k they have already walked
+        skipped = max(get_next_k (tcid) - k_start, 0)
+        if skipped < len(nums[tcid]):
+            is_prime = masks.get(tcid)
+            if is_prime is not None:
+                is_prime = is_prime[skipped:]
+            if not run_periodic_case (tcid, cases, nums[tcid][skipped:], is_prime):
+                run_test_case_block (tcid, s, nums[tcid][skipped:], is_prime)
+
+def is_extrapolating ():
+    return enable_periodic_extrapolation and not enable_points_lifetime and not is_segments_used ()
+
+# Case with periodic numbers walks to the start of the cycle of its walk,
+# the rest of the walk up to max_num repeats the cycle - it is added as a
+# periodic tail of points and the walk state jumps to its end.
+# Returns False if the case has to be walked step by step.
+def run_periodic_case (tcid, cases, nums, is_prime):
+    if not is_extrapolating ():
+        return False
+    period = number_sequences.get_period ("c" + str(tcid + 1), cases)
+    if period is None or len(nums) < period:
+        return False
+    if is_prime is None:
+        is_prime = s.get_primality_mask (p, nums[:period])
+    cycle = s.get_walk_cycle (is_prime[:period], get_walk_state (tcid))
+    steps = max_num - get_next_k (tcid)
+    if cycle is None or steps < cycle[0] + 2 * cycle[1]:
+        return False
+    (start, length) = cycle
+    if start > 0:
+        run_test_case_block (tcid, s, np.resize(nums[:period], start), np.resize(is_prime[:period], start))
+
+    # the first cycle gives points of the tail and the move of every cycle
+    if stage_timings is not None:
+        time_started = stage_timings.get_time ()
+    state = get_walk_state (tcid)
+    cycle_mask = np.resize(is_prime[:period], length)
+    (xs, ys, zs, turns, cycle_state) = s.next_iterations_mask (cycle_mask, state)
+    displacement = (cycle_state[0] - state[0], cycle_state[1] - state[1], cycle_state[2] - state[2])
+    count = steps - start
+    (repeats, rest) = divmod(count, length)
+    end_state = s.next_iterations_mask (cycle_mask[:rest], state)[4]
+    moved = (repeats * displacement[0], repeats * displacement[1], repeats * displacement[2])
+    counted = (repeats * (cycle_state[8] - state[8]), repeats * (cycle_state[9] - state[9]), repeats * length)
+    set_walk_state (tcid, (end_state[0] + moved[0], end_state[1] + moved[1], end_state[2] + moved[2]) + end_state[3:8] + (end_state[8] + counted[0], end_state[9] + counted[1], end_state[10] + counted[2]))
+    num_current[tcid] = int(nums[(steps - 1) % period])
+
+    colors = np.where(turns, color_turn, color_no_turn)
+    points[tcid].set_period (xs, ys, zs, colors, displacement, count)
+    shape_stats[tcid].add_period (xs, ys, zs, turns, displacement, count)
+    if stage_timings is not None:
+        stage_timings.add ('walk', time_started, tcid)
+    return True
+
+def run_test_case_block (tcid, s, nums, is_prime):
+    num_current[tcid] = int(nums[-1])
+
+    if stage_timings is not None:
+        start = stage_timings.get_time ()
+    if walk_scan is not None:
+        (xs, ys, zs, turns, state) = walk_scan.next_iterations (nums, get_walk_state (tcid))
     else:
-        area = np.pi
-        fig = plt.figure(fig_id)
-        plt.clf()
-        plt.scatter(datax[data_id], datay[data_id], s=area, c=colors[data_id], alpha=0.2)
-        fig.suptitle(title, fontsize=10)
-
-    file_output += file_output_extension
-    plt.savefig(file_output)
-    plt.close(fig)
-
-def save_current_results (file_output_pickle):
-    global k_current, new_x, new_y, new_y, delta_x, delta_y, delta_z, num_current, datax, datay, dataz, colors, lifetime, is_previous_prime, sign, stats_primes, stats_nonprimes, stats_iterations
-    with open(file_output_pickle, 'wb') as f:
-        pickle.dump([k_current, new_x, new_y, new_z, delta_x, delta_y, delta_z, num_current, datax, datay, dataz, colors, lifetime, is_previous_prime, sign, stats_primes, stats_nonprimes, stats_iterations], f)
-
-def restore_previous_results (file_output_pickle):
-    global k_current, new_x, new_y, new_y, delta_x, delta_y, delta_z, num_current, datax, datay, dataz, colors, lifetime, is_previous_prime, sign, stats_primes, stats_nonprimes, stats_iterations
-    if os.path.exists(file_output_pickle):
-        with open(file_output_pickle, 'rb') as f:
-           k_current, new_x, new_y, new_z, delta_x, delta_y, delta_z, num_current, datax, datay, dataz, colors, lifetime, is_previous_prime, sign, stats_primes, stats_nonprimes, stats_iterations = pickle.load(f)
+        if is_prime is None:
+            is_prime = s.get_primality_mask (p, nums)
+            if stage_timings is not None:
+                stage_timings.add ('primality', start, tcid)
+                start = stage_timings.get_time ()
+        (xs, ys, zs, turns, state) = s.next_iterations_mask (is_prime, get_walk_state (tcid))
+    set_walk_state (tcid, state)
+    if stage_timings is not None:
+        stage_timings.add ('walk', start, tcid)
+        start = stage_timings.get_time ()
+
+    for i in range (len(nums)):
+        update_points (tcid, int(xs[i]), int(ys[i]), int(zs[i]), bool(turns[i]), enable_optimized_points_save, enable_points_lifetime)
+    if stage_timings is not None:
+        stage_timings.add ('points', start, tcid)
 
 def run_test_case (tcid, s):
     num_current[tcid] = num
 
+    if stage_timings is not None:
+        start = stage_timings.get_time ()
     (delta_x[tcid], delta_y[tcid], delta_z[tcid], sign[tcid], is_previous_prime[tcid], turn, stats_primes[tcid], stats_nonprimes[tcid], stats_iterations[tcid]) = s.next_iteration (p, num, is_previous_prime[tcid], delta_x[tcid], delta_y[tcid], delta_z[tcid], sign[tcid], stats_primes[tcid], stats_nonprimes[tcid], stats_iterations[tcid])
         
     new_x[tcid]+= delta_x[tcid]
     new_y[tcid]+= delta_y[tcid]
     new_z[tcid]+= delta_z[tcid]
+    if stage_timings is not None:
+        stage_timings.add ('walk', start, tcid)
+        start = stage_timings.get_time ()
 
     update_points (tcid, new_x[tcid], new_y[tcid], new_z[tcid], turn, enable_optimized_points_save, enable_points_lifetime)
+    if stage_timings is not None:
+        stage_timings.add ('points', start, tcid)
 
 def update_points (tcid, x, y, z, turn, is_optimized, is_lifetime):
-    global datax, datay, lifetime, colors
+    global points
     global lifetime_start
+    store = points[tcid]
+    stats = shape_stats[tcid]
     found = False
 
+    stats.add_step (x, y, z, turn)
+
     # if points have lifetime - update it and remove all expiring points
     if is_lifetime:
-        i = 0
-        indices_to_be_removed = []
-        for l in lifetime[tcid]:
-            if int(l) > 1:
-                lifetime[tcid][i] -= 1
-            # lifetime expired - mark point for removal
-            else:
-                indices_to_be_removed.append(i)
-            i += 1
-
-        # remove marked points
-        for j in indices_to_be_removed:
-            del datax[tcid][j]
-            del datay[tcid][j]
-            del dataz[tcid][j]
-            del lifetime[tcid][j]
-            del colors[tcid][j]
+        store.expire_lifetime ()
 
     # check if point is already on the list
-    if is_optimized:
-        k = 0
-        old_datax = datax[tcid]
-        old_datay = datay[tcid]
-        old_dataz = dataz[tcid]
-
-        for old_x in old_datax:
-            if old_x == x and old_datay[k] == y and old_dataz[k] == z:
-                found = True
-                # renew existing point lifetime
-                if is_lifetime:
-                    lifetime[tcid][k] = lifetime_start
-                break
-            k += 1
+    if is_optimized and not is_segments_used ():
+        slot = store.find (x, y, z)
+        if slot >= 0:
+            found = True
+            # renew existing point lifetime
+            if is_lifetime:
+                store.set_lifetime (slot, lifetime_start)
 
     # remember point if not found yet
     if not found:
-        datax[tcid].append(x)
-        datay[tcid].append(y)
-        dataz[tcid].append(z)
-        if is_lifetime:
-            lifetime[tcid].append(lifetime_start)
         if turn:
-            colors[tcid].append(color_turn)
+            color = color_turn
         else:
-            colors[tcid].append(color_no_turn)
-
-    # internal checks
-    if is_lifetime: 
-        if len(lifetime[tcid]) != len(datax[tcid]):
-            raise ("WrongLengthsOfStructures")
-        for l in lifetime[tcid]:
-            if int(l) < 1:
-                raise ("ExpiredPointOnTheList")
-    if len(datax[tcid]) != len(datay[tcid]):
-        raise ("WrongLengthsOfStructures")
-
-def write_stats_to_file ():
+            color = color_no_turn
+        if is_lifetime:
+            store.append (x, y, z, color, lifetime_start)
+        else:
+            store.append (x, y, z, color, 0)
+
+def write_checkpoint (k):
+    global k_current
+    perc_completed = str(int((k - first_num + 1) * 100 / (max_num - first_num + 1)))
+    print ("Checkpoint", k, "of total", max_num, "(" + perc_completed + "% completed)")
+
+    write_stats_to_file (k)
+
+    # save results collected so far
+    write_results_to_figures (figures_save_partial_results, perc_completed, k)
+    # next k to be walked
+    k_current = k + 1
+    save_current_results(file_output_checkpoint)
+    write_timings (k)
+
+# Rows of a worker start with k, they are merged with rows of other workers
+# by it (see merge_worker_results)
+def write_stats_to_file (k):
+    if stage_timings is not None:
+        start = stage_timings.get_time ()
     f = open(file_output_stats, "a+")
 
     for i in range (min_case, max_case):
@@ -342,115 +826,248 @@ def write_stats_to_file ():
             print ("    * Diff (x,y,z)   :", "(", diff_x, ",", diff_y, ",", diff_z, ")")
             print ("    * 2D Figure fill :", fill_2d, "%")
             print ("    * 3D Figure fill :", fill_3d, "%")
-            f.write (case + "," + str(stats_iterations[i-1]) + "," + str(stats_primes[i-1]) + "," + str(perc_primes) + "," + str(stats_nonprimes[i-1]) + "," + str(perc_nonprimes) + "\n")
+            stats = shape_stats[i-1]
+            visits = stats.get_visit_histogram (visit_histogram_buckets)
+            print ("    * Turns          :", stats.turns)
+            print ("    * Straight run   :", stats.longest_straight_run)
+            print ("    * 2D cells       :", stats.get_cells (), "visited", visits, "times (1, 2-3, 4-7...)")
+            row = [case, stats_iterations[i-1], stats_primes[i-1], perc_primes, stats_nonprimes[i-1], perc_nonprimes,
+                   get_points (i-1), stats.get_cells (), diff_x, diff_y, diff_z, fill_2d, fill_3d, stats.turns, stats.longest_straight_run] + visits
+            if worker_cases is not None:
+                row = [k] + row
+            f.write (",".join(str(value) for value in row) + "\n")
     f.close ()
+    if stage_timings is not None:
+        stage_timings.add ('stats', start)
+
+# iterations of all cases walked so far
+def get_iterations ():
+    iterations = 0
+    for i in range (min_case, max_case):
+        if "c" + str(i) in cases_to_check:
+            iterations += stats_iterations[i-1]
+    return iterations
+
+def write_timings (k):
+    if stage_timings is None:
+        return
+    store_points = {}
+    for i in range (min_case, max_case):
+        case = "c" + str(i)
+        if case in cases_to_check:
+            store_points[case] = get_points (i-1)
+    row = stage_timings.write (file_output_timings, k, get_iterations (), store_points)
+    print ("  Iterations per second:", row[2], "- run time:", row[1], "s, RSS:", row[-2], "MB")
 
 #############################################################
-# Main
+# Parallel execution
 #############################################################
 
-print ("Initialize objects...")
-p = primes.Primes(caching_primality_results)
-s = shapes.Shape()
-dp = dataprocessing.DataProcessing()
-print ("DONE")
-print ("Loading helper sets...")
-p.init_set(file_input_primes, True)
-p.init_set(file_input_nonprimes, False)
-print ("DONE")
-print ("Sorting primes...")
-p.sort_primes_set()
-print ("DONE")
-if continue_previous_calculations:
-    print ("Restoring previous results...")
-    restore_previous_results (file_output_pickle)
-    if k_current > 0:
-        min_num = k_current
-        k = k_current
-        print ("Resuming calculations at", min_num)
-    print ("DONE")
-
-# new calculations
-for k in range (min_num, max_num):
-
-    # case 1: subsequent odd numbers
-    if 'c1' in cases_to_check:
-        num = k*2 + 1
-        run_test_case (0, s)
-
-    # case 2: 6k+1
-    if 'c2' in cases_to_check:
-        num = k*2*3 + 1
-        run_test_case (1, s)
-
-    # case 3: 6k-1
-    if 'c3' in cases_to_check:
-        num = k*2*3 - 1
-        run_test_case (2, s)
-
-    # case 4: 6k+-1
-    if 'c4' in cases_to_check:
-        num = k*2*3 - 1*sign[3]
-        run_test_case (3, s)
-
-    # case 5: k
-    if 'c5' in cases_to_check:
-        num = k
-        run_test_case (4, s)
-
-    # case 6: 30k+1
-    if 'c6' in cases_to_check:
-        num = k*2*3*5 + 1
-        run_test_case (5, s)
-
-    # case 7: 30k-1
-    if 'c7' in cases_to_check:
-        num = k*2*3*5 - 1
-        run_test_case (6, s)
-
-    # case 8: 30k+-1
-    if 'c8' in cases_to_check:
-        num = k*2*3*5 - 1*sign[7]
-        run_test_case (7, s)
-
-    # case 9: sum of decimal digits is prime or not
-    if 'c9' in cases_to_check:
-        num = dp.get_sum_of_decimal_digits (k)
-        run_test_case (8, s)
-
-    # case 10: 1 and 2 only
-    if 'c10' in cases_to_check:
-        num = dp.get_next_num_from_set (num)
-        run_test_case (9, s)
-
-    # case 11: integer(10sin(k))
-    if 'c11' in cases_to_check:
-        num = int(10*math.sin(k))
-        run_test_case (10, s)
-
-    # case 12: random integer from 2,3,4,5,6,7,8,9 (4 primes, 4 non-primes)
-    if 'c12' in cases_to_check:
-        num = randint(2,9)
-        run_test_case (11, s)
-
-    # checkpoint - partial results
-    if (k - min_num) % checkpoint_value == 0:
-
-        perc_completed = str(int(k * 100 / max_num))
-        print ("Checkpoint", k, "of total", max_num, "(" + perc_completed + "% completed)")
-
-        write_stats_to_file ()
-        
-        # save results collected so far
-        write_results_to_figures (figures_save_partial_results, perc_completed, k)
-        k_current = k
-        save_current_results(file_output_pickle)
-
+def get_case_groups (cases, workers):
+    ordered = []
+    for i in range (min_case, max_case):
+        case = "c" + str(i)
+        if case in cases:
+            ordered.append(case)
+
+    # case 10 uses the number of the previous case (or of the last case
+    # from the previous iteration), so both of them have to be walked together
+    units = []
+    for case in ordered:
+        if case != 'c10' or get_number_source (case) is None:
+            units.append([case])
+    for unit in units:
+        if 'c10' in ordered and get_number_source ('c10') in unit:
+            unit.append('c10')
+
+    groups = []
+    for i in range (min(workers, len(units))):
+        groups.append([])
+    for i in range (len(units)):
+        groups[i % len(groups)].extend(units[i])
+    for group in groups:
+        group.sort(key=lambda case: int(case[1:]))
+    return groups
+
+def run_workers (groups):
+    workers = []
+    for group in groups:
+        print ("Starting worker for cases", ",".join(group))
+        workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), '--cases', ",".join(group)]))
+    for worker in workers:
+        if worker.wait() != 0:
+            raise RuntimeError("Worker failed with exit code " + str(worker.returncode))
+
+def merge_worker_results (groups):
+    global k_current
+    # checkpoints - every worker contributes the slots of its own cases
+    merged = {}
+    k_merged = None
+    for group in groups:
+        restore_previous_results (directory + "/objs_shape_" + "_".join(group))
+        if k_merged is None or k_current < k_merged:
+            k_merged = k_current
+        for case in group:
+            tcid = int(case[1:]) - 1
+            merged[tcid] = (get_walk_state (tcid), num_current[tcid], points[tcid], shape_stats[tcid])
+    for tcid in merged:
+        (state, num_current[tcid], points[tcid], shape_stats[tcid]) = merged[tcid]
+        set_walk_state (tcid, state)
+    k_current = k_merged
+    save_current_results (file_output_merged_checkpoint)
+
+    # statistics - every checkpoint of a worker writes a row of every case of
+    # its group, checkpoints are ordered by k (a worker writes the same k
+    # again after the last checkpoint or when it is resumed) and cases by number
+    checkpoints = {}
+    for group in groups:
+        file_stats = directory + "/objs_stats_" + "_".join(group) + ".csv"
+        with open(file_stats, 'r') as f:
+            lines = f.readlines()
+        written = {}
+        for first in range (0, len(lines), len(group)):
+            k_written = int(lines[first].split(",")[0])
+            written[k_written] = written.get(k_written, 0) + 1
+            for line in lines[first:first + len(group)]:
+                checkpoints.setdefault((k_written, written[k_written]), []).append(line.split(",", 1)[1])
+    with open(file_output_merged_stats, 'a+') as f:
+        for checkpoint_rows in [checkpoints[key] for key in sorted(checkpoints)]:
+            for line in sorted(checkpoint_rows, key=lambda line: int(line.split(",")[0][1:])):
+                f.write(line)
+
+    # timings
+    file_timings = [directory + "/objs_timings_" + "_".join(group) + ".csv" for group in groups]
+    if enable_timings:
+        cases = [case for group in groups for case in group]
+        timings.Timings(sorted(cases, key=lambda case: int(case[1:]))).merge (file_timings, file_output_merged_timings)
+
+    for group in groups:
+        for extension in (file_output_pickle_extension, file_output_log_extension):
+            if os.path.exists(directory + "/objs_shape_" + "_".join(group) + extension):
+                os.remove(directory + "/objs_shape_" + "_".join(group) + extension)
+        os.remove(directory + "/objs_stats_" + "_".join(group) + ".csv")
+    for file_name in file_timings:
+        if os.path.exists(file_name):
+            os.remove(file_name)
 
-# final results
-perc_completed = str(int(k * 100 / max_num))
-write_results_to_figures (figures_save_partial_results, perc_completed, k)
-write_stats_to_file ()
-k_current = max_num
-save_current_results(file_output_pickle)
+#############################################################
+# Main
+#############################################################
 
+# primes.Primes comes from the separate primes repository - it is imported
+# only when it is the primality provider
+def import_primes ():
+    global primes
+    sys.path.insert(0, '..\\primes\\')
+    import primes
+
+def main ():
+    global p, s, number_sequences, primality_batch, walk_scan, render_worker, result_cache, stage_timings, min_num, k, k_current, num
+
+    if number_of_workers > 1 and worker_cases is None:
+        groups = get_case_groups (cases_to_check, number_of_workers)
+        run_workers (groups)
+        print ("Merging results of workers...")
+        merge_worker_results (groups)
+        print ("DONE")
+        return
+
+    print ("Initialize objects...")
+    if primality_provider == 'sieve':
+        p = primality.SegmentedSieve()
+    elif primality_provider == 'bitset':
+        p = primality.PrimeBitset(file_input_bitset)
+    else:
+        import_primes ()
+        p = primes.Primes(caching_primality_results)
+    s = shapes.Shape()
+    number_sequences = sequences.Sequences(random_seed)
+    primality_batch = primality.PrimalityBatch(p)
+    if enable_timings:
+        stage_timings = timings.Timings([case for case in ["c" + str(i) for i in range (min_case, max_case)] if case in cases_to_check])
+    print ("DONE")
+    if primality_provider == 'primes':
+        print ("Loading helper sets...")
+        p.init_set(file_input_primes, True)
+        p.init_set(file_input_nonprimes, False)
+        print ("DONE")
+        print ("Sorting primes...")
+        p.sort_primes_set()
+        print ("DONE")
+    if walk_scan_processes > 0:
+        walk_scan = walkscan.WalkScan(p, walk_scan_processes)
+    if not compute_only:
+        import_rendering ()
+        if render_in_background:
+            render_worker = renderworker.RenderWorker(render_queue_size, not figures_save_partial_results)
+    if continue_previous_calculations:
+        print ("Restoring previous results...")
+        # worker starts from merged results of the previous parallel run
+        if is_checkpoint_saved (file_output_checkpoint):
+            restore_previous_results (file_output_checkpoint)
+        else:
+            restore_previous_results (file_output_merged_checkpoint)
+        if k_current > 0:
+            min_num = k_current
+            k = k_current
+            print ("Resuming calculations at", min_num)
+        print ("DONE")
+    if enable_result_cache:
+        print ("Restoring cached results...")
+        result_cache = resultcache.ResultCache(cache_directory)
+        restore_cached_results ()
+        print ("DONE")
+    if stage_timings is not None:
+        stage_timings.resume (get_iterations ())
+
+    # case 10 continues with the number used last in the previous iteration
+    for i in range (min_case, max_case):
+        if "c" + str(i) in cases_to_check and stats_iterations[i-1] > 0:
+            num = num_current[i-1]
+
+    # new calculations
+    if use_block_walk:
+        k = get_first_k ()
+        while k < max_num:
+            # blocks end at checkpoints so partial results are the same as in the step by step walk
+            k_end = min(k + block_size, max_num, k + (min_num - k) % checkpoint_value + 1)
+            run_block (k, k_end)
+            k = k_end - 1
+            if (k - min_num) % checkpoint_value == 0:
+                write_checkpoint (k)
+            # cases extrapolated to max_num are not walked any more
+            k = max(k_end, get_first_k ())
+        k = max_num - 1
+    else:
+        for k in range (get_first_k (), max_num):
+            for i in range (min_case, max_case):
+                case = "c" + str(i)
+                if case in cases_to_check:
+                    num = get_next_num (case, k, num, get_sign (i-1, k))
+                    # cases restored from the cache skip k they have already walked
+                    if k >= get_next_k (i-1):
+                        run_test_case (i-1, s)
+
+            # checkpoint - partial results
+            if (k - min_num) % checkpoint_value == 0:
+                write_checkpoint (k)
+
+    # final results
+    perc_completed = str(int((k - first_num + 1) * 100 / (max_num - first_num + 1)))
+    write_results_to_figures (figures_save_partial_results, perc_completed, k)
+    write_stats_to_file (k)
+    k_current = max_num
+    save_current_results(file_output_checkpoint)
+    write_timings (k)
+    if enable_result_cache:
+        save_cached_results ()
+    if walk_scan is not None:
+        walk_scan.close()
+    if render_worker is not None:
+        print ("Waiting for figures...")
+        render_worker.close()
+        print ("DONE")
+
+# worker processes of the walk scan import this script again
+if __name__ == '__main__':
+    main ()
@@ -0,0 +1,58 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+import os
+import sys
+import pointstream
+import rendering
+
+#############################################################
+# Settings - configuration
+#############################################################
+
+# Directory with point streams (*.pts) written by primes-figure.py with
+# compute_only = True - figures are written next to the streams
+directory = "results/1000000"
+
+#############################################################
+# Main
+#############################################################
+
+# usage: primes-render.py [directory or point streams...]
+file_streams = []
+for argument in sys.argv[1:] or [directory]:
+    if os.path.isdir(argument):
+        for file_name in sorted(os.listdir(argument)):
+            if file_name.endswith(".pts"):
+                file_streams.append(os.path.join(argument, file_name))
+    else:
+        file_streams.append(argument)
+
+r = rendering.Rendering()
+for file_stream in file_streams:
+    print ("Drawing figures of", file_stream, "...")
+    r.write_figures (pointstream.PointStream(file_stream).read ())
+print ("DONE")
@@ -0,0 +1,216 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+import numpy as np
+import tiles
+import segments
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
+
+class Rendering:
+
+    # Cells of the grid covering the bounding box of points: the longer side
+    # gets at most size cells, a cell is never smaller than a single point
+    def get_grid_shape (self, bounds, size):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        diff_x = max_x - min_x + 1
+        diff_y = max_y - min_y + 1
+        scale = min(1.0, size / max(diff_x, diff_y))
+        return (max(1, int(np.ceil(diff_x * scale))), max(1, int(np.ceil(diff_y * scale))))
+
+    # Number of points and the highest color in every cell of the grid
+    #   o blocks - (x, y, z, colors) of all points, see PointStore.get_blocks
+    def get_occupancy_grid (self, blocks, bounds, size):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        (width, height) = self.get_grid_shape (bounds, size)
+        # segments are counted in the grid without expanding them
+        if isinstance(blocks, segments.SegmentBlocks):
+            return blocks.store.get_occupancy_grid (bounds, width, height)
+        counts = np.zeros(width * height, dtype=np.int64)
+        max_colors = np.zeros(width * height, dtype=np.int64)
+        for (x, y, z, c) in blocks:
+            if len(x) == 0:
+                continue
+            column = (x.astype(np.int64) - min_x) * width // (max_x - min_x + 1)
+            row = (y.astype(np.int64) - min_y) * height // (max_y - min_y + 1)
+            cells = row * width + column
+            counts += np.bincount(cells, minlength=width * height)
+            np.maximum.at(max_colors, cells, c.astype(np.int64))
+        return (counts.reshape(height, width), max_colors.reshape(height, width))
+
+    # Image of the grid - color of a cell is either the color of its points
+    # (colors) or the number of points in it (density); empty cells are white
+    #   o max_count - count with the darkest color, by default the highest count
+    def get_grid_image (self, counts, max_colors, color_mode, min_color, max_color, max_count = None):
+        if color_mode == 'density':
+            values = np.log1p(counts)
+            if max_count is None:
+                max_count = counts.max()
+            norm = plt.Normalize(0, max(float(np.log1p(max_count)), 1.0))
+        else:
+            values = max_colors
+            norm = plt.Normalize(min_color, max_color)
+        image = plt.get_cmap()(norm(values))
+        image[counts == 0] = (1.0, 1.0, 1.0, 1.0)
+        return image
+
+    def write_raster_figure (self, fig_id, title, file_output, blocks, bounds, size, color_mode, min_color, max_color):
+        (counts, max_colors) = self.get_occupancy_grid (blocks, bounds, size)
+        image = self.get_grid_image (counts, max_colors, color_mode, min_color, max_color)
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        fig = plt.figure(fig_id)
+        plt.clf()
+        plt.imshow(image, origin='lower', interpolation='nearest', extent=(min_x - 0.5, max_x + 0.5, min_y - 0.5, max_y + 0.5))
+        fig.suptitle(title, fontsize=10)
+        plt.savefig(file_output)
+        plt.close(fig)
+
+    # Points snapped to voxels of the given size along x, y and z: centre of
+    # points and number of points of every occupied voxel
+    def get_voxels (self, blocks, bounds, voxel_size):
+        (indices, sums, counts) = self.get_voxel_sums (blocks, bounds, voxel_size)
+        return (sums / counts[:, None], counts)
+
+    # Indices (i_x, i_y, i_z) of occupied voxels of the given size, sums of
+    # coordinates and numbers of their points - voxels are packed into int64
+    # keys, so points are merged by 1D unique and bincount
+    def get_voxel_sums (self, blocks, bounds, voxel_size):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        (size_x, size_y, size_z) = voxel_size
+        shape = self.get_voxel_grid_shape (bounds, voxel_size)
+        parts = []
+        for (x, y, z, c) in blocks:
+            if len(x) == 0:
+                continue
+            keys = np.ravel_multi_index(((x.astype(np.int64) - min_x) // size_x, (y.astype(np.int64) - min_y) // size_y, (z.astype(np.int64) - min_z) // size_z), shape)
+            points = np.stack([x, y, z], axis=1).astype(np.float64)
+            parts.append(self.get_key_sums (keys, points, np.ones(len(x), dtype=np.int64)))
+        if len(parts) == 0:
+            return ((np.zeros(0, dtype=np.int64),) * 3, np.zeros((0, 3)), np.zeros(0, dtype=np.int64))
+
+        # voxels of different blocks are merged
+        (keys, sums, counts) = self.get_key_sums (np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]), np.concatenate([part[2] for part in parts]))
+        return (np.unravel_index(keys, shape), sums, counts)
+
+    def get_voxel_grid_shape (self, bounds, voxel_size):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        extents = (max_x - min_x + 1, max_y - min_y + 1, max_z - min_z + 1)
+        return tuple(-(-extent // size) for (extent, size) in zip(extents, voxel_size))
+
+    # Distinct keys with sums of rows of sums and of counts of their entries
+    def get_key_sums (self, keys, sums, counts):
+        (keys, inverse) = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        merged_sums = np.stack([np.bincount(inverse, weights=sums[:, axis], minlength=len(keys)) for axis in range(3)], axis=1)
+        merged_counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+        return (keys, merged_sums, merged_counts)
+
+    # Representative points of at most max_points voxels - voxels are cubes,
+    # an axis shorter than their side is a single voxel. Points are snapped
+    # once to fine voxels (a few times more of them than max_points), the
+    # largest cubes that fit are merged from the fine voxels only: their
+    # side is doubled first, then bisected.
+    def get_level_of_detail (self, blocks, bounds, points, max_points):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        extents = (max_x - min_x + 1, max_y - min_y + 1, max_z - min_z + 1)
+        def get_voxel_size (side):
+            return tuple(min(extent, side) for extent in extents)
+
+        side = max(1, points // (8 * max_points))
+        # keys of voxels have to fit in int64
+        while np.prod([float(size) for size in self.get_voxel_grid_shape (bounds, get_voxel_size (side))]) >= 2.0**62:
+            side *= 2
+        fine_size = get_voxel_size (side)
+        (indices, sums, counts) = self.get_voxel_sums (blocks, bounds, fine_size)
+        if len(counts) <= max_points:
+            return (sums / counts[:, None], counts, fine_size)
+
+        def merge (side):
+            voxel_size = get_voxel_size (side)
+            coarse = tuple(index * fine // size for (index, fine, size) in zip(indices, fine_size, voxel_size))
+            keys = np.ravel_multi_index(coarse, self.get_voxel_grid_shape (bounds, voxel_size))
+            (keys, merged_sums, merged_counts) = self.get_key_sums (keys, sums, counts)
+            return (merged_sums / merged_counts[:, None], merged_counts, voxel_size)
+
+        # more than max_points voxels of side low, at most of side high
+        (low, high) = (side, min(2 * side, max(extents)))
+        result = merge (high)
+        while len(result[1]) > max_points:
+            (low, high) = (high, min(2 * high, max(extents)))
+            result = merge (high)
+        while high - low > 1:
+            middle = (low + high) // 2
+            middle_result = merge (middle)
+            if len(middle_result[1]) <= max_points:
+                (high, result) = (middle, middle_result)
+            else:
+                low = middle
+        return result
+
+    def write_voxel_figure (self, fig_id, title, file_output, blocks, bounds, points, max_points):
+        (centres, counts, voxel_size) = self.get_level_of_detail (blocks, bounds, points, max_points)
+        fig = plt.figure(fig_id)
+        ax = fig.add_subplot(111, projection='3d')
+        # color shows how many points are in the voxel
+        ax.scatter(centres[:, 0], centres[:, 1], centres[:, 2], c=np.log1p(counts), marker='o')
+        fig.suptitle(title + " voxel=" + "x".join(str(size) for size in voxel_size), fontsize=10)
+        plt.savefig(file_output)
+        plt.close(fig)
+
+    def write_scatter_figure (self, fig_id, title, file_output, blocks, bounds, min_color, max_color):
+        area = np.pi
+        fig = plt.figure(fig_id)
+        plt.clf()
+        # spilled points are drawn block by block, with the same color scale
+        for (x, y, z, c) in blocks:
+            plt.scatter(x, y, s=area, c=c, vmin=min_color, vmax=max_color, alpha=0.2)
+        fig.suptitle(title, fontsize=10)
+        plt.savefig(file_output)
+        plt.close(fig)
+
+    def write_scatter_3d_figure (self, fig_id, title, file_output, blocks, bounds, min_color, max_color):
+        fig = plt.figure(fig_id)
+        ax = fig.add_subplot(111, projection='3d')
+        for (x, y, z, c) in blocks:
+            ax.scatter(x, y, z, c=c, vmin=min_color, vmax=max_color, marker='o')
+        plt.savefig(file_output)
+        plt.close(fig)
+
+    # Tiles of the pyramid are drawn like raster figures, each tile is a
+    # separate PNG in the directory file_output
+    def write_tile_pyramid (self, fig_id, title, file_output, blocks, bounds, tile_size, color_mode, min_color, max_color):
+        def write_tile (file_name, counts, max_colors, max_count):
+            image = self.get_grid_image (counts, max_colors, color_mode, min_color, max_color, max_count)
+            # first row of the PNG is the top of the tile
+            plt.imsave(file_name, image[::-1])
+        tiles.TilePyramid(tile_size).write (file_output, title, blocks, bounds, write_tile)
+
+    # Figures given as (method, fig_id, title, file_output, store, args) -
+    # points of the store are drawn by the method, args follow its bounds
+    def write_figures (self, figures):
+        for (method, fig_id, title, file_output, store, args) in figures:
+            getattr(self, method) (fig_id, title, file_output, store.get_blocks(), store.get_bounds(), *args)
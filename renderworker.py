@@ -0,0 +1,96 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+
+import multiprocessing
+import queue
+import rendering
+
+# Loop of the render process - figures of every job are drawn until None
+# is received
+def run_jobs (jobs):
+    r = rendering.Rendering()
+    while True:
+        figures = jobs.get()
+        if figures is None:
+            return
+        r.write_figures (figures)
+
+class RenderWorker:
+
+    # Figures are drawn in a separate process, so the walk goes on while they
+    # are drawn
+    #   o queue_size - number of jobs waiting for the render process
+    #   o is_coalescing - when the queue is full, the oldest waiting job is
+    #     dropped (the new one draws the same figures again) instead of
+    #     waiting for the render process
+    def __init__ (self, queue_size = 1, is_coalescing = True):
+        self.jobs = multiprocessing.Queue(queue_size)
+        # figures waiting when the walk fails are dropped - otherwise exit
+        # would wait for the render process, which is already terminated
+        self.jobs.cancel_join_thread()
+        self.is_coalescing = is_coalescing
+        self.dropped = 0
+        self.process = multiprocessing.Process(target=run_jobs, args=(self.jobs,))
+        # render process does not outlive the walk if the walk fails
+        self.process.daemon = True
+        self.process.start()
+
+    # Figures as in Rendering.write_figures - their points are snapshotted,
+    # so points added later do not change the job
+    def submit (self, figures):
+        self.check ()
+        snapshots = {}
+        job = []
+        for (method, fig_id, title, file_output, store, args) in figures:
+            if id(store) not in snapshots:
+                snapshots[id(store)] = store.get_snapshot ()
+            job.append((method, fig_id, title, file_output, snapshots[id(store)], args))
+
+        while self.is_coalescing:
+            try:
+                self.jobs.put_nowait(job)
+                return
+            except queue.Full:
+                try:
+                    self.jobs.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    # render process has just taken the waiting job
+                    pass
+        self.jobs.put(job)
+
+    def check (self):
+        if not self.process.is_alive() and self.process.exitcode != 0:
+            raise RuntimeError("Render process failed with exit code " + str(self.process.exitcode))
+
+    # Waits until all submitted figures are drawn
+    def close (self):
+        self.check ()
+        self.jobs.put(None)
+        self.process.join()
+        self.check ()
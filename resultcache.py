@@ -0,0 +1,81 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+import hashlib
+import os
+import checkpoint
+
+# Changes of the walk that make cached results invalid bump the version
+cache_version = 2
+
+class ResultCache:
+
+    # Results of a case are stored under a key made of the case definition,
+    # every file holds the walk state and all points after the walk of k
+    # from the first one up to (excluding) the k in the file name
+    def __init__ (self, directory):
+        self.directory = directory
+
+    def get_case_directory (self, definition):
+        key = hashlib.sha1((str(cache_version) + ";" + definition).encode()).hexdigest()
+        return os.path.join(self.directory, key)
+
+    def get_file_name (self, definition, k):
+        return os.path.join(self.get_case_directory (definition), str(k) + ".log")
+
+    # the largest cached k not greater than k_max, None if nothing is cached
+    def find (self, definition, k_max):
+        case_directory = self.get_case_directory (definition)
+        if not os.path.exists(case_directory):
+            return None
+        best = None
+        for file_name in os.listdir(case_directory):
+            if file_name.endswith(".log"):
+                k = int(file_name[:-len(".log")])
+                if k <= k_max and (best is None or k > best):
+                    best = k
+        return best
+
+    # walk state of the case, its points are added to the store
+    def restore (self, definition, k, store):
+        log = checkpoint.CheckpointLog(self.get_file_name (definition, k))
+        (k_cached, states) = log.restore ()
+        log.read_points (0, store)
+        return states[0]
+
+    def save (self, definition, k, state, store):
+        case_directory = self.get_case_directory (definition)
+        if not os.path.exists(case_directory):
+            os.makedirs(case_directory)
+            with open(os.path.join(case_directory, "definition.txt"), 'w') as f:
+                f.write(definition + "\n")
+        file_name = self.get_file_name (definition, k)
+        if os.path.exists(file_name):
+            return
+        # written under a temporary name, so other runs never see a partial file
+        checkpoint.CheckpointLog(file_name + ".tmp").save (k, [state], [store])
+        os.replace(file_name + ".tmp", file_name)
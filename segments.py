@@ -0,0 +1,285 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+
+import numpy as np
+
+segment_columns = ('x', 'y', 'z', 'dx', 'dy', 'dz', 'length', 'first_colors', 'colors')
+
+# Segments are expanded to points in chunks of about this many points
+chunk_points = 1 << 20
+
+# Points of segments expanded chunk by chunk every time they are iterated,
+# like PointStore.get_blocks
+class SegmentBlocks:
+
+    def __init__ (self, store):
+        self.store = store
+
+    def __iter__ (self):
+        for (first, last) in self.store.get_chunks ():
+            yield self.store.expand (first, last)
+
+class SegmentStore:
+
+    # Walk kept as straight segments instead of single points - a segment
+    # starts at point (x, y, z) and goes length points in direction
+    # (dx, dy, dz); its first point has color first_colors, the rest colors.
+    # Memory depends on number of turns, not on number of points.
+    def __init__ (self, capacity = 1024):
+        self.count = 0
+        self.points = 0
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.z = np.zeros(capacity, dtype=np.int32)
+        self.dx = np.zeros(capacity, dtype=np.int32)
+        self.dy = np.zeros(capacity, dtype=np.int32)
+        self.dz = np.zeros(capacity, dtype=np.int32)
+        self.length = np.zeros(capacity, dtype=np.int32)
+        self.first_colors = np.zeros(capacity, dtype=np.uint8)
+        self.colors = np.zeros(capacity, dtype=np.uint8)
+        # segments are never changed other than by appending points
+        self.version = 0
+
+    def __len__ (self):
+        return self.points
+
+    def __getstate__ (self):
+        state = {}
+        for name in segment_columns:
+            state[name] = getattr(self, name)[:self.count]
+        return state
+
+    def __setstate__ (self, state):
+        self.__init__ (max(len(state['x']), 1))
+        self.set_segments (0, state)
+
+    def get_segment_count (self):
+        return self.count
+
+    def get_segment_column (self, name, start = 0):
+        return getattr(self, name)[start:self.count]
+
+    # Replaces segments from the first one on with the given columns
+    def set_segments (self, first, columns):
+        n = len(columns['x'])
+        self.reserve (first + n)
+        for name in segment_columns:
+            getattr(self, name)[first:first + n] = columns[name]
+        self.count = first + n
+        self.points = int(self.length[:self.count].sum())
+
+    def reserve (self, capacity):
+        if capacity <= len(self.x):
+            return
+        # amortized doubling
+        capacity = max(capacity, 2 * len(self.x))
+        for name in segment_columns:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            setattr(self, name, grown)
+
+    # Point continues the last segment if it is the next point in its
+    # direction and has its color, otherwise it starts a new segment;
+    # the second point of a segment sets its direction
+    def append (self, x, y, z, color, lifetime = 0):
+        if lifetime != 0:
+            raise ValueError("Points with lifetime cannot be kept in segments")
+        self.points += 1
+        last = self.count - 1
+        if last >= 0:
+            length = int(self.length[last])
+            if length == 1:
+                self.dx[last] = x - self.x[last]
+                self.dy[last] = y - self.y[last]
+                self.dz[last] = z - self.z[last]
+                self.colors[last] = color
+                self.length[last] = 2
+                return
+            if color == self.colors[last] and x == self.x[last] + length * self.dx[last] and y == self.y[last] + length * self.dy[last] and z == self.z[last] + length * self.dz[last]:
+                self.length[last] = length + 1
+                return
+
+        if self.count == len(self.x):
+            self.reserve (self.count + 1)
+        segment = self.count
+        (self.x[segment], self.y[segment], self.z[segment]) = (x, y, z)
+        (self.dx[segment], self.dy[segment], self.dz[segment]) = (0, 0, 0)
+        self.length[segment] = 1
+        self.first_colors[segment] = color
+        self.colors[segment] = color
+        self.count += 1
+
+    def extend (self, xs, ys, zs, colors, lifetimes):
+        for (x, y, z, color, lifetime) in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist(), np.asarray(zs).tolist(), np.asarray(colors).tolist(), np.asarray(lifetimes).tolist()):
+            self.append (x, y, z, color, lifetime)
+
+    # Points (x, y, z, colors) of segments from first to last (excluding)
+    def expand (self, first = 0, last = None):
+        if last is None:
+            last = self.count
+        length = self.length[first:last].astype(np.int64)
+        segment = np.repeat(np.arange(first, last), length)
+        offsets = np.arange(int(length.sum())) - np.repeat(np.cumsum(length) - length, length)
+        x = self.x[segment] + offsets * self.dx[segment]
+        y = self.y[segment] + offsets * self.dy[segment]
+        z = self.z[segment] + offsets * self.dz[segment]
+        colors = np.where(offsets == 0, self.first_colors[segment], self.colors[segment])
+        return (x.astype(np.int32), y.astype(np.int32), z.astype(np.int32), colors.astype(np.uint8))
+
+    def get_blocks (self):
+        return SegmentBlocks(self)
+
+    # Segments (first, last) of every chunk of points given by get_blocks
+    def get_chunks (self):
+        ends = np.cumsum(self.length[:self.count].astype(np.int64))
+        chunks = []
+        first = 0
+        while first < self.count:
+            done = int(ends[first - 1]) if first > 0 else 0
+            # at least one segment in every chunk
+            last = max(first + 1, int(np.searchsorted(ends, done + chunk_points, 'right')))
+            chunks.append((first, last))
+            first = last
+        return chunks
+
+    def get_x (self):
+        return self.expand ()[0]
+
+    def get_y (self):
+        return self.expand ()[1]
+
+    def get_z (self):
+        return self.expand ()[2]
+
+    def get_colors (self):
+        return self.expand ()[3]
+
+    def get_lifetime (self):
+        return np.zeros(self.points, dtype=np.int32)
+
+    # (min_x, max_x, min_y, max_y, min_z, max_z) of all points - from ends
+    # of segments
+    def get_bounds (self):
+        if self.count == 0:
+            return None
+        bounds = []
+        steps = self.length[:self.count].astype(np.int64) - 1
+        for name in ('x', 'y', 'z'):
+            start = getattr(self, name)[:self.count].astype(np.int64)
+            end = start + steps * getattr(self, 'd' + name)[:self.count]
+            bounds += [int(min(start.min(), end.min())), int(max(start.max(), end.max()))]
+        return tuple(bounds)
+
+    def get_snapshot (self):
+        snapshot = SegmentStore(max(self.count, 1))
+        snapshot.set_segments (0, self.__getstate__ ())
+        return snapshot
+
+    # Number of points and the highest color in every cell of a width x
+    # height grid over bounds - cells are mapped as in
+    # Rendering.get_occupancy_grid, but segments are not expanded
+    def get_occupancy_grid (self, bounds, width, height):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        counts = np.zeros((height, width), dtype=np.int64)
+        max_colors = np.zeros((height, width), dtype=np.int64)
+        n = self.count
+        # first point of every segment and the rest of it are drawn separately,
+        # as they have different colors
+        length = self.length[:n].astype(np.int64)
+        heads = (self.x[:n].astype(np.int64), self.y[:n].astype(np.int64), np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64), np.ones(n, dtype=np.int64), self.first_colors[:n].astype(np.int64))
+        is_tail = length > 1
+        dx = self.dx[:n][is_tail].astype(np.int64)
+        dy = self.dy[:n][is_tail].astype(np.int64)
+        tails = (self.x[:n][is_tail] + dx, self.y[:n][is_tail] + dy, dx, dy, length[is_tail] - 1, self.colors[:n][is_tail].astype(np.int64))
+        for (x, y, dx, dy, length, colors) in (heads, tails):
+            self.add_runs (counts, max_colors, bounds, x, y, dx, dy, length, colors)
+        return (counts, max_colors)
+
+    # Runs of points from (x, y) in direction (dx, dy) added to the grid
+    def add_runs (self, counts, max_colors, bounds, x, y, dx, dy, length, colors):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        (height, width) = counts.shape
+        diff_x = max_x - min_x + 1
+        diff_y = max_y - min_y + 1
+        end_x = x + (length - 1) * dx
+        end_y = y + (length - 1) * dy
+        is_single = (dx == 0) & (dy == 0)
+        is_horizontal = (dy == 0) & ~is_single
+        is_vertical = (dx == 0) & ~is_single
+        # runs in other directions are not made by the walk - expanded to points
+        is_other = ~(is_single | is_horizontal | is_vertical)
+
+        # run staying in a single point
+        rows = (y[is_single] - min_y) * height // diff_y
+        columns = (x[is_single] - min_x) * width // diff_x
+        np.add.at(counts, (rows, columns), length[is_single])
+        np.maximum.at(max_colors, (rows, columns), colors[is_single])
+
+        # vertical runs are horizontal runs of the transposed grid
+        h = is_horizontal
+        self.add_row_runs (counts, max_colors, np.minimum(x, end_x)[h] - min_x, np.maximum(x, end_x)[h] - min_x, diff_x, (y[h] - min_y) * height // diff_y, colors[h])
+        v = is_vertical
+        self.add_row_runs (counts.T, max_colors.T, np.minimum(y, end_y)[v] - min_y, np.maximum(y, end_y)[v] - min_y, diff_y, (x[v] - min_x) * width // diff_x, colors[v])
+
+        for i in np.flatnonzero(is_other).tolist():
+            offsets = np.arange(length[i])
+            rows = (y[i] + offsets * dy[i] - min_y) * height // diff_y
+            columns = (x[i] + offsets * dx[i] - min_x) * width // diff_x
+            np.add.at(counts, (rows, columns), 1)
+            np.maximum.at(max_colors, (rows, columns), colors[i])
+
+    # Runs of points with offsets lo to hi (of span offsets) in rows of the
+    # grid - a cell of a row covers offsets from get_cell_start(cell) on
+    def add_row_runs (self, counts, max_colors, lo, hi, span, rows, colors):
+        columns = counts.shape[1]
+        first = lo * columns // span
+        last = hi * columns // span
+        # first and last cell of the run are partly covered
+        is_one_cell = first == last
+        np.add.at(counts, (rows, first), np.where(is_one_cell, hi - lo + 1, self.get_cell_start (first + 1, span, columns) - lo))
+        np.add.at(counts, (rows, last), np.where(is_one_cell, 0, hi - self.get_cell_start (last, span, columns) + 1))
+        np.maximum.at(max_colors, (rows, first), colors)
+        np.maximum.at(max_colors, (rows, last), colors)
+
+        # cells between them are fully covered - marked in a difference
+        # array along rows, separately for every color
+        has_inner = last - first > 1
+        cell_sizes = self.get_cell_start (np.arange(1, columns + 1), span, columns) - self.get_cell_start (np.arange(columns), span, columns)
+        for color in np.unique(colors[has_inner]).tolist():
+            selected = has_inner & (colors == color)
+            covered = np.zeros((counts.shape[0], columns + 1), dtype=np.int64)
+            np.add.at(covered, (rows[selected], first[selected] + 1), 1)
+            np.add.at(covered, (rows[selected], last[selected]), -1)
+            covered = np.cumsum(covered, axis=1)[:, :columns]
+            counts += covered * cell_sizes
+            max_colors[covered > 0] = np.maximum(max_colors[covered > 0], color)
+
+    # the first offset falling into the cell
+    def get_cell_start (self, cell, span, cells):
+        return (cell * span + cells - 1) // cells
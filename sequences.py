@@ -0,0 +1,215 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+import numpy as np
+import dataprocessing
+
+# Random numbers are drawn in chunks of k - every chunk has its own generator
+# seeded with (seed, chunk), so numbers of k do not depend on blocks the
+# walk is split into
+random_chunk = 1 << 16
+
+class Sequences:
+
+    # Number sources of cases - every generator gives numbers of a whole
+    # block of k at once: generator (ks, signs, previous), where
+    #   o ks - array of k
+    #   o signs - sign of the case at every k, it alternates from k to k
+    #   o previous - number used just before every k by the previous case,
+    #     given only to generators added with is_chained
+    #   o period - numbers repeat after so many k, None if they do not; a
+    #     chained generator with a period depends only on previous numbers
+    #     and repeats after period k when it uses its own numbers
+    #   o seed - seed of random numbers, None - different in every run
+    def __init__ (self, seed = None):
+        self.dp = dataprocessing.DataProcessing()
+        self.seed = seed
+        self.random_chunks = {}
+        self.generators = {}
+        self.chained = set()
+        self.periods = {}
+        self.add_sequence ('c1', self.get_odd)
+        self.add_sequence ('c2', self.get_6k_plus_1)
+        self.add_sequence ('c3', self.get_6k_minus_1)
+        self.add_sequence ('c4', self.get_6k_plus_minus_1)
+        self.add_sequence ('c5', self.get_k)
+        self.add_sequence ('c6', self.get_30k_plus_1)
+        self.add_sequence ('c7', self.get_30k_minus_1)
+        self.add_sequence ('c8', self.get_30k_plus_minus_1)
+        self.add_sequence ('c9', self.get_sum_of_decimal_digits)
+        self.add_sequence ('c10', self.get_from_set, True, 2)
+        self.add_sequence ('c11', self.get_sin)
+        self.add_sequence ('c12', self.get_random)
+
+    def add_sequence (self, case, generator, is_chained = False, period = None):
+        self.generators[case] = generator
+        self.periods[case] = period
+        if is_chained:
+            self.chained.add(case)
+        else:
+            self.chained.discard(case)
+
+    # Number of k after which numbers of the case repeat when the given cases
+    # are walked, None if they are not periodic - a chained case repeats with
+    # the case it uses
+    def get_period (self, case, cases):
+        used = []
+        while case in self.chained:
+            if self.periods[case] is None:
+                return None
+            source = cases[cases.index(case) - 1]
+            if source == case:
+                return self.periods[case]
+            if source in used:
+                return None
+            used.append(case)
+            case = source
+        return self.periods.get(case)
+
+    # case 1: subsequent odd numbers
+    def get_odd (self, ks, signs, previous):
+        return ks*2 + 1
+
+    # case 2: 6k+1
+    def get_6k_plus_1 (self, ks, signs, previous):
+        return ks*2*3 + 1
+
+    # case 3: 6k-1
+    def get_6k_minus_1 (self, ks, signs, previous):
+        return ks*2*3 - 1
+
+    # case 4: 6k+-1
+    def get_6k_plus_minus_1 (self, ks, signs, previous):
+        return ks*2*3 - signs
+
+    # case 5: k
+    def get_k (self, ks, signs, previous):
+        return ks.copy()
+
+    # case 6: 30k+1
+    def get_30k_plus_1 (self, ks, signs, previous):
+        return ks*2*3*5 + 1
+
+    # case 7: 30k-1
+    def get_30k_minus_1 (self, ks, signs, previous):
+        return ks*2*3*5 - 1
+
+    # case 8: 30k+-1
+    def get_30k_plus_minus_1 (self, ks, signs, previous):
+        return ks*2*3*5 - signs
+
+    # case 9: sum of decimal digits is prime or not
+    def get_sum_of_decimal_digits (self, ks, signs, previous):
+        return self.dp.get_sums_of_decimal_digits (ks)
+
+    # case 10: 1 and 2 only
+    def get_from_set (self, ks, signs, previous):
+        return self.dp.get_next_nums_from_set (previous)
+
+    # case 11: integer(10sin(k))
+    def get_sin (self, ks, signs, previous):
+        return np.trunc(10*np.sin(ks.astype(np.float64))).astype(np.int64)
+
+    # case 12: random integer from 2,3,4,5,6,7,8,9 (4 primes, 4 non-primes)
+    def get_random (self, ks, signs, previous):
+        if self.seed is None:
+            return np.random.default_rng().integers(2, 10, size=len(ks))
+        numbers = np.empty(len(ks), dtype=np.int64)
+        chunks = ks // random_chunk
+        for chunk in np.unique(chunks).tolist():
+            selected = chunks == chunk
+            numbers[selected] = self.get_random_chunk (chunk)[ks[selected] - chunk * random_chunk]
+        return numbers
+
+    def get_random_chunk (self, chunk):
+        if chunk not in self.random_chunks:
+            # only the last chunk is kept, the walk goes through k in order
+            self.random_chunks = {}
+            self.random_chunks[chunk] = np.random.default_rng([self.seed, chunk]).integers(2, 10, size=random_chunk)
+        return self.random_chunks[chunk]
+
+    # Sign at every k from k_start to k_end (excluding) - like
+    # Shape.next_sign it alternates between 1 and -1, any other sign at
+    # k_start is followed by 1
+    def get_signs (self, k_start, k_end, sign):
+        signs = np.where(np.arange(k_end - k_start) % 2 == 0, -1, 1)
+        if sign == 1:
+            signs = -signs
+        signs[:1] = sign
+        return signs
+
+    # Numbers of the case for k from k_start to k_end (excluding)
+    #   o sign - sign of the case at k_start
+    #   o previous - numbers used before every k, for chained cases only
+    def get_numbers (self, case, k_start, k_end, sign, previous = None):
+        ks = np.arange(k_start, k_end, dtype=np.int64)
+        if previous is not None:
+            previous = np.asarray(previous, dtype=np.int64)
+        return np.asarray(self.generators[case] (ks, self.get_signs (k_start, k_end, sign), previous), dtype=np.int64)
+
+    # Numbers of all cases for k from k_start to k_end (excluding), in the
+    # order of the step by step walk - a chained case uses the number of the
+    # case before it, the first case the number of the last one at the
+    # previous k
+    #   o cases - cases in the order of the walk
+    #   o signs - sign of every case at k_start
+    #   o num - number of the last case just before k_start
+    # Returns dictionary: case -> array of numbers.
+    def get_block (self, cases, k_start, k_end, signs, num):
+        blocks = {}
+        for i in range (len(cases)):
+            if cases[i] not in self.chained:
+                blocks[cases[i]] = self.get_numbers (cases[i], k_start, k_end, signs[i])
+        for i in range (len(cases)):
+            if cases[i] not in self.chained:
+                continue
+            if i > 0:
+                previous = blocks[cases[i-1]]
+            elif cases[-1] in blocks:
+                previous = np.concatenate(([num], blocks[cases[-1]][:-1]))
+            elif len(cases) == 1 and self.periods[cases[0]] is not None:
+                # a case using its own numbers repeats them after its period
+                first = self.get_block_step_by_step (cases, k_start, min(k_start + self.periods[cases[0]], k_end), signs, num)
+                return {cases[0]: np.resize(first[cases[0]], k_end - k_start)}
+            else:
+                # the first case depends on a chained last case at the
+                # previous k - numbers are made k by k
+                return self.get_block_step_by_step (cases, k_start, k_end, signs, num)
+            blocks[cases[i]] = self.get_numbers (cases[i], k_start, k_end, signs[i], previous)
+        return blocks
+
+    def get_block_step_by_step (self, cases, k_start, k_end, signs, num):
+        blocks = {}
+        case_signs = []
+        for i in range (len(cases)):
+            blocks[cases[i]] = np.empty(k_end - k_start, dtype=np.int64)
+            case_signs.append(self.get_signs (k_start, k_end, signs[i]))
+        for k in range (k_start, k_end):
+            for i in range (len(cases)):
+                num = int(self.get_numbers (cases[i], k, k + 1, case_signs[i][k - k_start], [num])[0])
+                blocks[cases[i]][k - k_start] = num
+        return blocks
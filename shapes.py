@@ -24,9 +24,11 @@
 # OF SUCH DAMAGE.
 # 
 
-import sys
-sys.path.insert(0, '..\\primes\\')
-import primes
+import numpy as np
+
+# directions in the order of subsequent turns made by next_delta_xy
+directions_x = np.array([1, 0, -1, 0])
+directions_y = np.array([0, 1, 0, -1])
 
 class Shape:
 
@@ -90,3 +92,81 @@ class Shape:
         delta_z = self.next_delta_z (delta_z, is_previous_prime, is_current_prime)
         stats_iterations += 1
         return (delta_x, delta_y, delta_z, sign, is_previous_prime, turn, stats_primes, stats_nonprimes, stats_iterations)
+
+    def get_primality_mask (self, p, nums):
+        # providers answering whole ranges at once
+        if hasattr(p, 'get_primality_mask'):
+            return p.get_primality_mask (nums)
+        return np.array([p.is_prime(int(num)) for num in nums], dtype=bool)
+
+    def next_iterations (self, p, nums, state):
+        return self.next_iterations_mask (self.get_primality_mask (p, nums), state)
+
+    # Walk over the whole block of numbers at once - gives exactly the same
+    # points and state as subsequent calls of next_iteration.
+    #   o is_current_prime - primality mask of the numbers in the block
+    #   o state - (x, y, z, delta_x, delta_y, delta_z, sign, is_previous_prime,
+    #             stats_primes, stats_nonprimes, stats_iterations)
+    # Returns arrays of positions and turns together with the new state.
+    def next_iterations_mask (self, is_current_prime, state):
+        (x, y, z, delta_x, delta_y, delta_z, sign, is_previous_prime, stats_primes, stats_nonprimes, stats_iterations) = state
+        is_current_prime = np.asarray(is_current_prime, dtype=bool)
+        n = len(is_current_prime)
+        if n == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return (empty, empty, empty, np.zeros(0, dtype=bool), state)
+
+        # turn on every change between prime and non-prime
+        is_previous = np.empty(n, dtype=bool)
+        is_previous[0] = is_previous_prime
+        is_previous[1:] = is_current_prime[:-1]
+        turns = is_current_prime != is_previous
+
+        # xy direction is the number of turns made so far mod 4
+        start = -1
+        for i in range (4):
+            if directions_x[i] == delta_x and directions_y[i] == delta_y:
+                start = i
+        if start >= 0:
+            rotations = (start + np.cumsum(turns)) % 4
+            deltas_x = directions_x[rotations]
+            deltas_y = directions_y[rotations]
+        else:
+            # unknown direction is never turned by next_delta_xy
+            deltas_x = np.full(n, delta_x, dtype=np.int64)
+            deltas_y = np.full(n, delta_y, dtype=np.int64)
+        xs = x + np.cumsum(deltas_x)
+        ys = y + np.cumsum(deltas_y)
+
+        # next_delta_z gets the already updated is_previous_prime, which
+        # always equals is_current_prime, so delta_z never changes
+        zs = z + delta_z * np.arange(1, n + 1, dtype=np.int64)
+
+        # next_sign maps any sign to -1 or 1 and then alternates
+        sign = self.next_sign (sign)
+        if n % 2 == 0:
+            sign = self.next_sign (sign)
+
+        primes_in_block = int(np.count_nonzero(is_current_prime))
+        state = (int(xs[-1]), int(ys[-1]), int(zs[-1]), int(deltas_x[-1]), int(deltas_y[-1]), delta_z, sign, bool(is_current_prime[-1]),
+                 stats_primes + primes_in_block, stats_nonprimes + n - primes_in_block, stats_iterations + n)
+        return (xs, ys, zs, turns, state)
+
+    # Walk over periodic numbers becomes periodic once its state (without
+    # position and statistics) repeats at the end of a period of numbers.
+    #   o is_current_prime - primality mask of a single period of numbers
+    #   o state - walk state as in next_iterations_mask
+    # Returns (start, length) - steps before the cycle and steps of the
+    # cycle, or None if the state does not repeat within max_periods periods.
+    def get_walk_cycle (self, is_current_prime, state, max_periods = 64):
+        n = len(is_current_prime)
+        if n == 0:
+            return None
+        seen = {}
+        for i in range (max_periods + 1):
+            key = tuple(state[3:8])
+            if key in seen:
+                return (seen[key] * n, (i - seen[key]) * n)
+            seen[key] = i
+            state = self.next_iterations_mask (is_current_prime, state)[4]
+        return None
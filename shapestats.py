@@ -0,0 +1,206 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+
+import numpy as np
+import pointstore
+
+# Cells are counted by number of visits in buckets: bucket b holds cells
+# visited from 2**(b-1) to 2**b - 1 times
+visit_buckets = 32
+
+class ShapeStats:
+
+    # Statistics of a walk kept up to date with every step, so reading them
+    # at a checkpoint does not depend on the number of points
+    #   o is_counting_visits - visits of every 2D cell (x, y) are counted,
+    #     it takes memory comparable to the index of points
+    def __init__ (self, is_counting_visits = True):
+        self.min_x = 0
+        self.max_x = 0
+        self.min_y = 0
+        self.max_y = 0
+        self.min_z = 0
+        self.max_z = 0
+        self.steps = 0
+        self.turns = 0
+        self.straight_run = 0
+        self.longest_straight_run = 0
+        # (x, y) -> number of visits, cells by number of visits
+        self.cells = {} if is_counting_visits else None
+        self.visits = [0] * visit_buckets
+
+    def add_step (self, x, y, z, turn):
+        if self.steps == 0:
+            (self.min_x, self.max_x, self.min_y, self.max_y, self.min_z, self.max_z) = (x, x, y, y, z, z)
+        else:
+            if x < self.min_x:
+                self.min_x = x
+            elif x > self.max_x:
+                self.max_x = x
+            if y < self.min_y:
+                self.min_y = y
+            elif y > self.max_y:
+                self.max_y = y
+            if z < self.min_z:
+                self.min_z = z
+            elif z > self.max_z:
+                self.max_z = z
+        self.steps += 1
+
+        # straight run - steps without turn, the step with turn starts a new one
+        if turn:
+            self.turns += 1
+            self.straight_run = 1
+        else:
+            self.straight_run += 1
+        if self.straight_run > self.longest_straight_run:
+            self.longest_straight_run = self.straight_run
+
+        if self.cells is not None:
+            visits = self.cells.get((x, y), 0) + 1
+            self.cells[(x, y)] = visits
+            self.add_visits (visits - 1, visits)
+
+    # Steps of a periodic tail of count points (see PointStore.set_period) -
+    # the cycle (x, y, z) with turns, moved by the displacement every time it
+    # is repeated; time does not depend on count when cells do not move
+    def add_period (self, x, y, z, turns, displacement, count):
+        n = len(x)
+        if count <= 0:
+            return
+        period = {'x': np.asarray(x), 'y': np.asarray(y), 'z': np.asarray(z), 'colors': np.zeros(n, dtype=np.uint8), 'displacement': displacement, 'count': count}
+        bounds = pointstore.get_period_bounds (period)
+        if self.steps == 0:
+            (self.min_x, self.max_x, self.min_y, self.max_y, self.min_z, self.max_z) = bounds
+        else:
+            (self.min_x, self.min_y, self.min_z) = (min(self.min_x, bounds[0]), min(self.min_y, bounds[2]), min(self.min_z, bounds[4]))
+            (self.max_x, self.max_y, self.max_z) = (max(self.max_x, bounds[1]), max(self.max_y, bounds[3]), max(self.max_z, bounds[5]))
+        self.steps += count
+
+        # straight runs of the first two cycles are repeated by all later
+        # ones, only the last partial cycle is counted again
+        turns = np.asarray(turns, dtype=bool)
+        (repeats, rest) = divmod(count, n)
+        self.add_turns (np.resize(turns, min(count, 2 * n)))
+        if repeats > 2:
+            self.turns += (repeats - 2) * int(np.count_nonzero(turns))
+            if not turns.any():
+                self.straight_run += (repeats - 2) * n
+                self.longest_straight_run = max(self.longest_straight_run, self.straight_run)
+        if repeats >= 2:
+            self.add_turns (turns[:rest])
+
+        if self.cells is not None:
+            self.add_period_cells (period)
+
+    def add_turns (self, turns):
+        for turn in turns.tolist():
+            if turn:
+                self.turns += 1
+                self.straight_run = 1
+            else:
+                self.straight_run += 1
+            if self.straight_run > self.longest_straight_run:
+                self.longest_straight_run = self.straight_run
+
+    # Visits of cells of the periodic tail - cells of a cycle which does not
+    # move in 2D are visited once by every repeat of the cycle
+    def add_period_cells (self, period):
+        n = len(period['x'])
+        (repeats, rest) = divmod(period['count'], n)
+        if period['displacement'][0] == 0 and period['displacement'][1] == 0:
+            cells = np.stack([period['x'], period['y']], axis=1)
+            visits = np.full(n, repeats, dtype=np.int64)
+            visits[:rest] += 1
+            self.add_cell_visits (cells[visits > 0], visits[visits > 0])
+            return
+        for first in range (0, period['count'], pointstore.period_chunk):
+            (x, y, z, colors) = pointstore.get_period_points (period, first, min(first + pointstore.period_chunk, period['count']))
+            self.add_cell_visits (np.stack([x, y], axis=1), np.ones(len(x), dtype=np.int64))
+
+    # cells (array of (x, y)) visited so many more times
+    def add_cell_visits (self, cells, visits):
+        (cells, inverse) = np.unique(cells, axis=0, return_inverse=True)
+        visits = np.bincount(inverse.ravel(), weights=visits, minlength=len(cells)).astype(np.int64)
+        for ((x, y), added) in zip(cells.tolist(), visits.tolist()):
+            previous = self.cells.get((x, y), 0)
+            self.cells[(x, y)] = previous + added
+            self.add_visits (previous, previous + added)
+
+    # Cell visited previous times is now visited visits times
+    def add_visits (self, previous, visits):
+        bucket = min(visits.bit_length(), visit_buckets - 1)
+        previous_bucket = min(previous.bit_length(), visit_buckets - 1)
+        if bucket != previous_bucket:
+            if previous > 0:
+                self.visits[previous_bucket] -= 1
+            self.visits[bucket] += 1
+
+    def get_bounds (self):
+        return (self.min_x, self.max_x, self.min_y, self.max_y, self.min_z, self.max_z)
+
+    # Number of distinct 2D cells visited by the walk
+    def get_cells (self):
+        if self.cells is None:
+            return 0
+        return len(self.cells)
+
+    # Cells by number of visits: 1, 2-3, 4-7, ..., the last bucket holds all
+    # cells visited more times
+    def get_visit_histogram (self, buckets):
+        return self.visits[1:buckets] + [sum(self.visits[buckets:])]
+
+    # Counters which cannot be counted again from points - saved with checkpoints
+    def get_state (self):
+        return (self.steps, self.turns, self.straight_run, self.longest_straight_run)
+
+    def set_state (self, state):
+        (self.steps, self.turns, self.straight_run, self.longest_straight_run) = state
+
+    # Bounds and visits of cells are counted again from points restored from
+    # a checkpoint - every point is a visit of its cell, so visits should be
+    # counted only when points are never dropped
+    def set_points (self, store):
+        self.visits = [0] * visit_buckets
+        if len(store) == 0:
+            return
+        (self.min_x, self.max_x, self.min_y, self.max_y, self.min_z, self.max_z) = store.get_bounds()
+        if self.cells is None:
+            return
+        self.cells = {}
+        period = None
+        if isinstance(store, pointstore.PointStore):
+            period = store.get_period ()
+            blocks = store.get_blocks (False)
+        else:
+            blocks = store.get_blocks ()
+        for (x, y, z, colors) in blocks:
+            if len(x) > 0:
+                self.add_cell_visits (np.stack([x, y], axis=1), np.ones(len(x), dtype=np.int64))
+        if period is not None:
+            self.add_period_cells (period)
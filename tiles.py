@@ -0,0 +1,143 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+
+import os
+import json
+import shutil
+import numpy as np
+
+class TilePyramid:
+
+    # Quadtree of square tiles of tile_size x tile_size cells covering the
+    # bounding box of points
+    #   o finest level - a cell is a single point
+    #   o every coarser level - a cell covers 2 x 2 cells of the finer one,
+    #     level 0 is a single tile
+    def __init__ (self, tile_size = 256):
+        self.tile_size = tile_size
+
+    # Index of the finest level
+    def get_finest_level (self, bounds):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        extent = max(max_x - min_x + 1, max_y - min_y + 1)
+        level = 0
+        while self.tile_size << level < extent:
+            level += 1
+        return level
+
+    # Number of points and the highest color in every cell of occupied tiles
+    # of the finest level: (tx, ty) -> (counts, max_colors), row of a cell is y
+    def get_finest_tiles (self, blocks, bounds):
+        (min_x, max_x, min_y, max_y, min_z, max_z) = bounds
+        size = self.tile_size
+        tiles = {}
+        for (x, y, z, c) in blocks:
+            if len(x) == 0:
+                continue
+            cell_x = x.astype(np.int64) - min_x
+            cell_y = y.astype(np.int64) - min_y
+            tile_keys = (cell_x // size) << 32 | (cell_y // size)
+            cells = (cell_y % size) * size + cell_x % size
+            order = np.argsort(tile_keys, kind='stable')
+            (keys, starts) = np.unique(tile_keys[order], return_index=True)
+            ends = list(starts[1:]) + [len(order)]
+            for (key, start, end) in zip(keys, starts, ends):
+                tile = (int(key >> 32), int(key & 0xffffffff))
+                if tile not in tiles:
+                    tiles[tile] = (np.zeros(size * size, dtype=np.int64), np.zeros(size * size, dtype=np.int64))
+                (counts, max_colors) = tiles[tile]
+                selected = order[start:end]
+                counts += np.bincount(cells[selected], minlength=size * size)
+                np.maximum.at(max_colors, cells[selected], c[selected].astype(np.int64))
+        for tile in tiles:
+            (counts, max_colors) = tiles[tile]
+            tiles[tile] = (counts.reshape(size, size), max_colors.reshape(size, size))
+        return tiles
+
+    # Tiles of the next coarser level - 2 x 2 cells of a tile are merged into
+    # a single cell of a quarter of its parent tile
+    def get_parent_tiles (self, tiles):
+        size = self.tile_size
+        half = size // 2
+        parents = {}
+        for ((tx, ty), (counts, max_colors)) in tiles.items():
+            parent = (tx // 2, ty // 2)
+            if parent not in parents:
+                parents[parent] = (np.zeros((size, size), dtype=np.int64), np.zeros((size, size), dtype=np.int64))
+            (parent_counts, parent_max_colors) = parents[parent]
+            rows = slice((ty % 2) * half, (ty % 2 + 1) * half)
+            columns = slice((tx % 2) * half, (tx % 2 + 1) * half)
+            parent_counts[rows, columns] = counts.reshape(half, 2, half, 2).sum(axis=(1, 3))
+            parent_max_colors[rows, columns] = max_colors.reshape(half, 2, half, 2).max(axis=(1, 3))
+        return parents
+
+    def get_tile_file_name (self, directory, level, tx, ty):
+        return os.path.join(directory, str(level), str(tx) + "_" + str(ty) + ".png")
+
+    # Writes all levels of the pyramid to the directory, starting from the
+    # finest one, and its description to pyramid.json
+    #   o write_tile(file_name, counts, max_colors, max_count) - draws a
+    #     single tile, max_count is the highest count of the whole level
+    def write (self, directory, title, blocks, bounds, write_tile):
+        # tiles of previous pyramid are replaced at once, new bounds move all tiles
+        new_directory = directory + ".new"
+        if os.path.exists(new_directory):
+            shutil.rmtree(new_directory)
+        finest_level = self.get_finest_level (bounds)
+        tiles = self.get_finest_tiles (blocks, bounds)
+        for level in range (finest_level, -1, -1):
+            os.makedirs(os.path.join(new_directory, str(level)))
+            max_count = max(int(counts.max()) for (counts, max_colors) in tiles.values())
+            for ((tx, ty), (counts, max_colors)) in tiles.items():
+                write_tile (self.get_tile_file_name (new_directory, level, tx, ty), counts, max_colors, max_count)
+            if level > 0:
+                tiles = self.get_parent_tiles (tiles)
+
+        description = {'title': title, 'bounds': list(bounds), 'tile_size': self.tile_size, 'levels': finest_level + 1}
+        with open(os.path.join(new_directory, "pyramid.json"), 'w') as f:
+            json.dump(description, f)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.rename(new_directory, directory)
+
+    # Files of tiles of the level which cover the view (min_x, max_x, min_y,
+    # max_y) of a pyramid written to the directory - empty tiles are skipped
+    def get_tiles_in_view (self, directory, level, view):
+        with open(os.path.join(directory, "pyramid.json"), 'r') as f:
+            description = json.load(f)
+        (min_x, max_x, min_y, max_y, min_z, max_z) = description['bounds']
+        # points covered by a single tile of the level
+        span = description['tile_size'] << (description['levels'] - 1 - level)
+        (view_min_x, view_max_x, view_min_y, view_max_y) = view
+        file_names = []
+        for ty in range (max(view_min_y - min_y, 0) // span, (min(view_max_y, max_y) - min_y) // span + 1):
+            for tx in range (max(view_min_x - min_x, 0) // span, (min(view_max_x, max_x) - min_x) // span + 1):
+                file_name = self.get_tile_file_name (directory, level, tx, ty)
+                if os.path.exists(file_name):
+                    file_names.append(file_name)
+        return file_names
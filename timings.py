@@ -0,0 +1,161 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+import os
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stages of the walk in the order of columns
+stages = ['numbers', 'primality', 'walk', 'points', 'figures', 'stats', 'checkpoint']
+
+class Timings:
+
+    # Cumulative wall time of stages of the walk and of single cases -
+    # a stage is timed between get_time and add:
+    #   start = timings.get_time ()
+    #   ...
+    #   timings.add ('walk', start, tcid)
+    # Time of a case is the sum of time of its stages.
+    #   o iterations - iterations of all cases walked before the run
+    def __init__ (self, cases, iterations = 0):
+        self.cases = cases
+        self.stages = dict((stage, 0.0) for stage in stages)
+        self.case_times = dict((case, 0.0) for case in cases)
+        self.started = time.perf_counter()
+        self.resume (iterations)
+
+    # Walk goes on from iterations restored from a checkpoint or the cache -
+    # they are not counted in the rate of the next checkpoint
+    def resume (self, iterations):
+        self.checkpoint_time = time.perf_counter()
+        self.checkpoint_iterations = iterations
+
+    def get_time (self):
+        return time.perf_counter()
+
+    def add (self, stage, start, tcid = None):
+        seconds = time.perf_counter() - start
+        self.stages[stage] += seconds
+        if tcid is not None:
+            self.case_times["c" + str(tcid + 1)] += seconds
+
+    # Resident set size of the process and its peak in MB, None if unknown
+    def get_memory (self):
+        rss = None
+        peak = None
+        if os.path.exists("/proc/self/statm"):
+            with open("/proc/self/statm") as f:
+                rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+        if resource is not None:
+            # kilobytes on Linux, bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform == "darwin":
+                peak = peak / (1 << 20)
+            else:
+                peak = peak / (1 << 10)
+        return (rss, peak)
+
+    # Iterations per second since the previous checkpoint - the first one
+    # counts from the start (or resume) of the run
+    def get_rate (self, iterations):
+        now = time.perf_counter()
+        walked = iterations - self.checkpoint_iterations
+        rate = walked / (now - self.checkpoint_time) if now > self.checkpoint_time else 0.0
+        self.checkpoint_time = now
+        self.checkpoint_iterations = iterations
+        return rate
+
+    def get_header (self):
+        return (["k", "seconds", "iterations_per_second"] + [stage + "_seconds" for stage in stages] +
+                [case + "_seconds" for case in self.cases] + [case + "_points" for case in self.cases] + ["rss_mb", "peak_rss_mb"])
+
+    # Row of the timings file
+    #   o k - last walked k
+    #   o iterations - iterations of all cases walked so far
+    #   o points - case -> number of points in its store
+    def get_row (self, k, iterations, points):
+        (rss, peak) = self.get_memory ()
+        row = [k, "%.3f" % (time.perf_counter() - self.started), "%.1f" % self.get_rate (iterations)]
+        row += ["%.3f" % self.stages[stage] for stage in stages]
+        row += ["%.3f" % self.case_times[case] for case in self.cases]
+        row += [points[case] for case in self.cases]
+        row += ["" if rss is None else "%.1f" % rss, "" if peak is None else "%.1f" % peak]
+        return row
+
+    def write (self, file_output, k, iterations, points):
+        row = self.get_row (k, iterations, points)
+        self.write_rows (file_output, [row])
+        return row
+
+    def write_rows (self, file_output, rows):
+        is_new = not os.path.exists(file_output)
+        with open(file_output, "a+") as f:
+            if is_new:
+                f.write (",".join(self.get_header ()) + "\n")
+            for row in rows:
+                f.write (",".join(str(value) for value in row) + "\n")
+
+    # Files of workers walking groups of the cases at the same time merged by
+    # k into file_output - seconds are the longest of the workers, the rest
+    # of columns is summed over them; a worker without a row at k (it skipped
+    # the checkpoint) adds its previous row, but no iterations per second
+    def merge (self, file_names, file_output):
+        # sum of the column of rows, None if it is empty in all of them
+        def get_sum (rows, name):
+            values = [float(row[name]) for row in rows if row.get(name, "") != ""]
+            return sum(values) if len(values) > 0 else None
+
+        tables = []
+        for file_name in file_names:
+            if not os.path.exists(file_name):
+                continue
+            with open(file_name) as f:
+                lines = [line.rstrip("\n").split(",") for line in f]
+            table = [dict(zip(lines[0], line)) for line in lines[1:] if line != lines[0]]
+            tables.append(sorted(table, key=lambda row: int(row["k"])))
+        rows = []
+        # rows of every worker up to k
+        ends = [0] * len(tables)
+        for k in sorted(set(int(row["k"]) for table in tables for row in table)):
+            current = []
+            for i in range (len(tables)):
+                while ends[i] < len(tables[i]) and int(tables[i][ends[i]]["k"]) <= k:
+                    ends[i] += 1
+                if ends[i] > 0:
+                    current.append(tables[i][ends[i] - 1])
+            rate = get_sum ([row for row in current if int(row["k"]) == k], "iterations_per_second")
+            (rss, peak) = (get_sum (current, "rss_mb"), get_sum (current, "peak_rss_mb"))
+            row = [k, "%.3f" % max(float(row["seconds"]) for row in current), "%.1f" % (rate or 0.0)]
+            row += ["%.3f" % (get_sum (current, stage + "_seconds") or 0.0) for stage in stages]
+            row += ["%.3f" % (get_sum (current, case + "_seconds") or 0.0) for case in self.cases]
+            row += [int(get_sum (current, case + "_points") or 0) for case in self.cases]
+            row += ["" if rss is None else "%.1f" % rss, "" if peak is None else "%.1f" % peak]
+            rows.append(row)
+        self.write_rows (file_output, rows)
@@ -25,11 +25,35 @@
 # 
 
 import unittest
+import os
+import pickle
+import tempfile
 import sys
 sys.path.insert(0, '..\\primes\\')
 import primes
 import shapes
+import shapestats
 import dataprocessing
+import sequences
+import primality
+import pointstore
+import segments
+import checkpoint
+import resultcache
+import rendering
+import renderworker
+import tiles
+import numpy as np
+import walkscan
+import timings
+import pointstream
+import walks
+import itertools
+import importlib.util
+import contextlib
+import io
+import re
+import subprocess
 
 #############################################################
 # Unit tests
@@ -70,6 +94,57 @@ class TestMethods(unittest.TestCase):
         self.assertFalse(p.is_prime_cuda(10))
         self.assertFalse(p.is_prime_cuda(3379995))
 
+    def test_isprime_sieve(self):
+        p = primality.SegmentedSieve(100, 2)
+        self.assertTrue(p.is_prime(2))
+        self.assertTrue(p.is_prime(3))
+        self.assertTrue(p.is_prime(101))
+        self.assertTrue(p.is_prime(1000003))
+        self.assertFalse(p.is_prime(-7))
+        self.assertFalse(p.is_prime(1))
+        self.assertFalse(p.is_prime(100))
+        self.assertFalse(p.is_prime(3379995))
+
+    def test_primality_mask_sieve(self):
+        p = primes.Primes(False)
+        sieve = primality.SegmentedSieve(1000, 2)
+        nums = list(range(-20, 3000)) + [30*k + 1 for k in range(1000, 1100)] + [10**9 + 7, 5, 4]
+        self.assertEqual(list(sieve.get_primality_mask (nums)), [p.is_prime(num) for num in nums])
+        self.assertEqual(list(sieve.get_window (-3, 12)), [p.is_prime(num) for num in range(-3, 12)])
+
+    def test_miller_rabin_same_as_sieve(self):
+        miller_rabin = primality.MillerRabin()
+        sieve = primality.SegmentedSieve()
+        lo = 10**12
+        window = sieve.get_window (lo, lo + 10000)
+        self.assertEqual([miller_rabin.is_prime(lo + i) for i in range(10000)], list(window))
+        window = sieve.get_window (-3, 3000)
+        self.assertEqual([miller_rabin.is_prime(num) for num in range(-3, 3000)], list(window))
+        self.assertFalse(miller_rabin.is_prime(3825123056546413051))
+        nums = [lo + 7919 * i for i in range(100)] + [lo + 30 * i + 1 for i in range(10000)]
+        self.assertEqual(list(sieve.get_primality_mask (nums)), [miller_rabin.is_prime(num) for num in nums])
+        self.assertEqual([sieve.is_prime(num) for num in nums], [miller_rabin.is_prime(num) for num in nums])
+
+    def test_primality_mask_bitset(self):
+        p = primes.Primes(False)
+        file_name = os.path.join(tempfile.mkdtemp(), "bitset.bin")
+        primality.SegmentedSieve(64, 2).write_bitset (file_name, 1001)
+        bitset = primality.PrimeBitset(file_name)
+        self.assertEqual(bitset.bound, 1001)
+        nums = list(range(-5, 1200))
+        self.assertEqual(list(bitset.get_primality_mask (nums)), [p.is_prime(num) for num in nums])
+        self.assertEqual([bitset.is_prime (num) for num in nums], [p.is_prime(num) for num in nums])
+
+    def test_primality_batch(self):
+        p = primes.Primes(False)
+        batch = primality.PrimalityBatch(p)
+        nums_per_case = {0: [7, 13, 19, 25], 1: [5, 11, 17, 23], 2: [5, 13, 17, 25], 3: []}
+        masks = batch.get_primality_masks (nums_per_case)
+        for case in nums_per_case:
+            self.assertEqual(list(masks[case]), [p.is_prime(num) for num in nums_per_case[case]])
+        sieve_masks = primality.PrimalityBatch(primality.SegmentedSieve()).get_primality_masks (nums_per_case)
+        self.assertEqual(list(sieve_masks[2]), list(masks[2]))
+
     def test_get_ith_prime(self):
         p = primes.Primes(False)
         p.add_to_primes_set(2)
@@ -106,6 +181,679 @@ class TestMethods(unittest.TestCase):
         self.assertEqual(s.next_sign(-5), 1)
         self.assertEqual(s.next_sign(5), 1)
 
+    def test_next_iterations_same_as_next_iteration(self):
+        p = primes.Primes(False)
+        s = shapes.Shape()
+        for (delta_x, delta_y, delta_z, is_previous_prime) in [(1, 0, 1, False), (0, -1, 0, True), (-1, 0, -1, False)]:
+            nums = list(range(1, 300)) + [2, 1, 2, 1, 4, 6, 3]
+            (x, y, z, sign, stats_primes, stats_nonprimes, stats_iterations) = (0, 0, 0, 1, 0, 0, 0)
+            state = (x, y, z, delta_x, delta_y, delta_z, sign, is_previous_prime, stats_primes, stats_nonprimes, stats_iterations)
+            (xs, ys, zs, turns, state) = s.next_iterations (p, nums, state)
+            for i in range (len(nums)):
+                (delta_x, delta_y, delta_z, sign, is_previous_prime, turn, stats_primes, stats_nonprimes, stats_iterations) = s.next_iteration (p, nums[i], is_previous_prime, delta_x, delta_y, delta_z, sign, stats_primes, stats_nonprimes, stats_iterations)
+                x += delta_x
+                y += delta_y
+                z += delta_z
+                self.assertEqual((xs[i], ys[i], zs[i], turns[i]), (x, y, z, turn))
+            self.assertEqual(state, (x, y, z, delta_x, delta_y, delta_z, sign, is_previous_prime, stats_primes, stats_nonprimes, stats_iterations))
+
+    def test_next_iterations_empty_block(self):
+        p = primes.Primes(False)
+        s = shapes.Shape()
+        state = (3, 4, 5, 0, 1, 1, -1, True, 1, 2, 3)
+        (xs, ys, zs, turns, new_state) = s.next_iterations (p, [], state)
+        self.assertEqual(len(xs), 0)
+        self.assertEqual(new_state, state)
+
+    def test_walk_cycle(self):
+        s = shapes.Shape()
+        state = (0, 0, 0, 1, 0, 1, 1, False, 0, 0, 0)
+        is_prime = np.array([True, False, False])
+        (start, length) = s.get_walk_cycle (is_prime, state)
+        self.assertEqual(start % 3, 0)
+        self.assertEqual(length % 3, 0)
+        (xs, ys, zs, turns, end) = s.next_iterations_mask (np.resize(is_prime, start + 2 * length), state)
+        # the second cycle is the first one moved
+        (first, second) = (slice(start, start + length), slice(start + length, start + 2 * length))
+        self.assertEqual(list(turns[first]), list(turns[second]))
+        self.assertEqual(len(set((xs[second] - xs[first]).tolist())), 1)
+        self.assertEqual(len(set((ys[second] - ys[first]).tolist())), 1)
+        self.assertEqual(s.get_walk_cycle (np.zeros(0, dtype=bool), state), None)
+
+    def test_walk_same_as_next_iteration(self):
+        p = primality.SegmentedSieve()
+        for case in ['c1', 'c9', 'c10']:
+            s = shapes.Shape()
+            number_sequences = sequences.Sequences(1)
+            (x, y, z, delta_x, delta_y, delta_z, sign, is_previous_prime, stats_primes, stats_nonprimes, stats_iterations) = walks.initial_state
+            num = 1
+            steps = []
+            for k in range (1, 300):
+                num = int(number_sequences.get_block_step_by_step ([case], k, k + 1, [sign], num)[case][0])
+                (delta_x, delta_y, delta_z, sign, is_previous_prime, turn, stats_primes, stats_nonprimes, stats_iterations) = s.next_iteration (p, num, is_previous_prime, delta_x, delta_y, delta_z, sign, stats_primes, stats_nonprimes, stats_iterations)
+                x += delta_x
+                y += delta_y
+                z += delta_z
+                steps.append((k, num, x, y, z, turn))
+            self.assertEqual(list(walks.Walk(case, 1, 300, p, seed=1, block_size=37)), steps)
+            # walk continued from its position
+            walk = walks.Walk(case, 1, 150, p, seed=1, block_size=64)
+            first = list(walk)
+            (k, state, num) = walk.get_position ()
+            self.assertEqual(first + list(walks.Walk(case, k, 300, p, seed=1, state=state, num=num)), steps)
+        # endless walk
+        blocks = list(itertools.islice(walks.Walk('c1', block_size=100).get_blocks (), 3))
+        self.assertEqual([len(block[0]) for block in blocks], [100, 100, 100])
+        self.assertEqual(int(blocks[2][0][-1]), 300)
+
+    # primes-figure.py walked in a temporary working directory, figures are
+    # not drawn; returns the loaded script after the walk
+    def load_figure_script(self, directory):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "primes-figure.py")
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            spec = importlib.util.spec_from_file_location("primes_figure", script)
+            figure_script = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(figure_script)
+        finally:
+            os.chdir(cwd)
+        return figure_script
+
+    # numbers - if given, (case, k, number) of every number of the step by step walk is appended
+    def run_figure_script(self, directory, max_num, cases, is_cached, use_block_walk = True, numbers = None):
+        figure_script = self.load_figure_script (directory)
+        figure_script.max_num = max_num
+        figure_script.cases_to_check = cases
+        figure_script.checkpoint_value = 1000
+        figure_script.continue_previous_calculations = False
+        figure_script.enable_result_cache = is_cached
+        figure_script.compute_only = True
+        figure_script.use_block_walk = use_block_walk
+        if numbers is not None:
+            get_next_num = figure_script.get_next_num
+            def get_recorded_num (case, k, num, case_sign):
+                num = get_next_num (case, k, num, case_sign)
+                numbers.append((case, k, num))
+                return num
+            figure_script.get_next_num = get_recorded_num
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                figure_script.main ()
+        finally:
+            os.chdir(cwd)
+        return figure_script
+
+    def test_block_walk_continues_odd_k_cache(self):
+        directory = tempfile.mkdtemp()
+        # cache of case 4 ends at an odd k, so its sign at the first block differs
+        self.run_figure_script (directory, 1001, {'c4'}, True)
+        cached = self.run_figure_script (directory, 3000, {'c1', 'c4'}, True)
+        fresh = self.run_figure_script (tempfile.mkdtemp(), 3000, {'c1', 'c4'}, False)
+        self.assertEqual(cached.get_walk_state (3), fresh.get_walk_state (3))
+        self.assertEqual(list(cached.points[3].get_x ()), list(fresh.points[3].get_x ()))
+        self.assertEqual(list(cached.points[3].get_y ()), list(fresh.points[3].get_y ()))
+        self.assertEqual(list(cached.points[3].get_z ()), list(fresh.points[3].get_z ()))
+
+    def test_step_walk_continues_odd_k_cache(self):
+        directory = tempfile.mkdtemp()
+        # numbers of case 4 are given to case 10 also at k case 4 skips
+        self.run_figure_script (directory, 1001, {'c4'}, True, False)
+        (cached_numbers, fresh_numbers) = ([], [])
+        cached = self.run_figure_script (directory, 3000, {'c1', 'c4', 'c10'}, True, False, cached_numbers)
+        fresh = self.run_figure_script (tempfile.mkdtemp(), 3000, {'c1', 'c4', 'c10'}, False, False, fresh_numbers)
+        self.assertEqual(cached_numbers, fresh_numbers)
+        for tcid in [3, 9]:
+            self.assertEqual(cached.get_walk_state (tcid), fresh.get_walk_state (tcid))
+            self.assertEqual(list(cached.points[tcid].get_x ()), list(fresh.points[tcid].get_x ()))
+            self.assertEqual(list(cached.points[tcid].get_y ()), list(fresh.points[tcid].get_y ()))
+            self.assertEqual(list(cached.points[tcid].get_z ()), list(fresh.points[tcid].get_z ()))
+
+    # Copy of primes-figure.py with the given settings run as a script in the directory
+    def run_figure_script_process(self, directory, settings):
+        package = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(package, "primes-figure.py")) as f:
+            script = f.read()
+        for (name, value) in settings.items():
+            script = re.sub("^" + name + " = .*$", name + " = " + value, script, count=1, flags=re.M)
+        file_name = os.path.join(directory, "primes-figure.py")
+        with open(file_name, "w") as f:
+            f.write(script)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([package] + [path for path in [os.environ.get("PYTHONPATH")] if path])
+        subprocess.run([sys.executable, file_name], cwd=directory, env=env, stdout=subprocess.DEVNULL, check=True)
+        return os.path.join(directory, "results", settings['max_num'])
+
+    def test_workers_same_as_single_process(self):
+        # case 10 is walked by the worker of case 5, case 4 by the other one
+        settings = {'max_num': '3000', 'checkpoint_value': '1000', 'cases_to_check': "{'c1', 'c4', 'c5', 'c10'}", 'compute_only': 'True', 'enable_result_cache': 'False'}
+        single = self.run_figure_script_process (tempfile.mkdtemp(), settings)
+        parallel = self.run_figure_script_process (tempfile.mkdtemp(), dict(settings, number_of_workers='2'))
+        self.assertEqual(sorted(os.listdir(parallel)), sorted(os.listdir(single)))
+        with open(os.path.join(single, "objs_stats.csv")) as f, open(os.path.join(parallel, "objs_stats.csv")) as g:
+            self.assertEqual(g.read(), f.read())
+        with open(os.path.join(single, "objs_timings.csv")) as f, open(os.path.join(parallel, "objs_timings.csv")) as g:
+            (single_timings, parallel_timings) = ([line.split(",") for line in f], [line.split(",") for line in g])
+        self.assertEqual([row[0] for row in parallel_timings], [row[0] for row in single_timings])
+        self.assertEqual([row[-6:-2] for row in parallel_timings], [row[-6:-2] for row in single_timings])
+        (restored_single, restored_parallel) = (self.load_figure_script (tempfile.mkdtemp()), self.load_figure_script (tempfile.mkdtemp()))
+        restored_single.restore_previous_results (os.path.join(single, "objs_shape"))
+        restored_parallel.restore_previous_results (os.path.join(parallel, "objs_shape"))
+        self.assertEqual(restored_parallel.k_current, restored_single.k_current)
+        for tcid in [0, 3, 4, 9]:
+            self.assertEqual(restored_parallel.get_walk_state (tcid), restored_single.get_walk_state (tcid))
+            for name in ['x', 'y', 'z', 'colors']:
+                self.assertEqual(list(restored_parallel.points[tcid].get_column (name, 0)), list(restored_single.points[tcid].get_column (name, 0)))
+
+    def test_restored_points_index(self):
+        random = np.random.default_rng(7)
+        steps = list(zip(random.integers(0, 4, 400).tolist(), random.integers(0, 4, 400).tolist(), random.integers(0, 3, 400).tolist(), (random.integers(0, 2, 400) == 1).tolist()))
+        half = len(steps) // 2
+        directory = tempfile.mkdtemp()
+        def load (memory_budget):
+            figure_script = self.load_figure_script (directory)
+            figure_script.cases_to_check = {'c1'}
+            (figure_script.color_turn, figure_script.color_no_turn) = (1, 2)
+            figure_script.points_memory_budget = memory_budget
+            figure_script.points[0] = figure_script.new_point_store (1)
+            return figure_script
+        def walk (figure_script, steps):
+            for (x, y, z, turn) in steps:
+                figure_script.update_points (0, x, y, z, turn, True, False)
+        fresh = load (0)
+        walk (fresh, steps)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            # checkpoint log, pickle and result cache, with and without points moved to files
+            for (restore, memory_budget) in itertools.product(['log', 'pickle', 'cache'], [0, 200]):
+                saved = load (memory_budget)
+                walk (saved, steps[:half])
+                saved.stats_iterations[0] = half
+                saved.k_current = half + 1
+                restored = load (memory_budget)
+                file_name = os.path.join(directory, restore + str(memory_budget))
+                if restore == 'cache':
+                    saved.result_cache = restored.result_cache = resultcache.ResultCache(file_name)
+                    saved.save_cached_results ()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        restored.restore_cached_results ()
+                else:
+                    saved.enable_incremental_checkpoints = restored.enable_incremental_checkpoints = restore == 'log'
+                    saved.save_current_results (file_name)
+                    restored.restore_previous_results (file_name)
+                walk (restored, steps[half:])
+                (store, expected) = (restored.points[0], fresh.points[0])
+                self.assertEqual(store.spilled_size > 0, memory_budget > 0)
+                for name in ['x', 'y', 'z', 'colors']:
+                    self.assertEqual(list(store.get_column (name, 0)), list(expected.get_column (name, 0)))
+                for (x, y, z, turn) in steps + [(9, 9, 9, False)]:
+                    self.assertEqual(store.find (x, y, z), expected.find (x, y, z))
+        finally:
+            os.chdir(cwd)
+
+    def test_walk_scan_same_as_next_iterations(self):
+        p = primality.SegmentedSieve()
+        s = shapes.Shape()
+        w = walkscan.WalkScan(p, 2, 50)
+        for nums in [[k*2 + 1 for k in range(1, 1000)], [k*30 - 1 for k in range(1, 500)], [4], [2, 3]]:
+            for state in [(0, 0, 0, 1, 0, 1, 1, False, 0, 0, 0), (5, -3, 2, 0, -1, -1, -1, True, 3, 4, 7)]:
+                (xs, ys, zs, turns, new_state) = s.next_iterations (p, nums, state)
+                (scan_xs, scan_ys, scan_zs, scan_turns, scan_state) = w.next_iterations (nums, state)
+                self.assertEqual(scan_state, new_state)
+                self.assertEqual(list(scan_xs), list(xs))
+                self.assertEqual(list(scan_ys), list(ys))
+                self.assertEqual(list(scan_zs), list(zs))
+                self.assertEqual(list(scan_turns), list(turns))
+        w.close()
+
+    def test_point_store_append_find(self):
+        store = pointstore.PointStore(True, 2)
+        for i in range (10):
+            self.assertEqual(store.append (i, -i, 2*i, i % 2, 5), i)
+        self.assertEqual(len(store), 10)
+        self.assertEqual(list(store.get_y()), [-i for i in range(10)])
+        self.assertEqual(store.find (3, -3, 6), 3)
+        self.assertEqual(store.find (3, 3, 6), -1)
+
+    def test_point_store_remove(self):
+        store = pointstore.PointStore(True)
+        store.extend ([1, 2, 3, 4], [0, 0, 0, 0], [7, 7, 7, 7], [0, 1, 0, 1], [1, 2, 3, 4])
+        store.remove ([0, 2])
+        self.assertEqual(list(store.get_x()), [2, 4])
+        self.assertEqual(list(store.get_lifetime()), [2, 4])
+        self.assertEqual(store.find (4, 0, 7), 1)
+        self.assertEqual(store.find (1, 0, 7), -1)
+
+    def test_point_store_expire_lifetime(self):
+        store = pointstore.PointStore(True)
+        # reference - remaining lifetime of every point, decremented at every step
+        lifetimes = {}
+        walk = [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0), (1, 0), (2, 0), (2, 1), (1, 1), (0, 0)] * 3
+        for (x, y) in walk:
+            store.expire_lifetime ()
+            lifetimes = {point: lifetime - 1 for (point, lifetime) in lifetimes.items() if lifetime > 1}
+            lifetimes[(x, y, 0)] = 4
+            slot = store.find (x, y, 0)
+            if slot >= 0:
+                store.set_lifetime (slot, 4)
+            else:
+                store.append (x, y, 0, 0, 4)
+            points = sorted(zip(store.get_x().tolist(), store.get_y().tolist(), store.get_z().tolist(), store.get_lifetime().tolist()))
+            self.assertEqual(points, sorted(point + (lifetime,) for (point, lifetime) in lifetimes.items()))
+            for point in lifetimes:
+                self.assertGreaterEqual(store.find (*point), 0)
+        restored = pickle.loads(pickle.dumps(store))
+        self.assertEqual(sorted(restored.get_lifetime().tolist()), sorted(lifetimes.values()))
+        restored.expire_lifetime ()
+        self.assertEqual(len(restored), len([lifetime for lifetime in lifetimes.values() if lifetime > 1]))
+
+    def test_point_store_period(self):
+        store = pointstore.PointStore(True)
+        store.append (0, 0, 0, 0, 0)
+        store.set_period ([1, 1, 0], [0, 1, 1], [1, 2, 3], [1, 0, 1], (0, 0, 3), 7)
+        self.assertEqual(len(store), 8)
+        self.assertEqual(store.get_stored_size (), 1)
+        self.assertEqual(list(store.get_z()), [0, 1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(list(store.get_x()), [0, 1, 1, 0, 1, 1, 0, 1])
+        self.assertEqual(store.get_bounds (), (0, 1, 0, 1, 0, 7))
+        self.assertEqual(sum(len(x) for (x, y, z, c) in store.get_blocks ()), 8)
+        self.assertEqual(list(pickle.loads(pickle.dumps(store)).get_colors()), [0, 1, 0, 1, 1, 0, 1, 1])
+        # the next part of the same cycle makes the tail longer
+        store.set_period ([1, 0, 1], [1, 1, 0], [8, 9, 10], [0, 1, 1], (0, 0, 3), 2)
+        self.assertEqual(store.get_stored_size (), 1)
+        self.assertEqual(list(store.get_z()), list(range(10)))
+        # points are stored before they are changed
+        store.append (5, 5, 10, 0, 0)
+        self.assertEqual(store.get_period (), None)
+        self.assertEqual(store.find (1, 1, 8), 8)
+        self.assertEqual(list(store.get_z()), list(range(11)))
+
+    def test_point_store_pickle(self):
+        store = pointstore.PointStore(True)
+        store.extend ([1, 2, 1], [5, 6, 5], [0, 0, 0], [0, 1, 0], [0, 0, 0])
+        restored = pickle.loads(pickle.dumps(store))
+        self.assertEqual(list(restored.get_x()), [1, 2, 1])
+        self.assertEqual(list(restored.get_colors()), [0, 1, 0])
+        self.assertEqual(restored.find (1, 5, 0), 0)
+
+    def test_point_store_spill(self):
+        store = pointstore.PointStore(True, 4, tempfile.mkdtemp(), 1000)
+        for i in range (20):
+            store.append (i, -i, i % 3, 1, 0)
+        self.assertTrue(len(store.blocks) > 0)
+        self.assertEqual(len(store), 20)
+        for i in range (20):
+            self.assertEqual(store.find (i, -i, i % 3), i)
+        self.assertEqual(store.find (1, -1, 0), -1)
+        self.assertEqual(store.get_bounds (), (0, 19, -19, 0, 0, 2))
+        self.assertEqual(list(store.get_x()), list(range(20)))
+        self.assertEqual(sum(len(x) for (x, y, z, c) in store.get_blocks()), 20)
+        restored = pickle.loads(pickle.dumps(store))
+        self.assertEqual(list(restored.get_y()), [-i for i in range(20)])
+        self.assertEqual(restored.find (7, -7, 1), 7)
+
+    def test_checkpoint_log_appends_new_points(self):
+        file_name = os.path.join(tempfile.mkdtemp(), "objs_shape.log")
+        stores = [pointstore.PointStore(True), pointstore.PointStore(True)]
+        stores[0].extend ([1, 2], [3, 4], [5, 6], [0, 1], [0, 0])
+        log = checkpoint.CheckpointLog(file_name)
+        log.save (10, [(1, 2, 3), (4, 5, 6)], stores)
+        size = os.path.getsize(file_name)
+        stores[1].append (7, 8, 9, 1, 0)
+        log.save (20, [(7, 8, 9), (10, 11, 12)], stores)
+        self.assertTrue(os.path.getsize(file_name) - size < size)
+
+        restored_log = checkpoint.CheckpointLog(file_name)
+        self.assertEqual(restored_log.restore (), (20, [(7, 8, 9), (10, 11, 12)]))
+        restored = [pointstore.PointStore(True), pointstore.PointStore(True)]
+        restored_log.read_points (0, restored[0])
+        restored_log.read_points (1, restored[1])
+        self.assertEqual(list(restored[0].get_x()), [1, 2])
+        self.assertEqual(list(restored[0].get_colors()), [0, 1])
+        self.assertEqual(list(restored[1].get_z()), [9])
+
+    def test_segment_store_expand(self):
+        store = segments.SegmentStore(1)
+        points = [(1, 0, 1, 1), (2, 0, 2, 0), (3, 0, 3, 0), (3, 1, 4, 1), (3, 2, 5, 0), (3, 3, 6, 0), (2, 3, 7, 1)]
+        for (x, y, z, color) in points:
+            store.append (x, y, z, color)
+        self.assertEqual(len(store), 7)
+        self.assertEqual(store.get_segment_count (), 3)
+        self.assertEqual(list(zip(*[list(column) for column in store.expand ()])), points)
+        self.assertEqual(store.get_bounds (), (1, 3, 0, 3, 1, 7))
+        self.assertEqual(list(pickle.loads(pickle.dumps(store)).get_y()), [0, 0, 0, 1, 2, 3, 3])
+        self.assertRaises(ValueError, store.append, 2, 4, 8, 0, 5)
+
+    def test_segment_store_occupancy_grid(self):
+        r = rendering.Rendering()
+        store = segments.SegmentStore()
+        (x, y, dx, dy) = (0, 0, 1, 0)
+        for step in range (2000):
+            turn = step % 7 == 0 or step % 11 == 0
+            if turn:
+                (dx, dy) = (-dy, dx)
+            (x, y) = (x + dx, y + dy)
+            store.append (x, y, step, int(turn))
+        bounds = store.get_bounds ()
+        (xs, ys, zs, colors) = store.expand ()
+        for size in (3, 10, 1000):
+            (width, height) = r.get_grid_shape (bounds, size)
+            (counts, max_colors) = r.get_occupancy_grid (store.get_blocks (), bounds, size)
+            (point_counts, point_max_colors) = r.get_occupancy_grid ([(xs, ys, zs, colors)], bounds, size)
+            self.assertEqual(counts.tolist(), point_counts.tolist())
+            self.assertEqual(max_colors.tolist(), point_max_colors.tolist())
+
+    def test_checkpoint_log_segments(self):
+        file_name = os.path.join(tempfile.mkdtemp(), "objs_shape.log")
+        store = segments.SegmentStore()
+        for x in range (5):
+            store.append (x, 0, x, 0)
+        log = checkpoint.CheckpointLog(file_name)
+        log.save (1, [(0,)], [store])
+        # the last segment grows and new segments are added
+        for y in range (1, 4):
+            store.append (5, y, 5 + y, 1)
+        log.save (2, [(1,)], [store])
+
+        restored_log = checkpoint.CheckpointLog(file_name)
+        self.assertEqual(restored_log.restore (), (2, [(1,)]))
+        restored = segments.SegmentStore()
+        restored_log.read_points (0, restored)
+        self.assertEqual(restored.__getstate__ ()['length'].tolist(), store.__getstate__ ()['length'].tolist())
+        points = pointstore.PointStore(True)
+        restored_log.read_points (0, points)
+        self.assertEqual(list(points.get_y()), [0, 0, 0, 0, 0, 1, 2, 3])
+        self.assertEqual(list(points.get_colors()), [0, 0, 0, 0, 0, 1, 1, 1])
+
+    def test_checkpoint_log_period(self):
+        file_name = os.path.join(tempfile.mkdtemp(), "objs_shape.log")
+        stores = [pointstore.PointStore(True)]
+        stores[0].extend ([0, 1], [0, 0], [0, 1], [0, 1], [0, 0])
+        stores[0].set_period ([1, 0], [1, 1], [2, 3], [1, 1], (0, 0, 2), 5)
+        log = checkpoint.CheckpointLog(file_name)
+        log.save (1, [(0,)], stores)
+        restored_log = checkpoint.CheckpointLog(file_name)
+        restored_log.restore ()
+        restored = pointstore.PointStore(True)
+        restored_log.read_points (0, restored)
+        self.assertEqual(restored.get_stored_size (), 2)
+        self.assertEqual(list(restored.get_z()), list(stores[0].get_z()))
+        # stored tail and new points replace the logged tail
+        stores[0].append (9, 9, 7, 0, 0)
+        log.save (2, [(1,)], stores)
+        restored_log = checkpoint.CheckpointLog(file_name)
+        restored_log.restore ()
+        restored = pointstore.PointStore(True)
+        restored_log.read_points (0, restored)
+        self.assertEqual(restored.get_period (), None)
+        self.assertEqual(list(restored.get_z()), list(range(8)))
+
+    def test_checkpoint_log_unfinished_checkpoint(self):
+        file_name = os.path.join(tempfile.mkdtemp(), "objs_shape.log")
+        stores = [pointstore.PointStore(True)]
+        stores[0].extend ([1, 2, 3], [0, 0, 0], [0, 0, 0], [0, 0, 0], [5, 5, 5])
+        log = checkpoint.CheckpointLog(file_name)
+        log.save (1, [(0,)], stores)
+        stores[0].remove ([0])
+        stores[0].append (4, 0, 0, 0, 5)
+        log.save (2, [(1,)], stores)
+        with open(file_name, 'ab') as f:
+            f.write(b'P\x00\x05')
+
+        restored_log = checkpoint.CheckpointLog(file_name)
+        self.assertEqual(restored_log.restore (), (2, [(1,)]))
+        restored = pointstore.PointStore(True)
+        restored_log.read_points (0, restored)
+        self.assertEqual(list(restored.get_x()), [2, 3, 4])
+
+    def test_result_cache(self):
+        cache = resultcache.ResultCache(tempfile.mkdtemp())
+        store = pointstore.PointStore(True)
+        store.extend ([1, 2], [3, 4], [5, 6], [0, 0], [0, 0])
+        cache.save ("c1;first=1", 10, (1, 2, 3), store)
+        store.append (7, 8, 9, 0, 0)
+        cache.save ("c1;first=1", 20, (4, 5, 6), store)
+        self.assertEqual(cache.find ("c1;first=1", 5), None)
+        self.assertEqual(cache.find ("c1;first=1", 15), 10)
+        self.assertEqual(cache.find ("c1;first=1", 25), 20)
+        self.assertEqual(cache.find ("c2;first=1", 25), None)
+        restored = pointstore.PointStore(True)
+        self.assertEqual(cache.restore ("c1;first=1", 10, restored), (1, 2, 3))
+        self.assertEqual(list(restored.get_x()), [1, 2])
+
+    def test_occupancy_grid(self):
+        r = rendering.Rendering()
+        store = pointstore.PointStore(False)
+        store.extend ([0, 0, 1, 3], [0, 0, 2, 2], [0, 1, 2, 3], [0, 0, 1, 0], [0, 0, 0, 0])
+        (counts, max_colors) = r.get_occupancy_grid (store.get_blocks(), store.get_bounds(), 10)
+        self.assertEqual(counts.shape, (3, 4))
+        self.assertEqual(counts[0][0], 2)
+        self.assertEqual(counts[2][1], 1)
+        self.assertEqual(max_colors[2][1], 1)
+        self.assertEqual(int(counts.sum()), 4)
+        (counts, max_colors) = r.get_occupancy_grid (store.get_blocks(), store.get_bounds(), 2)
+        self.assertEqual(counts.shape, (2, 2))
+        self.assertEqual(int(counts.sum()), 4)
+
+    def test_voxel_level_of_detail(self):
+        r = rendering.Rendering()
+        store = pointstore.PointStore(False)
+        n = 1000
+        store.extend (list(range(n)), [0] * n, list(range(n)), [0] * n, [0] * n)
+        (centres, counts, voxel_size) = r.get_level_of_detail (store.get_blocks(), store.get_bounds(), n, 2 * n)
+        self.assertEqual(voxel_size, (1, 1, 1))
+        self.assertEqual(len(counts), n)
+        (centres, counts, voxel_size) = r.get_level_of_detail (store.get_blocks(), store.get_bounds(), n, 100)
+        self.assertLessEqual(len(counts), 100)
+        self.assertEqual(int(counts.sum()), n)
+        self.assertAlmostEqual(float((centres[:, 0] * counts).sum()), float(sum(range(n))))
+
+    def test_voxel_level_of_detail_of_walk(self):
+        r = rendering.Rendering()
+        store = pointstore.PointStore(False)
+        # z of a walk grows with every step, x and y stay close together
+        n = 100000
+        turns = np.random.default_rng(3).integers(0, 4, n)
+        store.extend (np.cumsum(shapes.directions_x[turns]), np.cumsum(shapes.directions_y[turns]), np.arange(n), np.zeros(n), np.zeros(n))
+        (centres, counts, voxel_size) = r.get_level_of_detail (store.get_blocks(), store.get_bounds(), n, 2000)
+        self.assertLessEqual(len(counts), 2000)
+        self.assertGreater(len(counts), 1500)
+        self.assertEqual(voxel_size[0], voxel_size[2])
+        self.assertEqual(int(counts.sum()), n)
+        self.assertAlmostEqual(float((centres[:, 2] * counts).sum()), float(n * (n - 1) // 2))
+
+    def test_shape_stats(self):
+        stats = shapestats.ShapeStats()
+        store = pointstore.PointStore(True)
+        steps = [(1, 0, 1, False), (1, 1, 2, True), (1, 0, 3, True), (1, 1, 4, True), (2, 1, 5, True), (3, 1, 6, False), (1, 1, 7, True)]
+        for (x, y, z, turn) in steps:
+            stats.add_step (x, y, z, turn)
+            store.append (x, y, z, 0, 0)
+        self.assertEqual(stats.get_bounds (), (1, 3, 0, 1, 1, 7))
+        self.assertEqual(stats.turns, 5)
+        self.assertEqual(stats.longest_straight_run, 2)
+        self.assertEqual(stats.get_cells (), 4)
+        self.assertEqual(stats.get_visit_histogram (3), [2, 2, 0])
+        restored = shapestats.ShapeStats()
+        restored.set_state (stats.get_state ())
+        restored.set_points (store)
+        self.assertEqual(restored.get_bounds (), stats.get_bounds ())
+        self.assertEqual(restored.cells, stats.cells)
+        self.assertEqual(restored.get_visit_histogram (3), [2, 2, 0])
+        self.assertEqual(restored.longest_straight_run, 2)
+
+    def test_shape_stats_period(self):
+        cycle = ([1, 1, 0, 0, 2], [0, 1, 1, 0, 0], [1, 2, 3, 4, 5], [True, False, False, True, False])
+        for (displacement, count) in (((0, 0, 5), 23), ((1, 0, 5), 12), ((0, 0, 5), 3)):
+            stats = shapestats.ShapeStats()
+            stats.add_step (0, 0, 0, False)
+            stats.add_period (cycle[0], cycle[1], cycle[2], cycle[3], displacement, count)
+            expected = shapestats.ShapeStats()
+            expected.add_step (0, 0, 0, False)
+            for t in range (count):
+                (i, shift) = (t % 5, t // 5)
+                expected.add_step (cycle[0][i] + shift * displacement[0], cycle[1][i], cycle[2][i] + shift * displacement[2], cycle[3][i])
+            self.assertEqual(stats.get_bounds (), expected.get_bounds ())
+            self.assertEqual(stats.get_state (), expected.get_state ())
+            self.assertEqual(stats.cells, expected.cells)
+            self.assertEqual(stats.get_visit_histogram (6), expected.get_visit_histogram (6))
+
+    def test_tile_pyramid(self):
+        pyramid = tiles.TilePyramid(4)
+        store = pointstore.PointStore(False)
+        store.extend ([0, 1, 5, 9, 9], [0, 0, 2, 3, 3], [0, 1, 2, 3, 4], [0, 1, 0, 0, 0], [0, 0, 0, 0, 0])
+        bounds = store.get_bounds()
+        self.assertEqual(pyramid.get_finest_level (bounds), 2)
+        finest = pyramid.get_finest_tiles (store.get_blocks(), bounds)
+        self.assertEqual(sorted(finest.keys()), [(0, 0), (1, 0), (2, 0)])
+        self.assertEqual(finest[(2, 0)][0][3][1], 2)
+        parents = pyramid.get_parent_tiles (finest)
+        self.assertEqual(sorted(parents.keys()), [(0, 0), (1, 0)])
+        self.assertEqual(parents[(0, 0)][0][0][0], 2)
+        self.assertEqual(parents[(0, 0)][1][0][0], 1)
+        top = pyramid.get_parent_tiles (parents)
+        self.assertEqual(list(top.keys()), [(0, 0)])
+        self.assertEqual(int(top[(0, 0)][0].sum()), 5)
+
+        directory = os.path.join(tempfile.mkdtemp(), "tiles")
+        written = []
+        pyramid.write (directory, "test", store.get_blocks(), bounds, lambda file_name, counts, max_colors, max_count: written.append(file_name))
+        self.assertEqual(len(written), 6)
+        self.assertTrue(os.path.exists(os.path.join(directory, "pyramid.json")))
+        rendering.Rendering().write_tile_pyramid (1, "test", directory, store.get_blocks(), bounds, 4, 'density', 0, 1)
+        self.assertEqual(pyramid.get_tiles_in_view (directory, 2, (4, 7, 0, 3)), [os.path.join(directory, "2", "1_0.png")])
+        self.assertEqual(len(pyramid.get_tiles_in_view (directory, 2, (-10, 100, -10, 100))), 3)
+
+    def test_point_store_snapshot(self):
+        directory = tempfile.mkdtemp()
+        store = pointstore.PointStore(True, 4, directory, 5 * (pointstore.point_bytes + pointstore.index_entry_bytes))
+        for i in range (8):
+            store.append (i, -i, i, 0, 0)
+        snapshot = store.get_snapshot ()
+        store.append (100, 100, 100, 0, 0)
+        self.assertEqual(len(snapshot), 8)
+        self.assertEqual(list(snapshot.get_x()), list(range(8)))
+        self.assertEqual(snapshot.get_bounds(), (0, 7, -7, 0, 0, 7))
+
+    def test_render_worker(self):
+        directory = tempfile.mkdtemp()
+        store = pointstore.PointStore(False)
+        store.extend ([0, 1, 2], [0, 1, 0], [0, 1, 2], [0, 0, 0], [0, 0, 0])
+        file_output = os.path.join(directory, "f_shape.png")
+        worker = renderworker.RenderWorker()
+        worker.submit ([('write_scatter_figure', 1, "test", file_output, store, (0, 0))])
+        worker.close ()
+        self.assertTrue(os.path.exists(file_output))
+
+    def test_point_stream(self):
+        directory = tempfile.mkdtemp()
+        def check_read (stream, store, figures):
+            read_figures = stream.read ()
+            self.assertEqual([figure[:4] + figure[5:] for figure in read_figures], figures)
+            points = read_figures[0][4]
+            self.assertIs(read_figures[-1][4], points)
+            self.assertEqual(len(points), len(store))
+            self.assertEqual(points.get_bounds (), store.get_bounds ())
+            self.assertEqual([[list(column) for column in block] for block in points.get_blocks ()],
+                             [[list(column) for column in block] for block in store.get_blocks ()])
+
+        store = pointstore.PointStore(True, 2, os.path.join(directory, "points"), 40)
+        store.extend ([0, 1, 2], [0, 1, 0], [0, 1, 2], [0, 1, 0], [0, 0, 0])
+        store.set_period ([1, 0], [1, 1], [3, 4], [1, 0], (0, 2, 2), 5)
+        figures = [('write_scatter_figure', 1, "title", os.path.join(directory, "f_shape_1.png"), (0, 1)),
+                   ('write_raster_figure', 1, "title", os.path.join(directory, "f_shape_1"), (1000, 'density', 0, 1))]
+        file_stream = os.path.join(directory, "f_shape_1.pts")
+        stream = pointstream.PointStream(file_stream)
+        stream.write (figures, store)
+        check_read (pointstream.PointStream(file_stream), store, figures)
+        # next checkpoints append only new points, spilled blocks are read as they are
+        for i in range (10):
+            (size, points) = (os.path.getsize(file_stream), store.get_stored_size ())
+            store.extend ([i] * 3, [i + 1] * 3, [10 * i, 10 * i + 1, 10 * i + 2], [1, 1, 0], [0] * 3)
+            stream.write (figures, store)
+            # new points and the description of figures
+            self.assertLess(os.path.getsize(file_stream) - size, (store.get_stored_size () - points) * pointstream.point_bytes + 300)
+            check_read (pointstream.PointStream(file_stream), store, figures)
+        self.assertGreater(len(store.blocks), 1)
+        # another store (e.g. restored from a checkpoint) is written again
+        store = store.get_snapshot ()
+        stream.write (figures, store)
+        check_read (pointstream.PointStream(file_stream), store, figures)
+        # unfinished checkpoint is ignored
+        with open(file_stream, 'ab') as f:
+            f.write(pointstream.record_header.pack(b'P', 1000))
+        check_read (pointstream.PointStream(file_stream), store, figures)
+
+        # so are removed points
+        resident_store = pointstore.PointStore()
+        resident_store.extend ([0, 1, 2, 3], [0, 0, 0, 0], [0, 1, 2, 3], [0, 1, 0, 1], [0, 0, 0, 0])
+        resident_stream = pointstream.PointStream(os.path.join(directory, "f_shape_3.pts"))
+        resident_stream.write (figures, resident_store)
+        resident_store.remove ([1])
+        resident_stream.write (figures, resident_store)
+        check_read (pointstream.PointStream(resident_stream.file_name), resident_store, figures)
+
+        # figures of every checkpoint are drawn with points of their checkpoint,
+        # also after the stream is continued by another process
+        kept_store = pointstore.PointStore()
+        kept_figures = []
+        for i in range (3):
+            kept_store.append (i, 0, i, 0, 0)
+            kept_figures.append(('write_scatter_figure', 4, "title", os.path.join(directory, "f_shape_4_" + str(i) + ".png"), (0, 1)))
+            pointstream.PointStream(os.path.join(directory, "f_shape_4.pts"), True).write (kept_figures[-1:], kept_store)
+        read_figures = pointstream.PointStream(os.path.join(directory, "f_shape_4.pts")).read ()
+        self.assertEqual([figure[:4] + figure[5:] for figure in read_figures], kept_figures)
+        self.assertEqual([[list(block[0]) for block in figure[4].get_blocks ()] for figure in read_figures], [[[0]], [[0, 1]], [[0, 1, 2]]])
+
+        segment_store = segments.SegmentStore()
+        segment_stream = pointstream.PointStream(os.path.join(directory, "f_shape_2.pts"))
+        for (x, y, z, color) in [(0, 0, 0, 1), (1, 0, 1, 0), (2, 0, 2, 0), (2, 1, 3, 1), (2, 2, 4, 1), (2, 3, 5, 1), (5, 5, 6, 0)]:
+            segment_store.append (x, y, z, color)
+            segment_stream.write (figures, segment_store)
+            check_read (pointstream.PointStream(segment_stream.file_name), segment_store, figures)
+
+    def test_timings(self):
+        file_output = os.path.join(tempfile.mkdtemp(), "objs_timings.csv")
+        t = timings.Timings(['c1', 'c3'])
+        start = t.get_time ()
+        t.add ('walk', start, 2)
+        t.add ('numbers', start)
+        t.write (file_output, 1000, 2000, {'c1': 10, 'c3': 20})
+        t.write (file_output, 2000, 4000, {'c1': 30, 'c3': 40})
+        with open(file_output) as f:
+            rows = [line.rstrip("\n").split(",") for line in f]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], t.get_header ())
+        self.assertEqual([len(row) for row in rows], [len(rows[0])] * 3)
+        self.assertEqual(rows[2][0], "2000")
+        self.assertEqual(rows[2][rows[0].index("c3_points")], "40")
+        self.assertEqual(float(rows[2][rows[0].index("c1_seconds")]), 0.0)
+        self.assertGreaterEqual(t.case_times['c3'], 0.0)
+        self.assertEqual(t.case_times['c3'], t.stages['walk'])
+        # the first rate counts iterations walked since the start or resume
+        self.assertGreater(float(rows[1][2]), 0.0)
+        t.resume (5000)
+        self.assertEqual(t.get_rate (5000), 0.0)
+
+    def test_sequences_block_same_as_step_by_step(self):
+        seq = sequences.Sequences(5)
+        cases = ['c10', 'c4', 'c9', 'c11', 'c12']
+        blocks = seq.get_block (cases, 95, 130, [1, -1, 1, 1, 1], 2)
+        self.assertEqual(list(blocks['c4'][:3]), [95*6 + 1, 96*6 - 1, 97*6 + 1])
+        self.assertEqual(list(blocks['c9'][:6]), [14, 15, 16, 17, 18, 1])
+        self.assertEqual(list(blocks['c11'][:2]), [int(10*np.sin(95)), int(10*np.sin(96))])
+        self.assertEqual(blocks['c10'][0], 1)
+        self.assertEqual(list(blocks['c10'][1:]), [1 if num == 2 else 2 for num in blocks['c12'][:-1]])
+        step_by_step = seq.get_block_step_by_step (cases, 95, 130, [1, -1, 1, 1, 1], 2)
+        for case in cases:
+            self.assertEqual(list(blocks[case]), list(step_by_step[case]))
+        # random numbers of k do not depend on blocks
+        self.assertEqual(list(sequences.Sequences(5).get_numbers ('c12', 100, 110, 1)), list(blocks['c12'][5:15]))
+        self.assertEqual(list(seq.get_block (['c10'], 0, 4, [1], 2)['c10']), [1, 2, 1, 2])
+
     def test_get_sum_of_decimal_digits(self):
         dp = dataprocessing.DataProcessing()
         self.assertEqual(dp.get_sum_of_decimal_digits (1), 1)
@@ -118,4 +866,5 @@ class TestMethods(unittest.TestCase):
 # Main - run unit tests
 #############################################################
 
-unittest.main()
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+import numpy as np
+import shapes
+import sequences
+import primality
+
+# Walk state before the first step (x, y, z, delta_x, delta_y, delta_z, sign,
+# is_previous_prime, stats_primes, stats_nonprimes, stats_iterations) - the
+# same as in primes-figure.py
+initial_state = (0, 0, 0, 1, 0, 1, 1, False, 0, 0, 0)
+
+class Walk:
+
+    # Walk of a single case made block by block - only the walk state is
+    # kept, steps are handed over as they are made, so the walk can feed
+    # statistics or files without keeping its points
+    #   o case - number source of the walk (c1...c12, see sequences.Sequences)
+    #   o k_start, k_end - k from k_start to k_end (excluding); None - the
+    #     walk never ends
+    #   o p - primality provider, by default primality.SegmentedSieve
+    #   o number_sequences - number sources, by default
+    #     sequences.Sequences(seed)
+    #   o state, num - walk state and the number used just before k_start,
+    #     to continue an earlier walk (see get_position)
+    # Steps are the same as steps of the case in primes-figure.py walking
+    # only this case from min_num = k_start.
+    def __init__ (self, case, k_start = 1, k_end = None, p = None, number_sequences = None, seed = None, block_size = 10000, state = initial_state, num = 1):
+        self.case = case
+        self.k = k_start
+        self.k_end = k_end
+        if p is None:
+            p = primality.SegmentedSieve()
+        self.p = p
+        if number_sequences is None:
+            number_sequences = sequences.Sequences(seed)
+        self.number_sequences = number_sequences
+        self.block_size = block_size
+        self.state = state
+        self.num = num
+        self.s = shapes.Shape()
+
+    # (k, state, num) to continue the walk after the last block handed over
+    def get_position (self):
+        return (self.k, self.state, self.num)
+
+    # Blocks of at most block_size steps as NumPy arrays
+    # (ks, nums, xs, ys, zs, turns)
+    def get_blocks (self):
+        while self.k_end is None or self.k < self.k_end:
+            k_end = self.k + self.block_size
+            if self.k_end is not None:
+                k_end = min(k_end, self.k_end)
+            nums = self.number_sequences.get_block ([self.case], self.k, k_end, [self.state[6]], self.num)[self.case]
+            (xs, ys, zs, turns, self.state) = self.s.next_iterations (self.p, nums, self.state)
+            ks = np.arange(self.k, k_end, dtype=np.int64)
+            self.k = k_end
+            self.num = int(nums[-1])
+            yield (ks, nums, xs, ys, zs, turns)
+
+    # Single steps (k, num, x, y, z, turn)
+    def get_steps (self):
+        for (ks, nums, xs, ys, zs, turns) in self.get_blocks ():
+            for i in range (len(ks)):
+                yield (int(ks[i]), int(nums[i]), int(xs[i]), int(ys[i]), int(zs[i]), bool(turns[i]))
+
+    def __iter__ (self):
+        return self.get_steps ()
@@ -0,0 +1,115 @@
+#
+# Copyright (c) 2019, Marcin Barylski
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+#    this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation 
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED 
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. 
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, 
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, 
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, 
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY 
+# OF SUCH DAMAGE.
+# 
+
+
+import multiprocessing
+import numpy as np
+import shapes
+
+# Primality provider of a worker process - set once when the pool starts
+provider = None
+
+def set_provider (p):
+    global provider
+    provider = p
+
+# Walk over a chunk of numbers in its own frame: starting at (0, 0) in
+# direction (1, 0), without a turn at the first number of the chunk
+def get_chunk_walk (nums):
+    s = shapes.Shape()
+    is_prime = s.get_primality_mask (provider, nums)
+    state = (0, 0, 0, 1, 0, 0, 1, bool(is_prime[0]), 0, 0, 0)
+    (xs, ys, zs, turns, state) = s.next_iterations_mask (is_prime, state)
+    return (bool(is_prime[0]), bool(is_prime[-1]), xs, ys, turns, int(np.count_nonzero(turns)), state[8])
+
+def rotate (xs, ys, rotations):
+    if rotations == 1:
+        return (-ys, xs)
+    if rotations == 2:
+        return (-xs, -ys)
+    if rotations == 3:
+        return (ys, -xs)
+    return (xs, ys)
+
+class WalkScan:
+
+    def __init__ (self, p, processes, chunk_size = 100000):
+        self.p = p
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.pool = multiprocessing.Pool(processes, initializer=set_provider, initargs=(p,))
+
+    def close (self):
+        self.pool.close()
+        self.pool.join()
+
+    # Same result as Shape.next_iterations, but chunks of numbers are walked
+    # independently by worker processes and stitched together afterwards:
+    # every chunk is a rotation and a displacement applied to the state left
+    # by the previous chunks (prefix scan)
+    def next_iterations (self, nums, state):
+        (x, y, z, delta_x, delta_y, delta_z, sign, is_previous_prime, stats_primes, stats_nonprimes, stats_iterations) = state
+        s = shapes.Shape()
+        rotations = -1
+        for i in range (4):
+            if shapes.directions_x[i] == delta_x and shapes.directions_y[i] == delta_y:
+                rotations = i
+        if len(nums) == 0 or rotations < 0:
+            return s.next_iterations (self.p, nums, state)
+
+        nums = np.asarray(nums, dtype=np.int64)
+        chunks = max(self.processes, (len(nums) + self.chunk_size - 1) // self.chunk_size)
+        chunks = np.array_split(nums, min(chunks, len(nums)))
+        walks = self.pool.map(get_chunk_walk, chunks)
+
+        all_xs = []
+        all_ys = []
+        all_turns = []
+        for (is_first_prime, is_last_prime, xs, ys, turns, chunk_turns, chunk_primes) in walks:
+            is_first_turn = is_first_prime != is_previous_prime
+            if is_first_turn:
+                rotations = (rotations + 1) % 4
+            (xs, ys) = rotate (xs, ys, rotations)
+            all_xs.append(xs + x)
+            all_ys.append(ys + y)
+            turns[0] = is_first_turn
+            all_turns.append(turns)
+
+            x = int(all_xs[-1][-1])
+            y = int(all_ys[-1][-1])
+            rotations = (rotations + chunk_turns) % 4
+            is_previous_prime = is_last_prime
+            stats_primes += chunk_primes
+            stats_nonprimes += len(turns) - chunk_primes
+
+        n = len(nums)
+        zs = z + delta_z * np.arange(1, n + 1, dtype=np.int64)
+        sign = s.next_sign (sign)
+        if n % 2 == 0:
+            sign = s.next_sign (sign)
+        state = (x, y, int(zs[-1]), int(shapes.directions_x[rotations]), int(shapes.directions_y[rotations]), delta_z, sign, is_previous_prime,
+                 stats_primes, stats_nonprimes, stats_iterations + n)
+        return (np.concatenate(all_xs), np.concatenate(all_ys), zs, np.concatenate(all_turns), state)